@@ -0,0 +1,1209 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    benchmark.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# benchmark.py – Offline load benchmark for the whole API, with no OpenAI calls.
+#
+# Swaps every chat model and embeddings model handed out by llmProvider for deterministic fakes
+# with configurable latency and output length, then drives the FastAPI app in-process with many
+# concurrent simulated users, each walking through a full learning flow:
+# - casual / kids    -> intro, chat turns, quiz start, quiz submit, continue
+# - free / pro       -> chat turns
+# - pdf              -> upload (waiting for the index), questions
+#
+# It reports throughput, p50/p95/p99 latency per endpoint and per flow, memory growth, and the
+# number of upstream chat/embedding calls (and tokens) per flow, prints a summary and saves the
+# full results as JSON so runs can be compared over time (see --compare).
+#
+# The fakes go through the same callbacks, rate limiter and embedding wrapper as the real
+# models, so everything except the network round-trip to OpenAI is measured. Rate limits are
+# disabled by default (0) so they don't dominate the numbers; set the usual environment
+# variables to benchmark with them.
+#
+# With --index-sizes it benchmarks PDF vector indexes instead: for each chunk count it builds a
+# flat (in-memory), fp16 and pq index from synthetic clustered embeddings (see compactIndex.py),
+# then loads each one in a fresh process and reports resident memory (private and memory-mapped),
+# search latency and recall@4 against exact search.
+#
+# With --parse-pages it benchmarks PDF page parsing instead: for each page count it generates a
+# text PDF locally with PyMuPDF, then parses and splits it the way an upload is indexed, on the
+# calling thread and with each --parse-workers process pool size (see pageParser.py), reporting
+# the time to the first chunk, the total time and whether the pages match the serial parse.
+#
+# With --scenario it runs one micro-benchmark in-process with the fakes installed, each isolating
+# a single optimization:
+# - concurrency  -> --users concurrent /intro calls vs the same calls one at a time
+# - memory       -> LLM calls and latency per chat turn, per-turn summary memory vs incremental
+# - embed        -> Time to embed --embed-chunks chunks at each --embed-concurrency level
+# - submit       -> /quiz/submit time vs its grade and feedback calls' fixed delays
+# - condense     -> LLM calls and latency per PDF follow-up, always condensing vs only when needed
+#
+# Usage:
+#   python benchmark.py --users 40 --turns 3
+#   python benchmark.py --flows casual,pdf --llm-latency 0.5 --compare benchmark_results/<run>.json
+#   python benchmark.py --index-sizes 1000,10000,100000
+#   python benchmark.py --parse-pages 200,500,1000 --parse-workers 2,4
+#   python benchmark.py --scenario concurrency --users 16 --llm-latency 0.5
+#   python benchmark.py --scenario memory --turns 30
+#   python benchmark.py --scenario embed --embed-latency 0.2 --embed-concurrency 1,2,4,8
+#   python benchmark.py --scenario submit --grade-latency 0.5 --feedback-latency 1.0
+#   python benchmark.py --scenario condense --turns 12
+#
+# Exports:
+# - FakeChatModel        -> Deterministic chat model with simulated latency
+# - FakeEmbeddings       -> Deterministic hash-seeded embeddings with simulated latency
+# - run_benchmark        -> Runs a benchmark and returns its results dict
+# - compare_results      -> Prints per-endpoint/flow deltas between two results dicts
+# - run_index_benchmark  -> Benchmarks flat vs compact PDF indexes at several sizes
+# - run_parse_benchmark  -> Benchmarks serial vs process-pool PDF page parsing
+# - run_scenario         -> Runs one --scenario micro-benchmark
+################################################################################################
+
+
+
+import os
+import gc
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import platform
+import threading
+import subprocess
+import contextvars
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+# Flows that can be selected with --flows
+FLOWS = ("casual", "kids", "free", "pro", "pdf")
+
+# Subjects rotated across simulated users (repeats exercise the intro cache)
+SUBJECTS = ("Astronomy", "Biology", "History", "Chemistry", "Geography", "Music")
+
+# Words the fake model and the generated PDFs are made of
+VOCABULARY = (
+    "the cell energy planet orbit reaction history empire river music rhythm atom molecule "
+    "light gravity ocean forest fossil theory experiment evidence pattern student question "
+    "answer example because therefore however notice remember important simple"
+).split()
+
+# Index kinds compared by --index-sizes
+INDEX_KINDS = ("flat", "fp16", "pq")
+
+# Chunks generated per step when building benchmark indexes, and searches timed per index
+INDEX_BLOCK = 5000
+INDEX_QUERIES = 200
+
+# Timed runs per PDF and pool size in --parse-pages after a first, cold run (the median is reported)
+PARSE_RUNS = 3
+
+# Flow the current simulated user is running (attributes upstream calls to flows)
+_flow = contextvars.ContextVar("benchmark_flow", default="background")
+
+
+
+#####################################################################
+# Thread-safe tally of upstream calls and tokens per flow.
+#####################################################################
+class UpstreamCounter:
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, tokens: int = 0):
+        flow = _flow.get()
+        with self._lock:
+            counts = self._counts.setdefault(flow, {})
+            counts[f"{kind}_calls"] = counts.get(f"{kind}_calls", 0) + 1
+            counts[f"{kind}_tokens"] = counts.get(f"{kind}_tokens", 0) + tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {flow: dict(counts) for flow, counts in self._counts.items()}
+
+
+upstream = UpstreamCounter()
+
+
+
+#####################################################################
+# Deterministic text for a prompt: the same prompt always gets the
+# same reply, so runs are comparable.
+#####################################################################
+def _rng_for(text: str) -> random.Random:
+    return random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+
+
+def _fake_quiz(rng: random.Random) -> str:
+    questions = []
+    for number in range(1, 6):
+        choices = {letter: " ".join(rng.choices(VOCABULARY, k=3)) for letter in "ABCD"}
+        questions.append({
+            "question": f"Question {number}: " + " ".join(rng.choices(VOCABULARY, k=8)) + "?",
+            "choices": choices,
+            "answer": rng.choice("ABCD"),
+        })
+    return json.dumps({"questions": questions})
+
+
+
+#####################################################################
+# Chat model that sleeps like a real completion (time to first token
+# plus a per-token delay) and returns deterministic text. In JSON mode
+# it returns a valid 5-question quiz. Streaming models report every
+# token to run_manager, like ChatOpenAI.
+#####################################################################
+class FakeChatModel(BaseChatModel):
+
+    latency: float = 0.3
+    token_latency: float = 0.0
+    output_tokens: int = 60
+    json_mode: bool = False
+    streaming: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark-fake-chat"
+
+    def _reply(self, messages) -> List[str]:
+        prompt = "\n".join(str(m.content) for m in messages)
+        rng = _rng_for(prompt)
+        upstream.add("chat", len(prompt) // 4)
+        if self.json_mode:
+            return [_fake_quiz(rng)]
+        return [rng.choice(VOCABULARY) + " " for _ in range(self.output_tokens)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._reply(messages)
+        time.sleep(self.latency)
+        if self.streaming:
+            for token in tokens:
+                if self.token_latency:
+                    time.sleep(self.token_latency)
+                if run_manager:
+                    run_manager.on_llm_new_token(token)
+        else:
+            time.sleep(self.token_latency * len(tokens))
+        text = "".join(tokens)
+        usage = {"prompt_tokens": sum(len(str(m.content)) for m in messages) // 4, "completion_tokens": len(tokens)}
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output=None if self.streaming else {"token_usage": usage},
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for token in self._reply(messages):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+
+#####################################################################
+# Embeddings seeded by a hash of each text (identical texts get
+# identical unit vectors), with a fixed delay per request.
+#####################################################################
+class FakeEmbeddings(Embeddings):
+
+    def __init__(self, dimensions: int = 1536, latency: float = 0.05):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.model = "benchmark-fake-embeddings"
+
+    def _vector(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        upstream.add("embedding", sum(len(text) for text in texts) // 4)
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+
+
+#####################################################################
+# Points llmProvider at the fakes. Must run before the learning-mode
+# modules are imported, since they create their models at import.
+#####################################################################
+def install_fakes(args):
+    import llmProvider
+    import rateLimiter
+
+    def get_chat_model(mode: str, **kwargs):
+        response_format = (kwargs.get("model_kwargs") or {}).get("response_format") or {}
+        return FakeChatModel(
+            latency=args.llm_latency,
+            token_latency=args.token_latency,
+            output_tokens=args.output_tokens,
+            json_mode=response_format.get("type") == "json_object",
+            streaming=kwargs.get("streaming", False),
+            callbacks=[rateLimiter.RateLimitCallback(rateLimiter.chat_limiter)],
+        )
+
+    def get_embeddings_model(**kwargs):
+        embeddings = FakeEmbeddings(args.embed_dimensions, args.embed_latency)
+        return llmProvider.RateLimitedEmbeddings(embeddings, rateLimiter.embedding_limiter)
+
+    llmProvider.get_chat_model = get_chat_model
+    llmProvider.get_embeddings_model = get_embeddings_model
+
+
+
+#####################################################################
+# Builds a deterministic text PDF of the given number of pages.
+#####################################################################
+def make_pdf(pages: int, seed: int) -> bytes:
+    import pymupdf
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for number in range(pages):
+        page = doc.new_page()
+        lines = [f"Section {seed}.{number}: " + " ".join(rng.choices(VOCABULARY, k=12)) for _ in range(45)]
+        page.insert_text((40, 40), "\n".join(lines), fontsize=7)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+
+# ------------------ measurement helpers ------------------
+
+# Current resident set size in MB (peak RSS where /proc is unavailable)
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+# Nearest-rank percentile of an unsorted list
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies: list, errors: int = 0) -> dict:
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+
+#####################################################################
+# Records request latencies per endpoint as the simulated users run.
+#####################################################################
+class Recorder:
+
+    def __init__(self):
+        self.requests = {}   # "METHOD /path" -> [latency, ...]
+        self.errors = {}     # "METHOD /path" -> error count
+        self.flows = {}      # flow -> [duration, ...]
+        self.failed_flows = {}
+
+    async def call(self, client, method: str, path: str, **kwargs):
+        endpoint = f"{method} {path.split('?')[0]}"
+        start = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        self.requests.setdefault(endpoint, []).append(time.perf_counter() - start)
+        failed = response.status_code != 200
+        if not failed and response.headers.get("content-type", "").startswith("application/json"):
+            body = response.json()
+            failed = isinstance(body, dict) and "error" in body
+        if failed:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            raise RuntimeError(f"{endpoint} failed: {response.status_code} {response.text[:200]}")
+        return response
+
+
+
+# ------------------ simulated user flows ------------------
+
+async def _tutor_flow(client, recorder, user: str, args, rng, kids: bool):
+    headers = {"x-user-id": user}
+    subject = rng.choice(SUBJECTS)
+    prefix = "/kids_" if kids else "/"
+    chat = "/kids_chat" if kids else "/chat"
+    stream = "&stream=true" if args.stream else ""
+
+    await recorder.call(client, "GET", f"{prefix}intro?subject={subject}", headers=headers)
+    for turn in range(args.turns):
+        message = f"Can you explain more about {rng.choice(VOCABULARY)} in {subject}? (turn {turn})"
+        await recorder.call(client, "POST", f"{chat}?subject={subject}{stream}", headers=headers, json={"message": message})
+    await recorder.call(client, "GET", f"{prefix}quiz/start?subject={subject}", headers=headers)
+    answers = [rng.choice("ABCD") for _ in range(5)]
+    await recorder.call(client, "POST", f"{prefix}quiz/submit?subject={subject}{stream}", headers=headers, json={"answers": answers})
+    await recorder.call(client, "GET", f"{prefix}continue?subject={subject}", headers=headers)
+
+
+async def _chat_flow(client, recorder, user: str, args, rng, path: str):
+    headers = {"x-user-id": user}
+    stream = "?stream=true" if args.stream else ""
+    for turn in range(args.turns):
+        message = f"Tell me about {rng.choice(VOCABULARY)} and {rng.choice(VOCABULARY)} (turn {turn})"
+        await recorder.call(client, "POST", f"{path}{stream}", headers=headers, json={"message": message})
+
+
+async def _pdf_flow(client, recorder, user: str, args, rng, pdfs: list):
+    headers = {"x-user-id": user}
+    stream = "?stream=true" if args.stream else ""
+    pdf = rng.choice(pdfs)
+    await recorder.call(
+        client, "POST", "/pdf/upload?wait=true", headers=headers,
+        files={"file": ("benchmark.pdf", pdf, "application/pdf")}
+    )
+    for turn in range(args.turns):
+        question = f"What does the document say about {rng.choice(VOCABULARY)}? (turn {turn})"
+        await recorder.call(client, "POST", f"/pdf/ask{stream}", headers=headers, json={"message": question})
+
+
+async def _run_user(client, recorder, index: int, flow: str, args, pdfs: list):
+    _flow.set(flow)
+    rng = random.Random(args.seed * 100003 + index)
+    for repeat in range(args.repeat):
+        user = f"bench-{flow}-{index}-{repeat}"
+        start = time.perf_counter()
+        try:
+            if flow in ("casual", "kids"):
+                await _tutor_flow(client, recorder, user, args, rng, kids=flow == "kids")
+            elif flow == "free":
+                await _chat_flow(client, recorder, user, args, rng, "/free_chat")
+            elif flow == "pro":
+                await _chat_flow(client, recorder, user, args, rng, "/professional_chat")
+            else:
+                await _pdf_flow(client, recorder, user, args, rng, pdfs)
+        except RuntimeError:
+            recorder.failed_flows[flow] = recorder.failed_flows.get(flow, 0) + 1
+            continue
+        recorder.flows.setdefault(flow, []).append(time.perf_counter() - start)
+        if args.think:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think))
+
+
+
+#####################################################################
+# Runs one benchmark with the given arguments and returns the results
+# (also what gets saved as JSON).
+#####################################################################
+async def run_benchmark(args) -> dict:
+    import httpx
+    import main
+
+    flows = [flow.strip() for flow in args.flows.split(",") if flow.strip()]
+    pdfs = [make_pdf(args.pdf_pages, seed) for seed in range(args.pdf_count)] if "pdf" in flows else []
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        # Warm up imports, lazily created pools and tokenizers before measuring
+        await client.get("/health")
+        gc.collect()
+        rss_start = rss_mb()
+        upstream_before = upstream.snapshot()
+
+        recorder = Recorder()
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _run_user(client, recorder, index, flows[index % len(flows)], args, pdfs)
+            for index in range(args.users)
+        ))
+        duration = time.perf_counter() - start
+
+        # Let background work started by the flows (intro refills, summaries) finish
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if pending:
+            await asyncio.wait(pending, timeout=30)
+        gc.collect()
+        rss_end = rss_mb()
+
+    calls = upstream.snapshot()
+    for flow, counts in upstream_before.items():
+        for key, value in counts.items():
+            calls[flow][key] -= value
+
+    total_requests = sum(len(latencies) for latencies in recorder.requests.values())
+    total_errors = sum(recorder.errors.values())
+    flow_results = {}
+    for flow in flows:
+        durations = recorder.flows.get(flow, [])
+        result = latency_summary(durations, recorder.failed_flows.get(flow, 0))
+        # Upstream calls made while running this flow, per completed run
+        runs = max(1, len(durations) + recorder.failed_flows.get(flow, 0))
+        result["upstream_per_flow"] = {key: round(value / runs, 2) for key, value in sorted(calls.get(flow, {}).items())}
+        flow_results[flow] = result
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "summary": {
+            "duration_s": round(duration, 2),
+            "requests": total_requests,
+            "errors": total_errors,
+            "throughput_rps": round(total_requests / duration, 2) if duration else 0.0,
+            "flows_completed": sum(len(d) for d in recorder.flows.values()),
+            "flows_per_s": round(sum(len(d) for d in recorder.flows.values()) / duration, 2) if duration else 0.0,
+        },
+        "memory": {
+            "rss_start_mb": round(rss_start, 1),
+            "rss_end_mb": round(rss_end, 1),
+            "rss_growth_mb": round(rss_end - rss_start, 1),
+        },
+        "endpoints": {
+            endpoint: latency_summary(latencies, recorder.errors.get(endpoint, 0))
+            for endpoint, latencies in sorted(recorder.requests.items())
+        },
+        "flows": flow_results,
+        "upstream_background": calls.get("background", {}),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+
+# ------------------ index benchmark ------------------
+
+# Private (anonymous) and file-backed (memory-mapped) resident memory in MB
+def rss_breakdown_mb() -> dict:
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("RssAnon:", "RssFile:")):
+                    values[line.split(":")[0]] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return {"anon_mb": round(values.get("RssAnon", rss_mb()), 1), "file_mb": round(values.get("RssFile", 0.0), 1)}
+
+
+# Draws unit-length embeddings like real chunk embeddings: clustered, and lying close to a
+# low-dimensional subspace (pure high-dimensional noise would make every neighbour equidistant)
+def _index_vectors(rng, count: int, dimensions: int, seed: int):
+    model = np.random.default_rng(seed)
+    centres = model.standard_normal((256, 64)).astype(np.float32)
+    projection = model.standard_normal((64, dimensions)).astype(np.float32)
+    latent = centres[rng.integers(0, len(centres), count)] + 0.5 * rng.standard_normal((count, 64), dtype=np.float32)
+    vectors = latent @ projection + rng.standard_normal((count, dimensions), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+# Yields (texts, vectors, metadatas) blocks of a deterministic synthetic corpus
+def _index_corpus(size: int, dimensions: int, seed: int):
+    filler = " ".join(VOCABULARY * 40)
+    for start in range(0, size, INDEX_BLOCK):
+        count = min(INDEX_BLOCK, size - start)
+        vectors = _index_vectors(np.random.default_rng([seed, start]), count, dimensions, seed)
+        texts = [f"chunk {start + i}: {filler[(start + i) % 500:][:1500]}" for i in range(count)]
+        metadatas = [{"source": "benchmark", "page": (start + i) // 4} for i in range(count)]
+        yield texts, vectors, metadatas
+
+
+def _index_queries(dimensions: int, seed: int):
+    return _index_vectors(np.random.default_rng([seed, 2 ** 31]), INDEX_QUERIES, dimensions, seed)
+
+
+# Builds one benchmark index in path; returns its build time and size on disk
+def _build_benchmark_index(kind: str, size: int, dimensions: int, seed: int, path: str) -> dict:
+    import compactIndex
+    from langchain_community.vectorstores import FAISS
+
+    started = time.perf_counter()
+    embeddings = FakeEmbeddings(dimensions, latency=0.0)
+    if kind == "flat":
+        store = None
+        for texts, vectors, metadatas in _index_corpus(size, dimensions, seed):
+            pairs = list(zip(texts, vectors))
+            if store is None:
+                store = FAISS.from_embeddings(pairs, embeddings, metadatas=metadatas)
+            else:
+                store.add_embeddings(pairs, metadatas=metadatas)
+        store.save_local(path)
+    else:
+        compactIndex.PDF_COMPACT_INDEX = kind
+        writer = compactIndex.CompactIndexWriter(path)
+        for texts, vectors, metadatas in _index_corpus(size, dimensions, seed):
+            writer.add(texts, vectors, metadatas)
+        store = writer.finish(embeddings, min_chunks=0)
+    disk = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return {
+        "build_s": round(time.perf_counter() - started, 2),
+        "disk_mb": round(disk / 2 ** 20, 1),
+        "index": getattr(store, "manifest", {}).get("factory", "Flat"),
+    }
+
+
+# Loads one benchmark index in this (fresh) process and measures memory, search latency and recall
+def _measure_benchmark_index(kind: str, size: int, dimensions: int, seed: int, path: str) -> dict:
+    import compactIndex
+    from langchain_community.vectorstores import FAISS
+
+    queries = _index_queries(dimensions, seed)
+    embeddings = FakeEmbeddings(dimensions, latency=0.0)
+    gc.collect()
+    before = rss_breakdown_mb()
+    if kind == "flat":
+        store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    else:
+        store = compactIndex.CompactVectorStore(path, embeddings)
+    gc.collect()
+    loaded = rss_breakdown_mb()
+
+    latencies, found = [], []
+    for query in queries:
+        started = time.perf_counter()
+        documents = store.similarity_search_by_vector(query.tolist(), k=4)
+        latencies.append(time.perf_counter() - started)
+        found.append({int(doc.page_content.split(":", 1)[0].split()[1]) for doc in documents})
+    searched = rss_breakdown_mb()
+
+    # Exact top-4 per query (unit vectors: squared L2 = 2 - 2 * dot), computed after the memory readings
+    best = [[] for _ in queries]
+    offset = 0
+    for _, vectors, _ in _index_corpus(size, dimensions, seed):
+        distances = 2 - 2 * queries @ vectors.T
+        for q, row in enumerate(distances):
+            top = np.argsort(row)[:4]
+            best[q] = sorted(best[q] + [(float(row[i]), offset + int(i)) for i in top])[:4]
+        offset += len(vectors)
+    recall = sum(len(found[q] & {i for _, i in best[q]}) for q in range(len(queries))) / (4 * len(queries))
+
+    return {
+        "private_mb": round(loaded["anon_mb"] - before["anon_mb"], 1),
+        "mapped_mb": round(loaded["file_mb"] - before["file_mb"], 1),
+        "private_after_search_mb": round(searched["anon_mb"] - before["anon_mb"], 1),
+        "mapped_after_search_mb": round(searched["file_mb"] - before["file_mb"], 1),
+        "search": latency_summary(latencies),
+        "recall_at_4": round(recall, 3),
+    }
+
+
+# Entry point of the per-index subprocesses started by run_index_benchmark
+def _index_worker(spec: str):
+    step, kind, size, dimensions, seed, path = spec.split(":", 5)
+    run = _build_benchmark_index if step == "build" else _measure_benchmark_index
+    print(json.dumps(run(kind, int(size), int(dimensions), int(seed), path)))
+
+
+#####################################################################
+# Builds and measures a flat, fp16 and pq index for every size in
+# args.index_sizes. Building and measuring each run in their own
+# process, so every reading starts from a clean heap.
+#####################################################################
+def run_index_benchmark(args) -> dict:
+    scratch = tempfile.mkdtemp(prefix="ai_tutor_index_benchmark_")
+    results = {"meta": _index_meta(args), "indexes": []}
+    for size in args.index_sizes:
+        for kind in INDEX_KINDS:
+            path = os.path.join(scratch, f"{kind}-{size}")
+            row = {"kind": kind, "chunks": size}
+            for step in ("build", "measure"):
+                spec = f"{step}:{kind}:{size}:{args.embed_dimensions}:{args.seed}:{path}"
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--index-worker", spec],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                row.update(json.loads(output.strip().splitlines()[-1]))
+            results["indexes"].append(row)
+            print(f"{kind:<6}{size:>8} chunks: private {row['private_mb']} MB, mapped {row['mapped_after_search_mb']} MB, "
+                  f"search p50 {row['search']['p50_ms']} ms, recall@4 {row['recall_at_4']}", flush=True)
+    return results
+
+
+def _index_meta(args) -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "dimensions": args.embed_dimensions,
+        "queries": INDEX_QUERIES,
+    }
+
+
+
+# ------------------ parse benchmark ------------------
+
+# Parses and splits a PDF the way an upload is indexed; returns the seconds to the first
+# chunk, the total seconds and the parsed (page, text) pairs
+def _parse_once(contents: bytes) -> tuple:
+    import pymupdf
+    import pdfLearning
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
+    counts = {"pages_parsed": 0}
+    pages = []
+    def collect(documents):
+        for document in documents:
+            pages.append((document.metadata["page"], document.page_content))
+            yield document
+
+    start = time.perf_counter()
+    first_chunk = None
+    with pymupdf.open(stream=contents, filetype="pdf") as pdf:
+        for _ in pdfLearning._iter_chunks(collect(pdfLearning._iter_pages(pdf, contents, counts)), splitter):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+    return first_chunk, time.perf_counter() - start, pages
+
+
+#####################################################################
+# Times parsing and splitting generated PDFs of every page count in
+# args.parse_pages on the calling thread and with process pools of
+# each size in args.parse_workers.
+#####################################################################
+def run_parse_benchmark(args) -> dict:
+    import pageParser
+
+    results = {"meta": _parse_meta(args), "runs": []}
+    pageParser.PDF_PARSE_MIN_PAGES = 0
+    try:
+        for pages in args.parse_pages:
+            contents = make_pdf(pages, args.seed)
+            serial_pages = None
+            for workers in [0] + args.parse_workers:
+                pageParser.shutdown()
+                pageParser.PDF_PARSE_WORKERS = workers
+                # The first run starts the pool, which then stays up between uploads
+                cold_total = _parse_once(contents)[1]
+                timings = []
+                for _ in range(PARSE_RUNS):
+                    first_chunk, total, parsed = _parse_once(contents)
+                    timings.append((first_chunk, total))
+                serial_pages = serial_pages or parsed
+                row = {
+                    "pages": pages,
+                    "workers": workers,
+                    "cold_total_s": round(cold_total, 3),
+                    "first_chunk_ms": round(percentile([t[0] for t in timings], 50) * 1000, 1),
+                    "total_s": round(percentile([t[1] for t in timings], 50), 3),
+                    "matches_serial": parsed == serial_pages,
+                }
+                row["pages_per_s"] = round(pages / row["total_s"], 1)
+                results["runs"].append(row)
+                print(f"{pages:>6} pages, {workers or 'serial':>6} workers: {row['total_s']} s, "
+                      f"first chunk {row['first_chunk_ms']} ms", flush=True)
+    finally:
+        pageParser.shutdown()
+    return results
+
+
+def _parse_meta(args) -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "runs": PARSE_RUNS,
+    }
+
+
+
+# ------------------ scenarios ------------------
+
+# Micro-benchmarks selected with --scenario, by name
+SCENARIOS = {}
+
+
+def scenario(name: str):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+# In-process client for the app (scenarios warm it up with /health before timing)
+def _scenario_client():
+    import httpx
+    import main
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark", timeout=None)
+
+
+#####################################################################
+# concurrency: --users /intro calls at a fixed fake latency, first one
+# at a time, then all at once. Each uses a new subject, so every call
+# is one on-demand LLM call. While blocking LLM calls run on the worker
+# pool instead of the event loop, the concurrent wall time stays close
+# to one call's latency (per LLM_MAX_CONCURRENCY calls) rather than
+# the serial sum.
+#####################################################################
+@scenario("concurrency")
+async def _concurrency_scenario(args) -> dict:
+    import chainExecutor
+
+    recorder = Recorder()
+    async with _scenario_client() as client:
+        await client.get("/health")
+
+        async def intro(batch: str, index: int):
+            headers = {"x-user-id": f"scenario-{batch}-{index}"}
+            await recorder.call(client, "GET", f"/intro?subject=Topic {batch} {index}", headers=headers)
+
+        start = time.perf_counter()
+        for index in range(args.users):
+            await intro("serial", index)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(intro("concurrent", index) for index in range(args.users)))
+        concurrent = time.perf_counter() - start
+
+    return {
+        "requests": args.users,
+        "llm_latency_s": args.llm_latency,
+        "llm_max_concurrency": chainExecutor.LLM_MAX_CONCURRENCY,
+        "serial_s": round(serial, 3),
+        "concurrent_s": round(concurrent, 3),
+        "speedup": round(serial / concurrent, 2) if concurrent else 0.0,
+        "latency": latency_summary(recorder.requests.get("GET /intro", [])),
+    }
+
+
+# Returns once every task already submitted to the background pool has
+# finished: the barrier only opens when all of its workers are free
+def _drain_background_pool():
+    import chainExecutor
+    barrier = threading.Barrier(chainExecutor.LLM_BULK_CONCURRENCY)
+    futures = [chainExecutor.bulk_executor.submit(barrier.wait) for _ in range(chainExecutor.LLM_BULK_CONCURRENCY)]
+    for future in futures:
+        future.result()
+
+
+# Total upstream chat calls so far, across every flow (background ones included)
+def _chat_calls() -> int:
+    return sum(counts.get("chat_calls", 0) for counts in upstream.snapshot().values())
+
+
+#####################################################################
+# memory: --turns chat turns against the fake LLM, each answering from
+# the memory's history and then saving the turn, with LangChain's
+# ConversationSummaryMemory (re-summarizes on every turn) and with
+# IncrementalSummaryMemory (summarizes in the background once over
+# MEMORY_TOKEN_BUDGET). Reports upstream calls per turn, background
+# summaries included, and the latency of each turn as the user sees it.
+#####################################################################
+@scenario("memory")
+async def _memory_scenario(args) -> dict:
+    from langchain.memory import ConversationSummaryMemory
+    from summaryMemory import IncrementalSummaryMemory
+
+    llm = FakeChatModel(latency=args.llm_latency, token_latency=args.token_latency, output_tokens=args.output_tokens)
+    settings = {"llm": llm, "memory_key": "chat_history", "input_key": "userResponse"}
+    variants = {
+        "per_turn_summary": lambda: ConversationSummaryMemory(**settings),
+        "incremental": lambda: IncrementalSummaryMemory(**settings),
+    }
+
+    results = {}
+    for name, factory in variants.items():
+        memory = factory()
+        rng = random.Random(args.seed)
+        calls_before = _chat_calls()
+        latencies = []
+        for turn in range(args.turns):
+            message = f"Tell me more about {' '.join(rng.choices(VOCABULARY, k=20))} (turn {turn})"
+            start = time.perf_counter()
+            history = memory.load_memory_variables({})["chat_history"]
+            reply = llm.invoke(f"{history}\n\nStudent: {message}").content
+            memory.save_context({"userResponse": message}, {"chat_history": reply})
+            latencies.append(time.perf_counter() - start)
+        _drain_background_pool()
+        results[name] = {
+            "turns": args.turns,
+            "llm_calls_per_turn": round((_chat_calls() - calls_before) / args.turns, 2),
+            "turn_latency": latency_summary(latencies),
+        }
+    return results
+
+
+#####################################################################
+# embed: embeds --embed-chunks distinct chunks through embed_batches
+# (token-sized batches of up to 64 chunks, as PDF indexing does) with
+# a fake embedder of fixed latency, once per --embed-concurrency level,
+# each with a pool of that many workers. Indexing time should fall
+# roughly in proportion to concurrency until the batches run out.
+#####################################################################
+@scenario("embed")
+async def _embed_scenario(args) -> dict:
+    from concurrent.futures import ThreadPoolExecutor
+    from langchain_core.documents import Document
+    import embeddingPipeline
+
+    filler = " ".join(VOCABULARY * 10)
+    chunks = [Document(page_content=f"chunk {i}: {filler}") for i in range(args.embed_chunks)]
+    embeddings = FakeEmbeddings(args.embed_dimensions, args.embed_latency)
+    batches = list(embeddingPipeline.token_batches(chunks, max_chunks=64))
+
+    results = {"chunks": len(chunks), "batches": len(batches), "embed_latency_s": args.embed_latency}
+    default_executor = embeddingPipeline.executor
+    serial = None
+    try:
+        for concurrency in args.embed_concurrency:
+            embeddingPipeline.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench-embed")
+            start = time.perf_counter()
+            embedded = sum(len(batch) for batch, _ in embeddingPipeline.embed_batches(
+                embeddings, iter(batches), max_in_flight=concurrency
+            ))
+            elapsed = time.perf_counter() - start
+            embeddingPipeline.executor.shutdown()
+            serial = serial or elapsed
+            results[f"concurrency_{concurrency}"] = {
+                "chunks_embedded": embedded,
+                "total_s": round(elapsed, 3),
+                "chunks_per_s": round(embedded / elapsed, 1) if elapsed else 0.0,
+                "speedup_vs_first": round(serial / elapsed, 2) if elapsed else 0.0,
+            }
+    finally:
+        embeddingPipeline.executor = default_executor
+    return results
+
+
+#####################################################################
+# submit: times /quiz/submit with the grade and feedback chains given
+# fixed fake delays (--grade-latency, --feedback-latency), for a quiz
+# without an answer key (both are LLM calls) and for a structured quiz
+# (graded locally). Since grading and feedback run concurrently, the
+# submit time should track the slower call, not the sum of both.
+#####################################################################
+@scenario("submit")
+async def _submit_scenario(args) -> dict:
+    import main
+    import casualLearning
+
+    for chain, latency in ((casualLearning.quizGrade_chain, args.grade_latency),
+                           (casualLearning.quizFeedback_chain, args.feedback_latency)):
+        chain.llm = FakeChatModel(latency=latency, output_tokens=args.output_tokens, callbacks=chain.llm.callbacks)
+
+    results = {
+        "grade_latency_s": args.grade_latency,
+        "feedback_latency_s": args.feedback_latency,
+        "sum_s": round(args.grade_latency + args.feedback_latency, 3),
+        "slower_s": max(args.grade_latency, args.feedback_latency),
+    }
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    async with _scenario_client() as client:
+        await client.get("/health")
+        for variant in ("llm_graded", "answer_key"):
+            for run in range(args.submit_runs):
+                user = f"scenario-submit-{variant}-{run}"
+                quiz_data = main.get_user_quiz(user)
+                if variant == "answer_key":
+                    main.set_generated_quiz(quiz_data, _fake_quiz(rng))
+                else:
+                    main.set_generated_quiz(quiz_data, "1. Which planet is largest? A) Mars B) Jupiter C) Venus D) Earth")
+                main.user_quizzes.set(user, quiz_data)
+                await recorder.call(
+                    client, "POST", "/quiz/submit", headers={"x-user-id": user},
+                    json={"answers": [rng.choice("ABCD") for _ in range(5)]}
+                )
+            results[variant] = latency_summary(recorder.requests.pop("POST /quiz/submit"))
+    return results
+
+
+# Follow-up questions asked by the condense scenario: standalone ones, and ones that only
+# make sense with the conversation (which needs_condensing should send to the LLM)
+FOLLOW_UPS = (
+    "What does the document say about gravity and orbits?",
+    "Can you explain that in simpler terms?",
+    "How is energy described in the second section?",
+    "Why?",
+    "What evidence supports the theory of the atom?",
+    "Give me another example.",
+    "Which experiments involve light and molecules?",
+    "What about the ocean?",
+)
+
+
+#####################################################################
+# condense: uploads a generated PDF and asks a first question, then
+# --turns follow-ups from FOLLOW_UPS, once with PDF_CONDENSE_MODE
+# "always" (every follow-up is rewritten by the LLM first) and once
+# with "auto" (needs_condensing decides). Reports upstream chat calls
+# and latency per follow-up.
+#####################################################################
+@scenario("condense")
+async def _condense_scenario(args) -> dict:
+    import condenseQuestion
+
+    pdf = make_pdf(args.pdf_pages, args.seed)
+    results = {}
+    recorder = Recorder()
+    default_mode = condenseQuestion.PDF_CONDENSE_MODE
+    try:
+        async with _scenario_client() as client:
+            await client.get("/health")
+            for mode in ("always", "auto"):
+                condenseQuestion.PDF_CONDENSE_MODE = mode
+                _flow.set(f"condense_{mode}")
+                headers = {"x-user-id": f"scenario-condense-{mode}"}
+                await recorder.call(client, "POST", "/pdf/upload?wait=true", headers=headers,
+                                    files={"file": ("benchmark.pdf", pdf, "application/pdf")})
+                await recorder.call(client, "POST", "/pdf/ask", headers=headers, json={"message": FOLLOW_UPS[0]})
+
+                calls_before = upstream.snapshot().get(f"condense_{mode}", {}).get("chat_calls", 0)
+                for turn in range(args.turns):
+                    question = FOLLOW_UPS[(turn + 1) % len(FOLLOW_UPS)]
+                    await recorder.call(client, "POST", "/pdf/ask", headers=headers, json={"message": question})
+                _drain_background_pool()
+                calls = upstream.snapshot().get(f"condense_{mode}", {}).get("chat_calls", 0) - calls_before
+
+                latencies = recorder.requests.pop("POST /pdf/ask")[1:]
+                results[mode] = {
+                    "follow_ups": args.turns,
+                    "chat_calls_per_follow_up": round(calls / args.turns, 2) if args.turns else 0.0,
+                    "follow_up_latency": latency_summary(latencies),
+                }
+    finally:
+        condenseQuestion.PDF_CONDENSE_MODE = default_mode
+    return results
+
+
+#####################################################################
+# Runs the micro-benchmark named by args.scenario and returns its
+# results with the usual run metadata.
+#####################################################################
+def run_scenario(args) -> dict:
+    install_fakes(args)
+    results = asyncio.run(SCENARIOS[args.scenario](args))
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "scenario": args.scenario,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+
+
+
+# ------------------ reporting ------------------
+
+def print_results(results: dict):
+    summary, memory = results["summary"], results["memory"]
+    print(f"\n{summary['requests']} requests in {summary['duration_s']}s "
+          f"({summary['throughput_rps']} req/s, {summary['flows_per_s']} flows/s), {summary['errors']} errors")
+    print(f"RSS {memory['rss_start_mb']} MB -> {memory['rss_end_mb']} MB ({memory['rss_growth_mb']:+} MB)\n")
+
+    print(f"{'endpoint':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for endpoint, stats in results["endpoints"].items():
+        print(f"{endpoint:<28}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['errors']:>8}")
+
+    print(f"\n{'flow':<10}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  upstream calls per flow")
+    for flow, stats in results["flows"].items():
+        calls = ", ".join(f"{key}={value}" for key, value in stats["upstream_per_flow"].items() if key.endswith("_calls"))
+        print(f"{flow:<10}{stats['count']:>6}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}  {calls}")
+    if results["upstream_background"]:
+        print(f"background upstream calls: {results['upstream_background']}")
+
+
+#####################################################################
+# Prints the index benchmark table.
+#####################################################################
+def print_index_results(results: dict):
+    print(f"\n{'index':<42}{'chunks':>8}{'build s':>9}{'disk MB':>9}{'private MB':>12}{'mapped MB':>11}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'recall@4':>10}")
+    for row in results["indexes"]:
+        print(f"{row['kind'] + ' (' + row['index'] + ')':<42}{row['chunks']:>8}{row['build_s']:>9}{row['disk_mb']:>9}"
+              f"{row['private_after_search_mb']:>12}{row['mapped_after_search_mb']:>11}"
+              f"{row['search']['p50_ms']:>9}{row['search']['p95_ms']:>9}{row['recall_at_4']:>10}")
+
+
+#####################################################################
+# Prints the parse benchmark table.
+#####################################################################
+def print_parse_results(results: dict):
+    print(f"\n{'pages':>6}{'workers':>9}{'cold s':>8}{'first chunk ms':>16}{'total s':>9}{'pages/s':>9}  matches serial")
+    for row in results["runs"]:
+        print(f"{row['pages']:>6}{row['workers'] or 'serial':>9}{row['cold_total_s']:>8}{row['first_chunk_ms']:>16}"
+              f"{row['total_s']:>9}{row['pages_per_s']:>9}  {row['matches_serial']}")
+
+
+#####################################################################
+# Prints a scenario's results, one line per figure (nested dicts such
+# as per-variant results are indented below their name).
+#####################################################################
+def print_scenario_results(results: dict):
+    def show(values: dict, indent: int):
+        for name, value in values.items():
+            if isinstance(value, dict):
+                print(f"{' ' * indent}{name}:")
+                show(value, indent + 2)
+            else:
+                print(f"{' ' * indent}{name:<{32 - indent}}{value}")
+
+    print(f"\nScenario {results['meta']['scenario']}:")
+    show(results["results"], 2)
+
+
+#####################################################################
+# Prints how throughput and per-endpoint/per-flow p50/p95 changed
+# from a previous run (negative latency deltas are improvements).
+#####################################################################
+def compare_results(previous: dict, current: dict):
+    def delta(old, new):
+        return f"{new - old:+.1f} ({(new - old) / old * 100:+.0f}%)" if old else f"{new - old:+.1f}"
+
+    print(f"\nCompared with {previous['meta'].get('commit')} ({previous['meta']['timestamp']}):")
+    print(f"throughput_rps: {previous['summary']['throughput_rps']} -> {current['summary']['throughput_rps']}")
+    print(f"rss_growth_mb: {previous['memory']['rss_growth_mb']} -> {current['memory']['rss_growth_mb']}")
+    for section in ("endpoints", "flows"):
+        for name, stats in current[section].items():
+            old = previous[section].get(name)
+            if old:
+                print(f"{name:<28} p50 {delta(old['p50_ms'], stats['p50_ms']):>18}   p95 {delta(old['p95_ms'], stats['p95_ms']):>18}")
+
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline AI Tutor API benchmark with fake LLMs.")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users")
+    parser.add_argument("--flows", default=",".join(FLOWS), help="Comma-separated flows: " + ", ".join(FLOWS))
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns / PDF questions per flow")
+    parser.add_argument("--repeat", type=int, default=1, help="Flows run back to back by each user")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between flows (s)")
+    parser.add_argument("--stream", action="store_true", help="Use ?stream=true on chat and submit endpoints")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake time to first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake delay per output token (s)")
+    parser.add_argument("--output-tokens", type=int, default=60, help="Tokens per fake completion")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Fake delay per embedding request (s)")
+    parser.add_argument("--embed-dimensions", type=int, default=1536, help="Fake embedding size")
+    parser.add_argument("--pdf-pages", type=int, default=20, help="Pages per generated PDF")
+    parser.add_argument("--pdf-count", type=int, default=3, help="Distinct PDFs shared by the pdf users")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for user behaviour")
+    parser.add_argument("--out", default="benchmark_results", help="Directory results are saved to")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--index-sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        help="Benchmark PDF indexes at these chunk counts (e.g. 1000,10000,100000) instead of the API")
+    parser.add_argument("--index-worker", help=argparse.SUPPRESS)
+    parser.add_argument("--parse-pages", type=lambda value: [int(pages) for pages in value.split(",")],
+                        help="Benchmark PDF page parsing at these page counts (e.g. 200,500,1000) instead of the API")
+    parser.add_argument("--parse-workers", type=lambda value: [int(workers) for workers in value.split(",")],
+                        default=[2, 4], help="Parser process pool sizes compared with serial parsing")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS),
+                        help="Run one micro-benchmark instead of the full API benchmark")
+    parser.add_argument("--embed-chunks", type=int, default=1024, help="Chunks embedded by the embed scenario")
+    parser.add_argument("--embed-concurrency", type=lambda value: [int(level) for level in value.split(",")],
+                        default=[1, 2, 4, 8], help="Embedding requests in flight compared by the embed scenario")
+    parser.add_argument("--grade-latency", type=float, default=0.5, help="Fake grade call delay in the submit scenario (s)")
+    parser.add_argument("--feedback-latency", type=float, default=1.0, help="Fake feedback call delay in the submit scenario (s)")
+    parser.add_argument("--submit-runs", type=int, default=5, help="Submissions timed per quiz kind in the submit scenario")
+    return parser.parse_args(argv)
+
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.index_worker:
+        return _index_worker(args.index_worker)
+
+    # Benchmark defaults (each still overridable from the environment): no rate
+    # limits, no real key, and caches/indexes in a throwaway directory
+    scratch = tempfile.mkdtemp(prefix="ai_tutor_benchmark_")
+    for name, value in {
+        "OPENAI_API_KEY": "benchmark",
+        "LLM_RATE_LIMIT_RPM": "0",
+        "LLM_RATE_LIMIT_TPM": "0",
+        "EMBED_RATE_LIMIT_RPM": "0",
+        "EMBED_RATE_LIMIT_TPM": "0",
+        "EMBEDDING_CACHE_PATH": os.path.join(scratch, "embeddings.db"),
+        "PDF_INDEX_DIR": os.path.join(scratch, "indexes"),
+        "TRACE_FILE": "",
+    }.items():
+        os.environ.setdefault(name, value)
+
+    if args.index_sizes:
+        results = run_index_benchmark(args)
+        print_index_results(results)
+        prefix = "index"
+    elif args.parse_pages:
+        results = run_parse_benchmark(args)
+        print_parse_results(results)
+        prefix = "parse"
+    elif args.scenario:
+        results = run_scenario(args)
+        print_scenario_results(results)
+        prefix = f"scenario-{args.scenario}"
+    else:
+        install_fakes(args)
+        results = asyncio.run(run_benchmark(args))
+        print_results(results)
+        prefix = "bench"
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{results['meta']['commit'] or 'local'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved results to {path}")
+
+    if args.compare and not (args.index_sizes or args.parse_pages or args.scenario):
+        with open(args.compare, encoding="utf-8") as f:
+            compare_results(json.load(f), results)
+
+
+
+# Exported names from this module
+__all__ = [
+    "FakeChatModel",
+    "FakeEmbeddings",
+    "run_benchmark",
+    "compare_results",
+    "run_index_benchmark",
+    "run_parse_benchmark",
+    "run_scenario",
+]
+
+
+
+if __name__ == "__main__":
+    main()
@@ -15,14 +15,16 @@
 # This module initializes a GPT-4o-mini LLM and provides reusable LangChain templates for:
 # - Introducing a learning topic
 # - Conversational educational dialogue
-# - Generating and grading quizzes
+# - Generating structured quizzes (with a hidden answer key) and quiz feedback
 # - Adjusting the lesson based on quiz results
 
-# It also manages per-user conversation memory using LangChain's `ConversationSummaryMemory`.
+# It also manages per-user conversation memory using a token-budgeted `IncrementalSummaryMemory`.
 
 # Exports:
 # - Prompt templates and LLMChains for casual learning sessions
 # - Utility functions for accessing and clearing memory
+# - An intro cache serving pre-generated intros per subject
+# - A quiz prefetcher generating quizzes ahead of time from the conversation
 ################################################################################################
 
 
@@ -31,34 +33,57 @@ import os
 import warnings
 
 # Langchain
-from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from langchain_community.chat_models import ChatOpenAI
-from langchain.memory import ConversationSummaryMemory
+
+# LLMChain with per-chain prompt token budgets
+from promptBudget import BudgetedLLMChain
+
+# Shared OpenAI clients and per-mode model settings
+import llmProvider
+
+# Token-budgeted summary memory
+from summaryMemory import IncrementalSummaryMemory, memory_size, memory_to_dict, memory_from_dict, bind_persistence
+
+# Bounded per-user session storage
+from sessionStore import SessionStore
+
+# Pre-generated intros per subject
+from introCache import IntroCache
+
+# Quizzes pre-generated while the user chats
+from quizPrefetch import QuizPrefetcher
 
 warnings.filterwarnings("ignore")
 
 # Load API key from env variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Define the GPT Model
-llm_model = "gpt-4o-mini"
-llm = ChatOpenAI(temperature=0.7, model=llm_model)
+# Define the GPT Model (streaming so tokens can be forwarded to SSE clients)
+llm = llmProvider.get_chat_model("casual", streaming=True)
+
+# Same model in JSON mode, for generating structured quizzes with an answer key
+quiz_llm = llmProvider.get_chat_model("casual", model_kwargs={"response_format": {"type": "json_object"}})
 
-# Memory dictionary for tracking user-specific conversation context
-user_memories = {}
+# Settings shared by every user's conversation memory in this mode
+memory_settings = {"llm": llm, "memory_key": "chat_history", "input_key": "userResponse"}
+
+# Session store for tracking user-specific conversation context (bounded, evicts idle users)
+user_memories = SessionStore(
+    "casual_memories",
+    sizeof=memory_size,
+    dump=memory_to_dict,
+    load=lambda data: memory_from_dict(data, **memory_settings)
+)
 
 
 #####################################################################
 # Retrieve or initialize a conversation memory for the given user ID.
-# Returns a ConversationSummaryMemory object tied to the user.
+# Returns an IncrementalSummaryMemory object tied to the user.
 ####################################################################
 def get_user_memory(user_id: str):
-    if user_id not in user_memories:
-        user_memories[user_id] = ConversationSummaryMemory(
-            llm=llm, memory_key="chat_history", input_key="userResponse"
-        )
-    return user_memories[user_id]
+    memory = user_memories.get_or_create(user_id, lambda: IncrementalSummaryMemory(**memory_settings))
+    bind_persistence(user_memories, user_id, memory)
+    return memory
 
 
 
@@ -66,8 +91,8 @@ def get_user_memory(user_id: str):
 # Clears the memory for ge specified user ID, if it exists. 
 ####################################################################
 def clear_user_memory(user_id: str):
-    if user_id in user_memories:
-        user_memories[user_id].clear()
+    user_memories.delete(user_id)
+    quiz_prefetcher.clear(user_id)
 
 
 # --------------------- PROMPTS ----------------------
@@ -122,8 +147,10 @@ learning experience. Generate 5 multiple choice questions to test the user's \
 knowledge in {subject}. Each question should be labeled with a question number (1-5). \
 Draw from specific information covered in the past conversation. The goal is to test \
 if the user is grasping the information well and furthering their knowledge in {subject}. \
-Do not generate the answer key, as this quiz is being used to test the user's knowledge. \
-Make sure to put the answer choices on a new line under each question (so its visually appealing).
+Each question should have four answer choices labeled A-D, and exactly one correct answer.
+
+Respond with only a JSON object in this format (the answer key is kept hidden from the user):
+{{"questions": [{{"question": "...", "choices": {{"A": "...", "B": "...", "C": "...", "D": "..."}}, "answer": "A"}}]}}
 
 Here is the previous conversation:
 {previousChat}"""
@@ -137,7 +164,8 @@ quizFeedback_prompt = PromptTemplate(
 Based on the user's answers, give some constructive feedback to their quiz results \
 and guide them on the path of learning. Make sure to output the question, the user's answer \
 (as a full answer choice if they only put the letter), the correct answer, and a helpful feedback explanation. In the feedback section, say something like \
-'Great Job!' if the user gets it right and 'Sorry that is incorrect' if they get it wrong. 
+'Great Job!' if the user gets it right and 'Sorry that is incorrect' if they get it wrong. \
+The correct answer is marked under each question of the generated quiz; always use it. 
 
 Use these to help
 
@@ -152,19 +180,21 @@ Previous Coversation:
 )
 
 
-# Prompt for generating a quiz grade
+# Prompt for generating a quiz grade (fallback for quizzes without an answer key)
 quizGrade_prompt = PromptTemplate(
-    input_variables=["subject", "quizFeedback"],
+    input_variables=["subject", "generatedQuiz", "userAnswers"],
     template="""Your job is to grade the user's answers to a generated {subject} quiz. \
 You should output which questions the user got correct, which they got wrong, \
-and their total score out of 5. Make sure the grade is consistent with the feedback results. \
-Whenever there is text like 'Good Job!' in the feedback section, the question is correct. \
-If the question is wrong, it will indicate that as well. 
+and their total score out of 5. Work out the correct answer to each question yourself \
+and compare it with the user's answer (a letter or the full answer choice). 
 
 Here is an example: (\nCorrect: 1 3 5 \nIncorrect: 2 4 \nScore: 3/5 \nGrade: 60%)
 
-Here is the quiz feedback:
-{quizFeedback}"""
+Generated Quiz: 
+{generatedQuiz}
+
+User's Response: 
+{userAnswers}"""
 )
 
 
@@ -196,12 +226,18 @@ Here is the previous conversation history:
 # --------------------- CHAINS ----------------------
 
 
-# Chains for executing the prompts with the LLM
-intro_chain = LLMChain(llm=llm, prompt=intro_prompt)
-quizGen_chain = LLMChain(llm=llm, prompt=quizGen_prompt)
-quizFeedback_chain = LLMChain(llm=llm, prompt=quizFeedback_prompt)
-quizGrade_chain = LLMChain(llm=llm, prompt=quizGrade_prompt)
-continueIntro_chain = LLMChain(llm=llm, prompt=continueIntro_prompt)
+# Chains for executing the prompts with the LLM (named for per-chain metrics)
+intro_chain = BudgetedLLMChain(llm=llm, prompt=intro_prompt, name="intro_chain")
+quizGen_chain = BudgetedLLMChain(llm=quiz_llm, prompt=quizGen_prompt, name="quizGen_chain")
+quizFeedback_chain = BudgetedLLMChain(llm=llm, prompt=quizFeedback_prompt, name="quizFeedback_chain")
+quizGrade_chain = BudgetedLLMChain(llm=llm, prompt=quizGrade_prompt, name="quizGrade_chain")
+continueIntro_chain = BudgetedLLMChain(llm=llm, prompt=continueIntro_prompt, name="continueIntro_chain")
+
+# Pools of ready-made intros per subject, served by /intro
+intro_cache = IntroCache("casual", intro_chain)
+
+# Quizzes generated ahead of /quiz/start from the ongoing conversation
+quiz_prefetcher = QuizPrefetcher("casual", quizGen_chain)
 
 
 # --------------------- EXPORT ----------------------
@@ -214,6 +250,8 @@ __all__ = [
     "quizFeedback_chain",
     "quizGrade_chain",
     "continueIntro_chain",
+    "intro_cache",
+    "quiz_prefetcher",
     "response_prompt",
     "get_user_memory",
     "clear_user_memory"
@@ -0,0 +1,172 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    chainExecutor.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# chainExecutor.py – Runs blocking LangChain work off the FastAPI event loop.
+#
+# Every LangChain call in this project (chain.run, chain.invoke, memory.save_context,
+# embedding a PDF) is a blocking HTTP round-trip to OpenAI. Calling them directly inside an
+# `async def` route freezes the whole uvicorn worker until the call returns. This module
+# moves that work onto a bounded thread pool and caps how many LLM calls a single worker
+# may have in flight at once.
+#
+# Background work (see rateLimiter.background) runs on a separate, smaller pool. It may wait
+# minutes for rate-limit capacity inside its worker thread, and on the shared pool it would
+# hold the slots interactive requests need to even reach the limiter.
+#
+# Configuration (environment variables):
+# - LLM_MAX_CONCURRENCY  -> Max concurrent blocking LLM/embedding calls per worker (default 16)
+# - LLM_BULK_CONCURRENCY -> Max concurrent background calls per worker (default 4)
+#
+# Exports:
+# - run_blocking         -> Await any blocking callable on the shared (or background) pool
+# - bulk_executor        -> Thread pool for background work submitted without awaiting it
+# - run_chain            -> Await chain.run(inputs) on the shared pool
+# - invoke_chain         -> Await chain.invoke(inputs) on the shared pool
+# - save_context         -> Await memory.save_context(...) on the shared pool
+################################################################################################
+
+
+
+import os
+import time
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import rateLimiter
+import requestTracing
+
+
+# Maximum number of blocking LLM calls allowed in flight per worker
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+# Shared thread pool used for every blocking LangChain call
+executor = ThreadPoolExecutor(
+    max_workers=LLM_MAX_CONCURRENCY,
+    thread_name_prefix="llm-worker"
+)
+
+# Maximum number of blocking background calls allowed in flight per worker
+LLM_BULK_CONCURRENCY = int(os.getenv("LLM_BULK_CONCURRENCY", "4"))
+
+# Separate pool for background work, so it never occupies interactive slots
+bulk_executor = ThreadPoolExecutor(
+    max_workers=LLM_BULK_CONCURRENCY,
+    thread_name_prefix="llm-bulk-worker"
+)
+
+# Semaphores limiting in-flight calls (created lazily on the running loop)
+_semaphore = None
+_bulk_semaphore = None
+
+
+
+#####################################################################
+# Returns the pool and concurrency semaphore for calls made in the
+# current context, creating the semaphores on first use so they bind
+# to the event loop uvicorn is actually running.
+#####################################################################
+def _get_pool():
+    global _semaphore, _bulk_semaphore
+    if rateLimiter.is_background():
+        if _bulk_semaphore is None:
+            _bulk_semaphore = asyncio.Semaphore(LLM_BULK_CONCURRENCY)
+        return bulk_executor, _bulk_semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return executor, _semaphore
+
+
+
+#####################################################################
+# Runs a blocking callable on the shared pool (or the background pool
+# inside rateLimiter.background()) and awaits its result. Context
+# variables are copied so per-request state follows the call into the
+# worker thread.
+#####################################################################
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    pool, semaphore = _get_pool()
+    trace = requestTracing.current_trace()
+    if trace is not None:
+        return await _run_traced(loop, trace, pool, semaphore, call)
+    async with semaphore:
+        return await loop.run_in_executor(pool, call)
+
+
+
+#####################################################################
+# run_blocking for a traced request: also records how long the call
+# waited for a worker, and how long the event loop took to resume the
+# request after the call finished (high when the loop is blocked).
+#####################################################################
+async def _run_traced(loop, trace, pool, semaphore, call):
+    queued = time.perf_counter()
+    times = {}
+
+    def timed_call():
+        times["started"] = time.perf_counter()
+        try:
+            return call()
+        finally:
+            times["finished"] = time.perf_counter()
+
+    try:
+        async with semaphore:
+            return await loop.run_in_executor(pool, timed_call)
+    finally:
+        resumed = time.perf_counter()
+        if "started" in times:
+            trace.add("executor_wait", queued, times["started"])
+            trace.add("loop_resume", times["finished"], resumed)
+
+
+
+#####################################################################
+# Awaitable wrapper around chain.run(inputs).
+#####################################################################
+async def run_chain(chain, inputs: dict, **kwargs):
+    return await run_blocking(chain.run, inputs, **kwargs)
+
+
+
+#####################################################################
+# Awaitable wrapper around chain.invoke(inputs).
+#####################################################################
+async def invoke_chain(chain, inputs: dict, **kwargs):
+    return await run_blocking(chain.invoke, inputs, **kwargs)
+
+
+
+#####################################################################
+# Awaitable wrapper around memory.save_context(inputs, outputs), which
+# triggers an LLM summarization call for summary-based memories.
+#####################################################################
+async def save_context(memory, inputs: dict, outputs: dict):
+    return await run_blocking(memory.save_context, inputs, outputs)
+
+
+
+# Exported functions from this module
+__all__ = [
+    "LLM_MAX_CONCURRENCY",
+    "LLM_BULK_CONCURRENCY",
+    "bulk_executor",
+    "run_blocking",
+    "run_chain",
+    "invoke_chain",
+    "save_context",
+]
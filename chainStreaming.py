@@ -0,0 +1,141 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    chainStreaming.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# chainStreaming.py – Server-Sent Events (SSE) streaming for the chat endpoints.
+#
+# The chat chains normally return only after the whole completion is generated. This module
+# runs a chain on the shared worker pool (see chainExecutor.py) with a callback handler that
+# forwards each token the ChatOpenAI model emits back to the event loop, where it is written
+# to the client as an SSE event. The chain itself still runs to completion, so any attached
+# memory saves the final answer exactly as it does in non-streaming mode.
+#
+# Event format:
+# - data: {"token": "<text>"}                    -> One per streamed token
+# - event: done   / data: {"message": "<full>"}  -> Final, complete answer
+# - event: error  / data: {"error": "<text>"}    -> Chain raised an exception (with
+#   "retry_after" seconds when it was rate limited)
+#
+# stream_sse_after can put one extra named event (e.g. event: grade) in front of a token
+# stream, while the chain behind the stream is already generating.
+#
+# Exports:
+# - TokenQueueHandler    -> LangChain callback handler pushing tokens onto an asyncio queue
+# - stream_sse           -> Async generator of SSE events for a blocking chain call
+# - stream_sse_after     -> Leads a stream_sse stream with an event computed concurrently
+################################################################################################
+
+
+
+import json
+import asyncio
+from langchain_core.callbacks import BaseCallbackHandler
+
+import chainExecutor
+import rateLimiter
+
+
+
+#####################################################################
+# Callback handler that hands every new LLM token to the event loop.
+# Runs inside the worker thread, so it must use call_soon_threadsafe.
+#####################################################################
+class TokenQueueHandler(BaseCallbackHandler):
+
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if token:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, token)
+
+
+
+#####################################################################
+# Formats a single SSE event.
+#####################################################################
+def _sse(payload: dict, event: str = None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+
+
+#####################################################################
+# Formats an "error" event, telling the client when to retry if the
+# call was rate limited.
+#####################################################################
+def _sse_error(e: Exception):
+    payload = {"error": str(e)}
+    retry_after = rateLimiter.retry_after_for(e)
+    if retry_after is not None:
+        payload["retry_after"] = retry_after
+    return _sse(payload, event="error")
+
+
+
+#####################################################################
+# Runs func(*args, callbacks=[handler], **kwargs) on the worker pool
+# and yields SSE events for each token, then a final "done" event
+# carrying the full answer (or an "error" event).
+#####################################################################
+async def stream_sse(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    handler = TokenQueueHandler(loop, queue)
+
+    task = asyncio.ensure_future(
+        chainExecutor.run_blocking(func, *args, callbacks=[handler], **kwargs)
+    )
+    # Tokens are queued before the call returns, so the sentinel always arrives last
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+
+    while True:
+        token = await queue.get()
+        if token is None:
+            break
+        yield _sse({"token": token})
+
+    try:
+        yield _sse({"message": task.result()}, event="done")
+    except Exception as e:
+        yield _sse_error(e)
+
+
+
+#####################################################################
+# Yields {"<event>": <result of awaitable>} as a named SSE event,
+# then the events of a stream_sse stream. The stream's chain is
+# started first, so both run concurrently; tokens produced while the
+# awaitable is pending are buffered and sent right after it.
+#####################################################################
+async def stream_sse_after(event: str, awaitable, events):
+    first = asyncio.ensure_future(events.__anext__())
+    try:
+        yield _sse({event: await awaitable}, event=event)
+    except Exception as e:
+        first.cancel()
+        yield _sse_error(e)
+        return
+
+    yield await first
+    async for item in events:
+        yield item
+
+
+
+# Exported names from this module
+__all__ = [
+    "TokenQueueHandler",
+    "stream_sse",
+    "stream_sse_after",
+]
@@ -0,0 +1,377 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    compactIndex.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# compactIndex.py – Compact, memory-mapped vector indexes for large PDFs.
+#
+# A regular PDF index is a flat float32 FAISS index plus one LangChain Document per chunk, all
+# held in Python memory (about 6 KB of vectors and 1.5 KB of text per chunk, plus object
+# overhead). For large documents this module writes a compact index to disk instead and
+# memory-maps it:
+# - Vectors are stored as float16 ("fp16": half the size, near-exact results), or ("pq") as
+#   4-bit fast-scan product-quantized codes (1/64 of the size) that are scanned to pick
+#   candidates, which are then re-ranked against the float16 vectors. A pq search reads the
+#   small codes plus a few float16 rows per query, so it is several times faster than fp16.
+#   (8-bit PQ was not used: training it takes minutes per document on a single core.)
+# - Documents with at least PDF_IVF_MIN_CHUNKS chunks use an IVF index, so a search scans
+#   PDF_IVF_NPROBE clusters instead of every vector
+# - Chunk text and metadata live in flat files next to the index, read through mmap, with one
+#   offset table for both
+#
+# Memory-mapped pages are shared between workers and can be dropped by the OS under memory
+# pressure, so private memory per document drops to the offset table (and the IVF centroids).
+# Documents smaller than PDF_COMPACT_MIN_CHUNKS still get the regular in-memory index, which is
+# small and the fastest to search.
+#
+# Layout of an index directory: compact.json (manifest), vectors.faiss, chunks.bin,
+# metadata.bin, offsets.npy. Compact indexes are always written to disk (they are read from
+# there), under the same directory used for persisted indexes. Unless indexes are persisted,
+# pdfLearning.py removes a compact index from disk once it leaves its in-memory index cache
+# (remove_compact_index); indexes left behind by a restart are not cleaned up automatically.
+#
+# Configuration (environment variables):
+# - PDF_COMPACT_INDEX        -> "off" (default), "fp16" or "pq"
+# - PDF_COMPACT_MIN_CHUNKS   -> Chunks at which a PDF gets a compact index (default 1000)
+# - PDF_IVF_MIN_CHUNKS       -> Chunks at which a compact index also uses IVF (default 20000)
+# - PDF_IVF_NPROBE           -> IVF clusters scanned per search (default 16)
+#
+# Exports:
+# - COMPACT_INDEX_ENABLED  -> Whether compact indexes are turned on
+# - CompactIndexWriter     -> Streams chunks to disk and builds the right index for their count
+# - CompactVectorStore     -> LangChain vector store over a memory-mapped compact index
+# - is_compact_index       -> Whether a directory holds a compact index
+# - remove_compact_index   -> Deletes a compact index directory in the background
+################################################################################################
+
+
+
+import os
+import json
+import math
+import mmap
+import uuid
+import shutil
+import threading
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores import FAISS
+
+
+PDF_COMPACT_INDEX = os.getenv("PDF_COMPACT_INDEX", "off").lower()
+PDF_COMPACT_MIN_CHUNKS = int(os.getenv("PDF_COMPACT_MIN_CHUNKS", "1000"))
+PDF_IVF_MIN_CHUNKS = int(os.getenv("PDF_IVF_MIN_CHUNKS", "20000"))
+PDF_IVF_NPROBE = int(os.getenv("PDF_IVF_NPROBE", "16"))
+
+COMPACT_INDEX_ENABLED = PDF_COMPACT_INDEX in ("fp16", "pq")
+
+# Index format version written to compact.json
+FORMAT_VERSION = 1
+
+# Product quantization needs enough vectors to train its 16 centroids per sub-vector;
+# smaller documents fall back to fp16
+PQ_MIN_CHUNKS = 1000
+
+# Candidates per result re-ranked against the float16 vectors in pq indexes
+REFINE_K_FACTOR = 32
+
+# Vectors added per step while building, bounding memory
+ADD_BLOCK = 10000
+
+# Training vectors per IVF cluster (FAISS asks for at least 39), bounding training time
+TRAINING_VECTORS_PER_CLUSTER = 40
+MAX_TRAINING_VECTORS = 20000
+
+# Files in an index directory
+MANIFEST_FILE = "compact.json"
+VECTORS_FILE = "vectors.faiss"
+CHUNKS_FILE = "chunks.bin"
+METADATA_FILE = "metadata.bin"
+OFFSETS_FILE = "offsets.npy"
+
+
+
+#####################################################################
+# Returns True if the directory holds a compact index.
+#####################################################################
+def is_compact_index(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+
+#####################################################################
+# Deletes a compact index directory. It is first renamed away, so the
+# index is gone for new readers at once, then removed on a background
+# thread. Stores already open keep working on POSIX systems, since
+# their files stay mapped until closed.
+#####################################################################
+def remove_compact_index(path: str):
+    trash = f"{path}.deleted-{uuid.uuid4().hex}"
+    try:
+        os.replace(path, trash)
+    except OSError:
+        return
+    threading.Thread(target=shutil.rmtree, args=(trash, True), name="index-cleanup", daemon=True).start()
+
+
+
+#####################################################################
+# Returns the FAISS index_factory description for a compact index of
+# count vectors with the given dimension.
+#####################################################################
+def _factory_for(count: int, dim: int) -> str:
+    # Half a byte per sub-vector of 8 dimensions (fast-scan needs an even sub-vector count)
+    subvectors = [m for m in range(2, dim // 8 + 1, 2) if dim % m == 0]
+    if PDF_COMPACT_INDEX == "pq" and count >= PQ_MIN_CHUNKS and subvectors:
+        codec = f"PQ{subvectors[-1]}x4fs,Refine(SQfp16)"
+    else:
+        codec = "SQfp16"
+    if count >= PDF_IVF_MIN_CHUNKS:
+        return f"IVF{int(math.sqrt(count))},{codec}"
+    return codec
+
+
+
+#####################################################################
+# Streams embedded chunks to a scratch directory while a PDF is being
+# indexed, then builds its index in finish(): a compact index at
+# path for large documents, or a regular in-memory FAISS index.
+#####################################################################
+class CompactIndexWriter:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.scratch = f"{path}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(self.scratch)
+        self.count = 0
+        self.dim = None
+        self._offsets = [(0, 0)]
+        self._chunks = open(os.path.join(self.scratch, CHUNKS_FILE), "wb")
+        self._metadata = open(os.path.join(self.scratch, METADATA_FILE), "wb")
+        self._vectors = open(os.path.join(self.scratch, "vectors.f32"), "wb")
+
+
+    #####################################################################
+    # Appends a batch of chunk texts with their vectors and metadata.
+    #####################################################################
+    def add(self, texts: list, vectors: list, metadatas: list):
+        block = np.asarray(vectors, dtype=np.float32)
+        self.dim = block.shape[1]
+        self._vectors.write(block.tobytes())
+        for text, metadata in zip(texts, metadatas):
+            self._chunks.write(text.encode("utf-8"))
+            self._metadata.write(json.dumps(metadata).encode("utf-8"))
+            self._offsets.append((self._chunks.tell(), self._metadata.tell()))
+        self.count += len(texts)
+
+
+    #####################################################################
+    # Builds the index for everything added and removes the scratch
+    # files. Returns a CompactVectorStore at path when the document has
+    # min_chunks chunks or more, otherwise a regular FAISS store.
+    # embedding is the model used to embed search queries.
+    #####################################################################
+    def finish(self, embedding, min_chunks: int = PDF_COMPACT_MIN_CHUNKS):
+        for f in (self._chunks, self._metadata, self._vectors):
+            f.close()
+        try:
+            if self.count < min_chunks:
+                return self._to_flat(embedding)
+            self._write_index()
+            try:
+                os.replace(self.scratch, self.path)
+            except OSError:
+                # Another worker finished the same document first; use its copy
+                if not is_compact_index(self.path):
+                    raise
+            return CompactVectorStore(self.path, embedding)
+        finally:
+            self.abort()
+
+
+    #####################################################################
+    # Removes the scratch files (if still there).
+    #####################################################################
+    def abort(self):
+        for f in (self._chunks, self._metadata, self._vectors):
+            f.close()
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+
+    # ------------------ internal helpers ------------------
+
+    def _vector_map(self):
+        return np.memmap(os.path.join(self.scratch, "vectors.f32"), dtype=np.float32, mode="r",
+                         shape=(self.count, self.dim))
+
+    def _write_index(self):
+        vectors = self._vector_map()
+        factory = _factory_for(self.count, self.dim)
+        index = faiss.index_factory(self.dim, factory, faiss.METRIC_L2)
+        if not index.is_trained:
+            ivf = faiss.try_extract_index_ivf(index)
+            samples = MAX_TRAINING_VECTORS
+            if ivf is not None:
+                samples = min(samples, ivf.nlist * TRAINING_VECTORS_PER_CLUSTER)
+            step = max(1, self.count // samples)
+            index.train(np.ascontiguousarray(vectors[::step]))
+        for start in range(0, self.count, ADD_BLOCK):
+            index.add(np.ascontiguousarray(vectors[start:start + ADD_BLOCK]))
+        faiss.write_index(index, os.path.join(self.scratch, VECTORS_FILE))
+        del vectors
+        os.remove(os.path.join(self.scratch, "vectors.f32"))
+
+        np.save(os.path.join(self.scratch, OFFSETS_FILE), np.asarray(self._offsets, dtype=np.int64))
+        with open(os.path.join(self.scratch, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "count": self.count, "dim": self.dim, "factory": factory}, f)
+
+    def _to_flat(self, embedding):
+        reader = _ChunkReader(self.scratch, np.asarray(self._offsets, dtype=np.int64))
+        try:
+            vectors = self._vector_map()
+            documents = [reader.document(i) for i in range(self.count)]
+            return FAISS.from_embeddings(
+                [(doc.page_content, vector) for doc, vector in zip(documents, np.asarray(vectors))],
+                embedding,
+                metadatas=[doc.metadata for doc in documents]
+            )
+        finally:
+            reader.close()
+
+
+
+#####################################################################
+# Reads chunk text and metadata from the memory-mapped chunk files of
+# an index directory.
+#####################################################################
+class _ChunkReader:
+
+    def __init__(self, path: str, offsets):
+        self.offsets = offsets
+        self._files = []
+        self.chunks = self._map(os.path.join(path, CHUNKS_FILE))
+        self.metadata = self._map(os.path.join(path, METADATA_FILE))
+
+    def _map(self, filename: str):
+        f = open(filename, "rb")
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def document(self, i: int) -> Document:
+        (text_start, meta_start), (text_end, meta_end) = self.offsets[i], self.offsets[i + 1]
+        return Document(
+            page_content=self.chunks[text_start:text_end].decode("utf-8"),
+            metadata=json.loads(self.metadata[meta_start:meta_end])
+        )
+
+    def close(self):
+        for mapped in (self.chunks, self.metadata):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for f in self._files:
+            f.close()
+
+
+
+#####################################################################
+# LangChain vector store over a compact index directory. Vectors and
+# chunk text stay memory-mapped; Documents are only created for the
+# chunks a search returns. Read-only: indexes are built by
+# CompactIndexWriter.
+#####################################################################
+class CompactVectorStore(VectorStore):
+
+    def __init__(self, path: str, embedding, nprobe: int = PDF_IVF_NPROBE):
+        self.path = path
+        self.embedding = embedding
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.index = faiss.read_index(os.path.join(path, VECTORS_FILE), faiss.IO_FLAG_MMAP_IFC)
+
+        # Search parameters (the IVF ones are referenced by the refine ones, so both are kept)
+        factory = self.manifest["factory"]
+        self._ivf_params = faiss.SearchParametersIVF(nprobe=nprobe) if "IVF" in factory else None
+        self._params = self._ivf_params
+        if "Refine" in factory:
+            self._params = faiss.IndexRefineSearchParameters(
+                k_factor=REFINE_K_FACTOR, base_index_params=self._ivf_params
+            )
+        self._reader = _ChunkReader(path, np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r"))
+
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+
+    #####################################################################
+    # Memory this index can occupy, used as its size in the index cache:
+    # its files (vector codes, refine vectors, chunk text, offsets), whose
+    # pages are resident once searched, plus the IVF centroids, if any,
+    # which are loaded into private memory.
+    #####################################################################
+    def memory_bytes(self) -> int:
+        mapped = sum(
+            os.path.getsize(os.path.join(self.path, filename))
+            for filename in (VECTORS_FILE, CHUNKS_FILE, METADATA_FILE, OFFSETS_FILE)
+        )
+        if "IVF" not in self.manifest["factory"]:
+            return mapped
+        nlist = int(self.manifest["factory"].split(",")[0][3:])
+        return mapped + nlist * self.manifest["dim"] * 4
+
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, **kwargs):
+        query = np.asarray([embedding], dtype=np.float32)
+        distances, ids = self.index.search(query, k, params=self._params)
+        return [
+            (self._reader.document(int(i)), float(distance))
+            for distance, i in zip(distances[0], ids[0]) if i >= 0
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+
+    #####################################################################
+    # Builds a compact index at path from texts (required by the
+    # VectorStore interface; PDF indexing uses CompactIndexWriter).
+    #####################################################################
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, path: str, **kwargs):
+        texts = list(texts)
+        writer = CompactIndexWriter(path)
+        writer.add(texts, embedding.embed_documents(texts), metadatas or [{} for _ in texts])
+        return writer.finish(embedding, min_chunks=0)
+
+
+
+# Exported names from this module
+__all__ = [
+    "COMPACT_INDEX_ENABLED",
+    "CompactIndexWriter",
+    "CompactVectorStore",
+    "is_compact_index",
+    "remove_compact_index",
+]
@@ -0,0 +1,116 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    condenseQuestion.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# condenseQuestion.py – Skips the "condense question" LLM call for self-contained follow-ups.
+#
+# Before retrieving, a ConversationalRetrievalChain asks the LLM to rewrite every follow-up
+# question into a standalone one using the chat history. That is a second, serial model call on
+# every PDF turn after the first, even when the question already stands on its own
+# ("What does the paper say about mitochondria?").
+#
+# SelectiveCondenseChain takes the place of the chain's question generator and checks each
+# question locally first. The question is only sent to the LLM when it has a reference that
+# needs the conversation to resolve:
+# - Pronouns and pointing words ("it", "they", "this", "that one", "the former", "above")
+# - Continuations ("tell me more", "another example", "why else", "and ...", "what about ...")
+# - Questions of one or two words ("Why?", "Examples?")
+# Any other question is used as-is for retrieval and answering. When in doubt the question is
+# condensed, so the worst case is the old behaviour (one extra call).
+#
+# Configuration (environment variables):
+# - PDF_CONDENSE_MODE   -> "auto" (default): condense only questions with references,
+#                          "always": condense every follow-up (the original behaviour)
+#
+# Exports:
+# - needs_condensing        -> Whether a follow-up question depends on the conversation
+# - SelectiveCondenseChain  -> Question generator that skips the LLM for standalone questions
+################################################################################################
+
+
+
+import os
+import re
+
+import metrics
+from promptBudget import BudgetedLLMChain
+
+
+PDF_CONDENSE_MODE = os.getenv("PDF_CONDENSE_MODE", "auto").lower()
+
+# Words that point back at something said earlier in the conversation
+REFERENCE_WORDS = frozenset((
+    "it", "its", "it's", "itself", "this", "that", "these", "those",
+    "they", "them", "their", "theirs", "themselves", "he", "him", "his", "she", "her", "hers",
+    "there", "then", "former", "latter", "above", "previous", "previously", "earlier",
+    "same", "aforementioned", "one", "ones", "else", "other", "another", "again",
+    "more", "further", "also", "too", "instead", "elaborate", "continue", "example",
+    "examples",
+))
+
+# Openings that continue the previous turn ("and the second one?", "what about chapter 2?")
+CONTINUATION_PREFIXES = ("and ", "but ", "so ", "or ", "what about ", "how about ")
+
+# Questions shorter than this many words can't stand on their own
+MIN_STANDALONE_WORDS = 3
+
+_WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+
+#####################################################################
+# Returns True when a follow-up question refers to the conversation
+# so far and must be rewritten before it can be used for retrieval.
+#####################################################################
+def needs_condensing(question: str) -> bool:
+    if PDF_CONDENSE_MODE == "always":
+        return True
+    text = question.strip().lower()
+    words = _WORD.findall(text)
+    if len(words) < MIN_STANDALONE_WORDS:
+        return True
+    if text.startswith(CONTINUATION_PREFIXES):
+        return True
+    return any(word in REFERENCE_WORDS for word in words)
+
+
+
+#####################################################################
+# Question generator for a ConversationalRetrievalChain that returns
+# self-contained questions unchanged and only calls the LLM for ones
+# that need the chat history. Counts both outcomes in the metrics.
+# Rewrite prompts are held to the chain's prompt token budget.
+#####################################################################
+class SelectiveCondenseChain(BudgetedLLMChain):
+
+    def _call(self, inputs, run_manager=None):
+        if self._skip(inputs):
+            return {self.output_key: inputs["question"]}
+        return super()._call(inputs, run_manager)
+
+    async def _acall(self, inputs, run_manager=None):
+        if self._skip(inputs):
+            return {self.output_key: inputs["question"]}
+        return await super()._acall(inputs, run_manager)
+
+    def _skip(self, inputs: dict) -> bool:
+        skip = not needs_condensing(inputs["question"])
+        metrics.questions_condensed.inc(1, self.name or "LLMChain", "skipped" if skip else "condensed")
+        return skip
+
+
+
+# Exported names from this module
+__all__ = [
+    "needs_condensing",
+    "SelectiveCondenseChain",
+]
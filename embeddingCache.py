@@ -0,0 +1,229 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    embeddingCache.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# embeddingCache.py – Persistent, chunk-level cache in front of the embedding model.
+#
+# Different PDFs (revised editions, overlapping lecture notes) often produce identical text
+# chunks. This module wraps an Embeddings object so each chunk is looked up by a hash of
+# (embedding model, normalized chunk text) in a SQLite file before calling the API. Vectors
+# are stored as compact float32 blobs, and SQLite is configured to memory-map the file so
+# cache reads are served straight from the OS page cache instead of read() calls.
+#
+# Each entry records when it was last used. Every so often the cache is checked against its
+# row cap and the least recently used entries are deleted, so the file stops growing once it
+# is full (SQLite reuses the freed pages rather than shrinking the file).
+#
+# Configuration (environment variables):
+# - EMBEDDING_CACHE_ENABLED  -> "true" (default) or "false"
+# - EMBEDDING_CACHE_PATH     -> SQLite file for cached vectors (default: system temp dir)
+# - EMBEDDING_CACHE_MMAP_MB  -> Size of the memory-mapped read window (default 256)
+# - EMBEDDING_CACHE_MAX_ROWS -> Max cached chunks before LRU pruning (default 100000,
+#                               about 600 MB of 1536-dimension vectors)
+#
+# Exports:
+# - CachedEmbeddings        -> Embeddings wrapper with a persistent chunk cache
+# - with_cache              -> Wrap an embeddings object when caching is enabled
+# - embedding_cache_stats   -> Hit/miss counters for the cache
+################################################################################################
+
+
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ai_tutor_embeddings.db")
+)
+EMBEDDING_CACHE_MMAP_MB = int(os.getenv("EMBEDDING_CACHE_MMAP_MB", "256"))
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "100000"))
+
+# How often (in stored batches) the row cap is checked
+PRUNE_EVERY = 100
+
+# Fraction of the cap freed by each prune, so pruning isn't needed on every check
+PRUNE_SLACK = 0.1
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+# Process-wide counters, shared by every CachedEmbeddings instance
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+
+#####################################################################
+# Hashes chunk text together with the model name. Whitespace is
+# collapsed so re-flowed copies of the same text share an entry.
+#####################################################################
+def _chunk_key(model: str, text: str) -> str:
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+
+#####################################################################
+# Embeddings wrapper that serves repeated chunks from a SQLite cache
+# and only sends novel chunks to the underlying model.
+#####################################################################
+class CachedEmbeddings(Embeddings):
+
+    def __init__(self, underlying, path: str = None):
+        self.underlying = underlying
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+        self.path = path or EMBEDDING_CACHE_PATH
+        self._local = threading.local()
+        self._stores = 0
+        self._stores_lock = threading.Lock()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings"
+            " (key TEXT PRIMARY KEY, vector BLOB NOT NULL, used REAL NOT NULL DEFAULT 0)"
+        )
+        # Caches created before entries recorded their last use
+        try:
+            conn.execute("ALTER TABLE embeddings ADD COLUMN used REAL NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+
+    # One connection per thread, since embedding runs on the worker pool
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={EMBEDDING_CACHE_MMAP_MB * 1024 * 1024}")
+            self._local.conn = conn
+        return conn
+
+    def _lookup(self, keys: list) -> dict:
+        found = {}
+        conn = self._connect()
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[i:i + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        # Mark hits as recently used, so pruning keeps them
+        hits = list(found)
+        for i in range(0, len(hits), _LOOKUP_BATCH):
+            batch = hits[i:i + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            conn.execute(f"UPDATE embeddings SET used = ? WHERE key IN ({placeholders})", [time.time()] + batch)
+        return found
+
+    def _store(self, items: list):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, used) VALUES (?, ?, ?)",
+            [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        )
+        conn.execute("COMMIT")
+        with self._stores_lock:
+            self._stores += 1
+            prune = self._stores % PRUNE_EVERY == 0
+        if prune:
+            self._prune(conn)
+
+    # Deletes the least recently used entries once the cache is over its row cap
+    def _prune(self, conn):
+        rows = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if rows <= EMBEDDING_CACHE_MAX_ROWS:
+            return
+        excess = rows - int(EMBEDDING_CACHE_MAX_ROWS * (1 - PRUNE_SLACK))
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used LIMIT ?)", (excess,)
+        )
+
+
+    #####################################################################
+    # Embeds document chunks, calling the model only for cache misses.
+    #####################################################################
+    def embed_documents(self, texts: list) -> list:
+        keys = [_chunk_key(self.model, text) for text in texts]
+        cached = self._lookup(keys)
+
+        # Embed each novel chunk once, even if it repeats within this call
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self._store(new_items)
+            cached.update(new_items)
+
+        with _stats_lock:
+            _stats["misses"] += len(missing)
+            _stats["hits"] += len(texts) - len(missing)
+        return [cached[key] for key in keys]
+
+
+    #####################################################################
+    # Queries are short and rarely repeat verbatim, so they are not cached.
+    #####################################################################
+    def embed_query(self, text: str) -> list:
+        return self.underlying.embed_query(text)
+
+
+
+#####################################################################
+# Wraps an embeddings object in the cache when caching is enabled.
+#####################################################################
+def with_cache(underlying):
+    if not EMBEDDING_CACHE_ENABLED:
+        return underlying
+    return CachedEmbeddings(underlying)
+
+
+
+#####################################################################
+# Returns chunk cache hits, misses and hit ratio for this process.
+#####################################################################
+def embedding_cache_stats() -> dict:
+    with _stats_lock:
+        total = _stats["hits"] + _stats["misses"]
+        return {
+            "enabled": EMBEDDING_CACHE_ENABLED,
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+            "hit_ratio": _stats["hits"] / total if total else 0.0,
+        }
+
+
+
+# Exported names from this module
+__all__ = [
+    "CachedEmbeddings",
+    "with_cache",
+    "embedding_cache_stats",
+]
@@ -0,0 +1,142 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    embeddingPipeline.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# embeddingPipeline.py – Batched, concurrent embedding of document chunks.
+#
+# Embedding a large PDF one request at a time leaves most of the time waiting on the network.
+# This module groups chunks into requests sized by token count, keeps a bounded number of
+# embedding requests in flight at once, retries rate-limited requests with exponential
+# backoff, and hands each finished batch back in document order so the caller can add it to
+# the vector index while later batches are still being embedded.
+#
+# Configuration (environment variables):
+# - EMBED_BATCH_TOKENS      -> Max tokens per embedding request (default 8000)
+# - EMBED_MAX_CONCURRENCY   -> Max embedding requests in flight per worker process (default 4)
+# - EMBED_MAX_RETRIES       -> Retries for a rate-limited request (default 5)
+#
+# Exports:
+# - token_batches           -> Group chunks into batches capped by token count
+# - is_rate_limit_error     -> Whether an exception is an upstream HTTP 429
+# - embed_with_retry        -> Embed one batch, backing off on rate-limit errors
+# - embed_batches           -> Embed batches concurrently, yielding results in order
+################################################################################################
+
+
+
+import os
+import time
+import random
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import rateLimiter
+from tokenCounter import count_tokens
+
+
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "8000"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+
+# First retry delay in seconds; doubles on every further retry
+EMBED_BACKOFF_SECONDS = 1.0
+
+# Pool used for embedding requests. It is separate from the LLM worker
+# pool because indexing jobs themselves run on that pool.
+executor = ThreadPoolExecutor(max_workers=EMBED_MAX_CONCURRENCY, thread_name_prefix="embed-worker")
+
+
+
+#####################################################################
+# Groups chunks (LangChain Documents) into batches of at most
+# max_tokens tokens and max_chunks chunks. A single chunk larger than
+# the token cap still gets its own batch.
+#####################################################################
+def token_batches(chunks, max_tokens: int = None, max_chunks: int = None):
+    max_tokens = max_tokens or EMBED_BATCH_TOKENS
+    batch, batch_tokens = [], 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk.page_content)
+        if batch and (batch_tokens + tokens > max_tokens or (max_chunks and len(batch) >= max_chunks)):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+
+#####################################################################
+# Returns True if an exception is an upstream rate-limit (HTTP 429).
+#####################################################################
+def is_rate_limit_error(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or "RateLimit" in type(error).__name__
+
+
+
+#####################################################################
+# Embeds one batch of texts, retrying rate-limit errors (and being
+# shed by a full limiter queue) with exponential backoff plus jitter.
+# Other errors are raised at once.
+#####################################################################
+def embed_with_retry(embeddings, texts: list) -> list:
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            retryable = is_rate_limit_error(e) or isinstance(e, rateLimiter.Overloaded)
+            if attempt == EMBED_MAX_RETRIES or not retryable:
+                raise
+            delay = EMBED_BACKOFF_SECONDS * (2 ** attempt)
+            time.sleep(delay + random.uniform(0, delay / 2))
+
+
+
+#####################################################################
+# Embeds batches of chunks with up to max_in_flight requests running
+# at once. Batches are pulled lazily from the iterator and results
+# are yielded as (chunks, vectors) in the original order.
+#####################################################################
+def embed_batches(embeddings, batches, max_in_flight: int = None):
+    max_in_flight = max_in_flight or EMBED_MAX_CONCURRENCY
+    in_flight = deque()
+    try:
+        for batch in batches:
+            texts = [chunk.page_content for chunk in batch]
+            # Each request runs in a copy of the caller's context (e.g. its rate-limit priority)
+            call = contextvars.copy_context().run
+            in_flight.append((batch, executor.submit(call, embed_with_retry, embeddings, texts)))
+            if len(in_flight) >= max_in_flight:
+                done_batch, future = in_flight.popleft()
+                yield done_batch, future.result()
+        while in_flight:
+            done_batch, future = in_flight.popleft()
+            yield done_batch, future.result()
+    finally:
+        # Don't leave queued requests running if the caller stops early
+        for _, future in in_flight:
+            future.cancel()
+
+
+
+# Exported names from this module
+__all__ = [
+    "token_batches",
+    "is_rate_limit_error",
+    "embed_with_retry",
+    "embed_batches",
+]
@@ -19,7 +19,7 @@
 #
 # Exports:
 # - A conversation prompt template for unstructured chat
-# - Utility functions to manage per-user memory using LangChain's `ConversationSummaryMemory`
+# - Utility functions to manage per-user memory using a token-budgeted `IncrementalSummaryMemory`
 # - The language model instance used in Free Chat
 ################################################################################################
 
@@ -29,36 +29,50 @@ import os
 import warnings
 
 # Langchain
-from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from langchain_community.chat_models import ChatOpenAI
-from langchain.memory import ConversationSummaryMemory
+
+# LLMChain with per-chain prompt token budgets
+from promptBudget import BudgetedLLMChain
+
+# Shared OpenAI clients and per-mode model settings
+import llmProvider
+
+# Token-budgeted summary memory
+from summaryMemory import IncrementalSummaryMemory, memory_size, memory_to_dict, memory_from_dict, bind_persistence
+
+# Bounded per-user session storage
+from sessionStore import SessionStore
 
 warnings.filterwarnings('ignore')
 
 # Load API key from env variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Define the GPT Model
-llm_model = "gpt-4o-mini"
-llm = ChatOpenAI(temperature=0.7, model=llm_model)
+# Define the GPT Model (streaming so tokens can be forwarded to SSE clients)
+llm = llmProvider.get_chat_model("free", streaming=True)
+
 
+# Settings shared by every user's conversation memory in this mode
+memory_settings = {"llm": llm, "memory_key": "chat_history", "input_key": "userResponse"}
 
-# In-memory dictionary for storing user-specific memory
-user_memories = {}
+# Session store holding user-specific memory (bounded, evicts idle users)
+user_memories = SessionStore(
+    "free_chat_memories",
+    sizeof=memory_size,
+    dump=memory_to_dict,
+    load=lambda data: memory_from_dict(data, **memory_settings)
+)
 
 
 
 #####################################################################
 # Retrieves or creates conversation memory tied to a specific user.
-# Returns a ConversationSummaryMemory object used for dialogue recall.
+# Returns an IncrementalSummaryMemory object used for dialogue recall.
 #####################################################################
 def get_user_memory(user_id: str):
-    if user_id not in user_memories:
-        user_memories[user_id] = ConversationSummaryMemory(
-            llm=llm, memory_key="chat_history", input_key="userResponse"
-        )
-    return user_memories[user_id]
+    memory = user_memories.get_or_create(user_id, lambda: IncrementalSummaryMemory(**memory_settings))
+    bind_persistence(user_memories, user_id, memory)
+    return memory
 
 
 
@@ -66,8 +80,7 @@ def get_user_memory(user_id: str):
 # Clears the existing memory for the specified user.
 #####################################################################
 def clear_user_memory(user_id: str):
-    if user_id in user_memories:
-        user_memories[user_id].clear()
+    user_memories.delete(user_id)
 
 
 
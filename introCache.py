@@ -0,0 +1,192 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    introCache.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# introCache.py – Pools of pre-generated session intros, per mode and subject.
+#
+# The intro prompts depend only on the subject, and most sessions start on a handful of
+# popular subjects. Instead of waiting on a fresh LLM call for every session, each IntroCache
+# keeps a small pool of generated intros per subject. A session start takes one intro from
+# the pool (each variant is served once, so users still get variety) and a background task
+# tops the pool back up. A subject's first request, or one arriving while its pool is empty,
+# is generated on demand as before. Subjects are only pooled once they have been requested a
+# second time, so one-off free-form subjects cost a single LLM call.
+#
+# Subjects are kept in a SessionStore, so unpopular subjects are dropped by LRU and idle TTL.
+#
+# Configuration (environment variables):
+# - INTRO_CACHE_ENABLED      -> "true" (default) or "false"
+# - INTRO_POOL_SIZE          -> Pre-generated intros kept per subject (default 3)
+# - INTRO_CACHE_SUBJECTS     -> Max subjects kept per mode (default 100)
+# - INTRO_CACHE_TTL_SECONDS  -> Idle time before a subject's pool is dropped (default 3600)
+#
+# Exports:
+# - IntroCache               -> Per-subject intro pools for one intro chain
+# - intro_cache_stats        -> Hit/miss counters per mode and subject
+################################################################################################
+
+
+
+import os
+import asyncio
+
+import chainExecutor
+import rateLimiter
+from sessionStore import SessionStore
+
+
+INTRO_CACHE_ENABLED = os.getenv("INTRO_CACHE_ENABLED", "true").lower() == "true"
+INTRO_POOL_SIZE = int(os.getenv("INTRO_POOL_SIZE", "3"))
+INTRO_CACHE_SUBJECTS = int(os.getenv("INTRO_CACHE_SUBJECTS", "100"))
+INTRO_CACHE_TTL_SECONDS = float(os.getenv("INTRO_CACHE_TTL_SECONDS", "3600"))
+
+# Every cache created in this process, for metrics reporting
+_caches = []
+
+
+
+#####################################################################
+# Estimated size of one subject's entry (its pooled intro texts).
+#####################################################################
+def _entry_size(entry: dict) -> int:
+    return sum(len(text) for text in entry["pool"])
+
+
+
+#####################################################################
+# Per-subject pools of pre-generated intros for one intro chain.
+#
+# Args:
+#   name (str): Mode name used in metrics (e.g. "casual").
+#   chain: LLMChain whose only input is "subject".
+#   pool_size (int): Intros kept ready per subject.
+#####################################################################
+class IntroCache:
+
+    def __init__(self, name: str, chain, pool_size: int = None):
+        self.name = name
+        self.chain = chain
+        self.pool_size = pool_size or INTRO_POOL_SIZE
+
+        # subject key -> {"subject": str, "pool": [intro, ...], "hits": int, "misses": int}
+        self.subjects = SessionStore(
+            f"{name}_intro_cache",
+            max_entries=INTRO_CACHE_SUBJECTS,
+            ttl_seconds=INTRO_CACHE_TTL_SECONDS,
+            sizeof=_entry_size,
+        )
+
+        # Subjects with a refill task running, and the tasks themselves
+        self._refilling = set()
+        self._tasks = set()
+
+        # Totals since start (per-subject counters are lost when a subject is evicted)
+        self.hits = 0
+        self.misses = 0
+
+        _caches.append(self)
+
+
+    #####################################################################
+    # Returns an intro for subject: a pooled one when available,
+    # otherwise a freshly generated one. The subject's pool is topped
+    # up in the background, except on its first request.
+    #####################################################################
+    async def get(self, subject: str) -> str:
+        if not INTRO_CACHE_ENABLED:
+            return await chainExecutor.run_chain(self.chain, {"subject": subject})
+
+        key = subject.strip().casefold()
+        entry = self.subjects.get_or_create(
+            key, lambda: {"subject": subject, "pool": [], "hits": 0, "misses": 0}
+        )
+        if entry["pool"]:
+            entry["hits"] += 1
+            self.hits += 1
+            intro = entry["pool"].pop(0)
+            self._schedule_refill(key, entry)
+            return intro
+
+        entry["misses"] += 1
+        self.misses += 1
+        # Don't pre-generate for a subject until it has been asked for again
+        if entry["hits"] + entry["misses"] > 1:
+            self._schedule_refill(key, entry)
+        return await chainExecutor.run_chain(self.chain, {"subject": subject})
+
+
+    #####################################################################
+    # Starts a background refill for a subject unless one is running.
+    #####################################################################
+    def _schedule_refill(self, key: str, entry: dict):
+        if key in self._refilling or len(entry["pool"]) >= self.pool_size:
+            return
+        self._refilling.add(key)
+        task = asyncio.ensure_future(self._refill(key, entry))
+        # Keep a reference so the task is not garbage-collected while running
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+    async def _refill(self, key: str, entry: dict):
+        try:
+            missing = self.pool_size - len(entry["pool"])
+            # Refills are background work; interactive requests get rate-limit capacity first
+            with rateLimiter.background():
+                intros = await asyncio.gather(
+                    *(chainExecutor.run_chain(self.chain, {"subject": entry["subject"]}) for _ in range(missing)),
+                    return_exceptions=True
+                )
+            entry["pool"].extend(intro for intro in intros if isinstance(intro, str))
+            # Re-store so the entry's size is re-measured (it may also have been evicted)
+            self.subjects.set(key, entry)
+        finally:
+            self._refilling.discard(key)
+
+
+    #####################################################################
+    # Returns total hit/miss counters, plus per-subject counters for
+    # every subject currently cached.
+    #####################################################################
+    def stats(self) -> dict:
+        entries = self.subjects.items()
+        total = self.hits + self.misses
+        return {
+            "mode": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "subjects": {
+                entry["subject"]: {
+                    "hits": entry["hits"],
+                    "misses": entry["misses"],
+                    "pooled": len(entry["pool"]),
+                }
+                for _, entry in entries
+            },
+        }
+
+
+
+#####################################################################
+# Returns stats for every IntroCache in this process.
+#####################################################################
+def intro_cache_stats() -> dict:
+    return {"enabled": INTRO_CACHE_ENABLED, "modes": [cache.stats() for cache in _caches]}
+
+
+
+# Exported names from this module
+__all__ = [
+    "IntroCache",
+    "intro_cache_stats",
+]
@@ -19,7 +19,9 @@
 #
 # Exports:
 # - Chains and prompts for guiding, quizzing, and adjusting lessons for young students
-# - Functions for managing per-user memory via LangChain's `ConversationSummaryMemory`
+# - Functions for managing per-user memory via a token-budgeted `IncrementalSummaryMemory`
+# - An intro cache serving pre-generated intros per subject
+# - A quiz prefetcher generating quizzes ahead of time from the conversation
 ################################################################################################
 
 
@@ -28,36 +30,59 @@ import os
 import warnings
 
 # Langchain
-from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from langchain_community.chat_models import ChatOpenAI
-from langchain.memory import ConversationSummaryMemory
+
+# LLMChain with per-chain prompt token budgets
+from promptBudget import BudgetedLLMChain
+
+# Shared OpenAI clients and per-mode model settings
+import llmProvider
+
+# Token-budgeted summary memory
+from summaryMemory import IncrementalSummaryMemory, memory_size, memory_to_dict, memory_from_dict, bind_persistence
+
+# Bounded per-user session storage
+from sessionStore import SessionStore
+
+# Pre-generated intros per subject
+from introCache import IntroCache
+
+# Quizzes pre-generated while the user chats
+from quizPrefetch import QuizPrefetcher
 
 warnings.filterwarnings("ignore")
 
 # Load API key from env variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Define the GPT Model
-llm_model = "gpt-4o-mini"
-llm = ChatOpenAI(temperature=0.7, model=llm_model)
+# Define the GPT Model (streaming so tokens can be forwarded to SSE clients)
+llm = llmProvider.get_chat_model("kids", streaming=True)
+
+# Same model in JSON mode, for generating structured quizzes with an answer key
+quiz_llm = llmProvider.get_chat_model("kids", model_kwargs={"response_format": {"type": "json_object"}})
 
 
-# Memory dictionary to store conversation history per user
-user_memories = {}
+# Settings shared by every user's conversation memory in this mode
+memory_settings = {"llm": llm, "memory_key": "chat_history", "input_key": "userResponse"}
+
+# Session store holding conversation history per user (bounded, evicts idle users)
+user_memories = SessionStore(
+    "kids_memories",
+    sizeof=memory_size,
+    dump=memory_to_dict,
+    load=lambda data: memory_from_dict(data, **memory_settings)
+)
 
 
 
 #####################################################################
 # Retrieves or initializes memory for the given user.
-# Returns a ConversationSummaryMemory instance.
+# Returns an IncrementalSummaryMemory instance.
 #####################################################################
 def get_user_memory(user_id: str):
-    if user_id not in user_memories:
-        user_memories[user_id] = ConversationSummaryMemory(
-            llm=llm, memory_key="chat_history", input_key="userResponse"
-        )
-    return user_memories[user_id]
+    memory = user_memories.get_or_create(user_id, lambda: IncrementalSummaryMemory(**memory_settings))
+    bind_persistence(user_memories, user_id, memory)
+    return memory
 
 
 
@@ -65,8 +90,8 @@ def get_user_memory(user_id: str):
 # Clears the conversation memory for the given user.
 #####################################################################
 def clear_user_memory(user_id: str):
-    if user_id in user_memories:
-        user_memories[user_id].clear()
+    user_memories.delete(user_id)
+    kids_quiz_prefetcher.clear(user_id)
 
 
 
@@ -130,8 +155,10 @@ learning experience. Generate 5 multiple choice questions to test the user's \
 knowledge in {subject}. Each question should be labeled with a question number (1-5).\
 Draw from specific information covered in the past conversation. The goal is to test \
 if the user is grasping the information well and furthering their knowledge in {subject}. \
-Do not generate the answer key, as this quiz is being used to test the user's knowledge. \
-Make sure to put the answer choices on a new line under each question (so its visually appealing).
+Each question should have four answer choices labeled A-D, and exactly one correct answer.
+
+Respond with only a JSON object in this format (the answer key is kept hidden from the user):
+{{"questions": [{{"question": "...", "choices": {{"A": "...", "B": "...", "C": "...", "D": "..."}}, "answer": "A"}}]}}
 
 Note, this should be at an elementary school level, and you are creating this quiz for a child, \
 so make sure to use very simple language (no big words), stick to simple concepts, and keep \
@@ -149,7 +176,8 @@ kids_quizFeedback_prompt = PromptTemplate(
 Based on the user's answers, give some constructive feedback to their quiz results \
 and guide them on the path of learning. Make sure to output the question, the user's answer \
 (as a full answer choice if they only put the letter), the correct answer, and a helpful feedback explanation. In the feedback section, say something like \
-'Great Job!' if the user gets it right and 'Sorry that is incorrect' if they get it wrong. Double check on every grade \
+'Great Job!' if the user gets it right and 'Sorry that is incorrect' if they get it wrong. \
+The correct answer is marked under each question of the generated quiz; always use it. Double check on every grade \
 and make sure everything is completely factually correct, as we do not want to confuse the kids. 
 
 Note, this should be at an elementary school level, and you are creating this feedback for a child, \
@@ -167,19 +195,21 @@ Previous Coversation:
 )
 
 
-# Prompt for generating a score from the quiz results
+# Prompt for generating a score from the quiz results (fallback for quizzes without an answer key)
 kids_quizGrade_prompt = PromptTemplate(
-    input_variables=["subject", "quizFeedback"],
+    input_variables=["subject", "generatedQuiz", "userAnswers"],
     template="""Your job is to grade the user's answers to a generated {subject} quiz. \
 You should output which questions the user got correct, which they got wrong, \
-and their total score out of 5. Make sure the grade is consistent with the feedback results. \
-Whenever there is text like 'Good Job!' in the feedback section, the question is correct. \
-If the question is wrong, it will indicate that as well. 
+and their total score out of 5. Work out the correct answer to each question yourself \
+and compare it with the user's answer (a letter or the full answer choice). 
 
 Here is an example: (\nCorrect: 1 3 5 \nIncorrect: 2 4 \nScore: 3/5 \nGrade: 60%)
 
-Here is the quiz feedback:
-{quizFeedback}"""
+Generated Quiz: 
+{generatedQuiz}
+
+User's Response: 
+{userAnswers}"""
 )
 
 
@@ -212,11 +242,17 @@ Here is the previous conversation history:
 # --------------------- CHAINS ----------------------
 
 
-kids_intro_chain = LLMChain(llm=llm, prompt=kids_intro_prompt)
-kids_quizGen_chain = LLMChain(llm=llm, prompt=kids_quizGen_prompt)
-kids_quizFeedback_chain = LLMChain(llm=llm, prompt=kids_quizFeedback_prompt)
-kids_quizGrade_chain = LLMChain(llm=llm, prompt=kids_quizGrade_prompt)
-kids_continueIntro_chain = LLMChain(llm=llm, prompt=kids_continueIntro_prompt)
+kids_intro_chain = BudgetedLLMChain(llm=llm, prompt=kids_intro_prompt, name="kids_intro_chain")
+kids_quizGen_chain = BudgetedLLMChain(llm=quiz_llm, prompt=kids_quizGen_prompt, name="kids_quizGen_chain")
+kids_quizFeedback_chain = BudgetedLLMChain(llm=llm, prompt=kids_quizFeedback_prompt, name="kids_quizFeedback_chain")
+kids_quizGrade_chain = BudgetedLLMChain(llm=llm, prompt=kids_quizGrade_prompt, name="kids_quizGrade_chain")
+kids_continueIntro_chain = BudgetedLLMChain(llm=llm, prompt=kids_continueIntro_prompt, name="kids_continueIntro_chain")
+
+# Pools of ready-made intros per subject, served by /kids_intro
+kids_intro_cache = IntroCache("kids", kids_intro_chain)
+
+# Quizzes generated ahead of /kids_quiz/start from the ongoing conversation
+kids_quiz_prefetcher = QuizPrefetcher("kids", kids_quizGen_chain)
 
 
 
@@ -230,6 +266,8 @@ __all__ = [
     "kids_quizFeedback_chain",
     "kids_quizGrade_chain",
     "kids_continueIntro_chain",
+    "kids_intro_cache",
+    "kids_quiz_prefetcher",
     "kids_response_prompt", 
     "get_user_memory",
     "clear_user_memory"
@@ -0,0 +1,216 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    llmProvider.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# llmProvider.py – One place to create every OpenAI chat and embedding model.
+#
+# Each ChatOpenAI / OpenAIEmbeddings object normally builds its own OpenAI client, and with
+# it its own HTTP connection pool, so the learning modes never reuse each other's keep-alive
+# connections and pay for extra TLS handshakes. This module owns a single sync and a single
+# async OpenAI client (each with one tuned, keep-alive httpx pool, timeouts and retries) and
+# injects them into every model it hands out. The pool size also caps how many OpenAI
+# requests this worker can have open at once, and every model is admitted through the
+# process-wide rate limiters (see rateLimiter.py).
+#
+# Configuration (environment variables):
+# - LLM_MODEL                  -> Chat model for every mode (default gpt-4o-mini)
+# - LLM_TEMPERATURE_<MODE>     -> Per-mode temperature override, e.g. LLM_TEMPERATURE_KIDS=0.5
+# - OPENAI_MAX_CONNECTIONS     -> Max open connections to OpenAI per worker (default 32)
+# - OPENAI_MAX_KEEPALIVE       -> Idle keep-alive connections kept in the pool (default 16)
+# - OPENAI_TIMEOUT_SECONDS     -> Read timeout for one request (default 60)
+# - OPENAI_MAX_RETRIES         -> Retries on connection errors, 429s and 5xx (default 2)
+#
+# Exports:
+# - get_client                 -> Shared synchronous OpenAI client
+# - get_async_client           -> Shared asynchronous OpenAI client
+# - temperature_for            -> Temperature configured for a learning mode
+# - get_chat_model             -> ChatOpenAI for a mode, using the shared clients
+# - get_embeddings_model       -> OpenAIEmbeddings using the shared client
+# - RateLimitedEmbeddings      -> Embeddings wrapper admitted through the embedding limiter
+################################################################################################
+
+
+
+import os
+import threading
+
+import openai
+from langchain_core.embeddings import Embeddings
+from langchain_community.chat_models import ChatOpenAI
+from langchain_community.embeddings import OpenAIEmbeddings
+
+import metrics
+import rateLimiter
+from tokenCounter import count_tokens
+
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "16"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+# Default temperature per learning mode (overridable with LLM_TEMPERATURE_<MODE>)
+MODE_TEMPERATURES = {
+    "casual": 0.7,
+    "kids": 0.7,
+    "free": 0.7,
+    "professional": 0.5,
+    "pdf": 0.7,
+}
+
+# Connecting should be quick; only reading a long completion may take a while
+CONNECT_TIMEOUT_SECONDS = 10.0
+
+# Shared clients, created on first use
+_client = None
+_async_client = None
+_clients_lock = threading.Lock()
+
+
+
+#####################################################################
+# Settings shared by the sync and async clients. The pool limits are
+# built with the same Limits class the installed openai package uses
+# for its defaults, since its HTTP library differs between releases.
+#####################################################################
+def _client_settings() -> dict:
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+    )
+    return {
+        "max_retries": OPENAI_MAX_RETRIES,
+        "timeout": openai.Timeout(OPENAI_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        "limits": limits,
+    }
+
+
+
+#####################################################################
+# Returns the process-wide synchronous OpenAI client.
+#####################################################################
+def get_client() -> openai.OpenAI:
+    global _client
+    with _clients_lock:
+        if _client is None:
+            settings = _client_settings()
+            _client = openai.OpenAI(
+                max_retries=settings["max_retries"],
+                timeout=settings["timeout"],
+                http_client=openai.DefaultHttpxClient(limits=settings["limits"]),
+            )
+        return _client
+
+
+
+#####################################################################
+# Returns the process-wide asynchronous OpenAI client.
+#####################################################################
+def get_async_client() -> openai.AsyncOpenAI:
+    global _async_client
+    with _clients_lock:
+        if _async_client is None:
+            settings = _client_settings()
+            _async_client = openai.AsyncOpenAI(
+                max_retries=settings["max_retries"],
+                timeout=settings["timeout"],
+                http_client=openai.DefaultAsyncHttpxClient(limits=settings["limits"]),
+            )
+        return _async_client
+
+
+
+#####################################################################
+# Returns the temperature for a learning mode.
+#####################################################################
+def temperature_for(mode: str) -> float:
+    default = MODE_TEMPERATURES.get(mode, 0.7)
+    return float(os.getenv(f"LLM_TEMPERATURE_{mode.upper()}", default))
+
+
+
+#####################################################################
+# Returns a ChatOpenAI for a learning mode that sends its requests
+# through the shared clients, admitted by the chat rate limiter.
+# Extra keyword arguments (streaming, model_kwargs, ...) are passed
+# to ChatOpenAI.
+#####################################################################
+def get_chat_model(mode: str, **kwargs) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=LLM_MODEL,
+        temperature=temperature_for(mode),
+        client=get_client().chat.completions,
+        async_client=get_async_client().chat.completions,
+        max_retries=OPENAI_MAX_RETRIES,
+        callbacks=[rateLimiter.RateLimitCallback(rateLimiter.chat_limiter)],
+        **kwargs
+    )
+
+
+
+#####################################################################
+# Embeddings wrapper that admits every request through a rate limiter
+# (embedding models take no LangChain callbacks), pauses it when the
+# API answers with a 429, and times each request for the metrics.
+#####################################################################
+class RateLimitedEmbeddings(Embeddings):
+
+    def __init__(self, underlying, limiter):
+        self.underlying = underlying
+        self.limiter = limiter
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+
+    def _call(self, func, texts: list):
+        self.limiter.acquire(sum(count_tokens(text) for text in texts))
+        try:
+            with metrics.track("embedding"):
+                return func()
+        except Exception as e:
+            retry_after = rateLimiter.retry_after_for(e)
+            if retry_after is not None:
+                self.limiter.pause(retry_after)
+            raise
+
+    def embed_documents(self, texts: list) -> list:
+        return self._call(lambda: self.underlying.embed_documents(texts), texts)
+
+    def embed_query(self, text: str) -> list:
+        return self._call(lambda: self.underlying.embed_query(text), [text])
+
+
+
+#####################################################################
+# Returns OpenAIEmbeddings that send requests through the shared
+# clients, admitted by the embedding rate limiter.
+#####################################################################
+def get_embeddings_model(**kwargs) -> Embeddings:
+    embeddings = OpenAIEmbeddings(
+        client=get_client().embeddings,
+        async_client=get_async_client().embeddings,
+        max_retries=OPENAI_MAX_RETRIES,
+        **kwargs
+    )
+    return RateLimitedEmbeddings(embeddings, rateLimiter.embedding_limiter)
+
+
+
+# Exported functions from this module
+__all__ = [
+    "get_client",
+    "get_async_client",
+    "temperature_for",
+    "get_chat_model",
+    "get_embeddings_model",
+    "RateLimitedEmbeddings",
+]
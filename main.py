@@ -22,7 +22,14 @@
 #
 # It also handles:
 # - CORS middleware configuration
-# - In-memory tracking of per-user quiz state
+# - Per-user quiz state in a bounded session store (see sessionStore.py / sessionBackend.py)
+# - Grading quizzes locally against their hidden answer key (see quizGrading.py)
+# - Running blocking LLM calls on a bounded worker pool (see chainExecutor.py)
+# - Optional SSE token streaming for chat endpoints (see chainStreaming.py)
+# - 429/503 responses with Retry-After when upstream LLM calls are rate limited (see rateLimiter.py)
+# - Prometheus metrics for routes, chains, tokens, sessions and caches (see metrics.py)
+# - Opt-in per-request tracing with a Server-Timing breakdown (see requestTracing.py)
+# - Optional quiz pre-generation during chat so /quiz/start can return at once (see quizPrefetch.py)
 # - Delegation to specialized modules for memory, prompts, and LLM logic
 #
 # Exports:
@@ -31,8 +38,11 @@
 ###############################################################################################
 
 
+import asyncio
 from fastapi import FastAPI, Request, Header, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 
 # Import modules for each learning mode
 import casualLearning
@@ -41,27 +51,118 @@ import kidsLearning
 import professionalLearning
 import pdfLearning
 
+# Runs blocking LangChain calls off the event loop
+import chainExecutor
+import chainStreaming
+
+# Bounded per-user session storage
+from sessionStore import SessionStore, all_session_stats
+
+# Cache hit/miss reporting
+from embeddingCache import embedding_cache_stats
+from introCache import intro_cache_stats
+from quizPrefetch import quiz_prefetch_stats
+from semanticCache import semantic_cache_stats
+
+# Local quiz grading against a hidden answer key
+import quizGrading
+
+# Upstream rate limiting (errors become 429/503 responses)
+import rateLimiter
+
+# Latency, token and cache metrics for /metrics
+import metrics
+
+# Opt-in per-request span tracing (Server-Timing header + JSON-lines file)
+import requestTracing
+
 
 # Initialize FastAPI app
 app = FastAPI()
 
 
 #############################################
-# In-memory quiz tracking (non-persistent)
+# Error responses
+#############################################
+
+# Turns an endpoint exception into its response. Rate-limit errors (from our
+# limiter or from OpenAI) get a real 429/503 with Retry-After so clients can
+# back off; anything else keeps the usual {"error": ...} body.
+def error_response(e: Exception):
+    retry_after = rateLimiter.retry_after_for(e)
+    if retry_after is None:
+        return {"error": str(e)}
+    if isinstance(e, rateLimiter.RateLimited):
+        status, message = e.status_code, str(e)
+    else:
+        status, message = 429, "The AI service is rate limited right now. Please try again shortly."
+    return JSONResponse(
+        {"error": message, "retry_after": retry_after},
+        status_code=status,
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+
+#############################################
+# Per-user quiz tracking (bounded; shared between
+# workers when SESSION_BACKEND is configured)
 #############################################
 
-user_quizzes = {}
-kids_user_quizzes = {}
+def quiz_size(quiz_data: dict) -> int:
+    return sum(len(str(v)) for v in quiz_data.values())
+
+user_quizzes = SessionStore("casual_quizzes", sizeof=quiz_size, dump=dict, load=dict)
+kids_user_quizzes = SessionStore("kids_quizzes", sizeof=quiz_size, dump=dict, load=dict)
 
 def get_user_quiz(user_id: str):
-    if user_id not in user_quizzes:
-        user_quizzes[user_id] = {"quiz": "", "feedback": "", "grade": ""}
-    return user_quizzes[user_id]
+    return user_quizzes.get_or_create(user_id, lambda: {"quiz": "", "feedback": "", "grade": ""})
 
 def get_kids_user_quiz(user_id: str):
-    if user_id not in kids_user_quizzes:
-        kids_user_quizzes[user_id] = {"quiz": "", "feedback": "", "grade": ""}
-    return kids_user_quizzes[user_id]
+    return kids_user_quizzes.get_or_create(user_id, lambda: {"quiz": "", "feedback": "", "grade": ""})
+
+# Stores a newly generated quiz. Structured quizzes keep their answer key
+# server-side in "questions"; output that can't be parsed is kept as plain
+# text and graded by the LLM instead.
+def set_generated_quiz(quiz_data: dict, output: str) -> str:
+    try:
+        questions = quizGrading.parse_quiz(output)
+        quiz_data.update(quiz=quizGrading.format_quiz(questions), questions=questions)
+    except ValueError:
+        quiz_data.update(quiz=output, questions=None)
+    quiz_data.update(feedback="", grade="")
+    return quiz_data["quiz"]
+
+# Quiz text given to the feedback prompt, with the answer key when there is one
+def quiz_with_answers(quiz_data: dict) -> str:
+    questions = quiz_data.get("questions")
+    return quizGrading.format_quiz(questions, with_answers=True) if questions else quiz_data["quiz"]
+
+# Grades a submission locally against the answer key, or with the LLM grade
+# chain for quizzes without one. Neither needs the feedback, so this runs
+# alongside the feedback call. The grade is saved as soon as it is ready.
+async def grade_submission(store: SessionStore, user_id: str, quiz_data: dict,
+                           grade_chain, subject: str, answers: list) -> str:
+    if quiz_data.get("questions"):
+        grade = quizGrading.grade_answers(quiz_data["questions"], answers)
+        quiz_data["grade"] = quizGrading.format_grade(grade)
+    else:
+        quiz_data["grade"] = await chainExecutor.run_chain(grade_chain, {
+            "subject": subject,
+            "generatedQuiz": quiz_data["quiz"],
+            "userAnswers": answers
+        })
+    store.set(user_id, quiz_data)
+    return quiz_data["grade"]
+
+# Writes quiz feedback (blocking; run on the worker pool) and saves it. Both
+# this and grade_submission update the same quiz_data dict, so whichever
+# saves last stores both fields.
+def write_feedback(store: SessionStore, user_id: str, quiz_data: dict,
+                   feedback_chain, inputs: dict, callbacks=None) -> str:
+    quiz_data["feedback"] = feedback_chain.run(inputs, callbacks=callbacks)
+    store.set(user_id, quiz_data)
+    return quiz_data["feedback"]
 
 
 
@@ -76,10 +177,28 @@ app.add_middleware(
         "https://ai-tutor-senior-project.vercel.app"
     ],
     allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "X-User-Id"],
+    # X-Trace is only accepted when tracing can be requested (TRACE_TOKEN set)
+    allow_headers=["Content-Type", "Authorization", "X-User-Id"] + (["X-Trace"] if requestTracing.TRACE_TOKEN else []),
+    expose_headers=["Server-Timing", "X-Trace-Id"],
 )
 
 
+#############################################
+# Request latency metrics (outermost, so CORS
+# preflights and errors are timed too)
+#############################################
+
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+#############################################
+# Opt-in per-request tracing ("X-Trace:
+# <TRACE_TOKEN>" header or TRACING_ENABLED)
+#############################################
+
+app.add_middleware(requestTracing.TracingMiddleware)
+
+
 
 #############################################
 # Health/Status check endpoint
@@ -90,6 +209,53 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def get_metrics():
+    """
+    Report request, chain and LLM latency histograms, token counts,
+    session store sizes, cache hit ratios and rate limiter counters.
+    A plain def, so FastAPI renders it on its thread pool instead of
+    the event loop (store counts may query a shared backend).
+
+    Returns:
+        text/plain: Prometheus text exposition format.
+    """
+    return PlainTextResponse(metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/sessions/stats")
+def session_stats():
+    """
+    Report size and eviction counters for every per-user session store.
+    Runs on FastAPI's thread pool, like /metrics.
+
+    Returns:
+        dict: {"stores": [{"name", "entries", "bytes", "hits", "misses",
+               "evictions", "expirations"}, ...]}.
+    """
+    return {"stores": all_session_stats()}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Report hit/miss counters for the API's result caches.
+
+    Returns:
+        dict: {"embeddings": {"enabled", "hits", "misses", "hit_ratio"},
+               "intros": {"enabled", "modes": [{"mode", "hits", "misses", "hit_ratio", "subjects"}]},
+               "semantic": [{"name", "threshold", "documents", "questions", "hits", "misses", "hit_ratio"}],
+               "quizzes": {"enabled", "modes": [{"mode", "generated", "wasted", "hits", "misses",
+                                                 "hit_ratio", "waste_ratio"}]}}.
+    """
+    return {
+        "embeddings": embedding_cache_stats(),
+        "intros": intro_cache_stats(),
+        "semantic": semantic_cache_stats(),
+        "quizzes": quiz_prefetch_stats(),
+    }
+
+
 
 
 #############################################
@@ -111,23 +277,26 @@ async def get_intro(subject: str = "Astronomy", x_user_id: str = Header(...)):
     """
     try:
         memory = casualLearning.get_user_memory(x_user_id)
-        intro_text = casualLearning.intro_chain.run({"subject": subject})
-        memory.save_context({"userResponse": ""}, {"chat_history": intro_text})
+        intro_text = await casualLearning.intro_cache.get(subject)
+        await chainExecutor.save_context(memory, {"userResponse": ""}, {"chat_history": intro_text})
         return {"message": intro_text}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 
 
 @app.post("/chat")
-async def post_chat(request: Request, subject: str = "Astronomy", x_user_id: str = Header(...)):
+async def post_chat(request: Request, subject: str = "Astronomy", stream: bool = False, x_user_id: str = Header(...)):
     """
     Continue a casual-learning conversation.
 
     Expects JSON:
         {"message": "<user input>"}
 
+    Query:
+        stream (bool): If true, respond with an SSE token stream instead of JSON.
+
     Returns:
         dict: {"message": response_text} or {"error": str(e)}.
     """
@@ -137,18 +306,28 @@ async def post_chat(request: Request, subject: str = "Astronomy", x_user_id: str
         return {"error": "Missing 'message'"}
     try:
         memory = casualLearning.get_user_memory(x_user_id)
-        response_chain = casualLearning.LLMChain(
+        response_chain = casualLearning.BudgetedLLMChain(
             llm=casualLearning.llm,
             prompt=casualLearning.response_prompt,
-            memory=memory
+            memory=memory,
+            name="casual_response_chain"
         )
-        response_text = response_chain.run({
+        inputs = {
             "subject": subject,
             "userResponse": user_message
-        })
+        }
+        get_memory = lambda: casualLearning.get_user_memory(x_user_id)
+        if stream:
+            return StreamingResponse(
+                chainStreaming.stream_sse(response_chain.run, inputs),
+                media_type="text/event-stream",
+                background=BackgroundTask(casualLearning.quiz_prefetcher.schedule, x_user_id, subject, get_memory)
+            )
+        response_text = await chainExecutor.run_chain(response_chain, inputs)
+        await casualLearning.quiz_prefetcher.schedule(x_user_id, subject, get_memory)
         return {"message": response_text}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 
@@ -164,14 +343,15 @@ async def clear_memory(x_user_id: str = Header(...)):
         casualLearning.clear_user_memory(x_user_id)
         return {"status": "Memory cleared"}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 
 @app.get("/quiz/start")
 async def start_quiz(subject: str = "Astronomy", x_user_id: str = Header(...)):
     """
-    Generate a 5-question quiz based on current memory.
+    Generate a 5-question quiz based on current memory. A quiz pre-generated
+    during the chat is served instead when the conversation hasn't changed since.
 
     Returns:
         dict: {"quiz": "<quiz text>"} or {"error": str(e)}.
@@ -179,50 +359,60 @@ async def start_quiz(subject: str = "Astronomy", x_user_id: str = Header(...)):
     try:
         memory = casualLearning.get_user_memory(x_user_id)
         quiz_data = get_user_quiz(x_user_id)
-        quiz_data["quiz"] = casualLearning.quizGen_chain.run({
-            "subject": subject,
-            "previousChat": memory.chat_memory
-        })
+        output = await casualLearning.quiz_prefetcher.take(x_user_id, subject, memory)
+        set_generated_quiz(quiz_data, output)
+        user_quizzes.set(x_user_id, quiz_data)
         return {"quiz": quiz_data["quiz"]}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 
 @app.post("/quiz/submit")
-async def submit_quiz(request: Request, subject: str = "Astronomy", x_user_id: str = Header(...)):
+async def submit_quiz(request: Request, subject: str = "Astronomy", stream: bool = False, x_user_id: str = Header(...)):
     """
     Grade a submitted 5-question quiz and provide feedback.
 
     Expects JSON:
         {"answers": ["A", "B", "C", "D", "E"]}
 
+    Query:
+        stream (bool): If true, respond with SSE: a "grade" event first, then
+            the feedback as a token stream (see chainStreaming.py).
+
     Returns:
         dict: {"feedback": "<text>", "grade": "<text>"} or {"error": str(e)}.
     """
     data = await request.json()
     answers = data.get("answers", [])
-    if not isinstance(answers, list) or len(answers) != 5:
-        return {"error": "Expected 'answers' as a list of 5 answers"}
+    if not isinstance(answers, list) or len(answers) != quizGrading.QUIZ_QUESTIONS:
+        return {"error": f"Expected 'answers' as a list of {quizGrading.QUIZ_QUESTIONS} answers"}
     try:
         memory = casualLearning.get_user_memory(x_user_id)
         quiz_data = get_user_quiz(x_user_id)
-        quiz_data["feedback"] = casualLearning.quizFeedback_chain.run({
+        inputs = {
             "subject": subject,
-            "previousChat": memory.chat_memory,
-            "generatedQuiz": quiz_data["quiz"],
+            "previousChat": memory.buffer,
+            "generatedQuiz": quiz_with_answers(quiz_data),
             "userAnswers": answers
-        })
-        quiz_data["grade"] = casualLearning.quizGrade_chain.run({
-            "subject": subject,
-            "quizFeedback": quiz_data["feedback"]
-        })
+        }
+        # Grade and feedback are independent, so they run at the same time
+        grade = asyncio.ensure_future(grade_submission(
+            user_quizzes, x_user_id, quiz_data, casualLearning.quizGrade_chain, subject, answers
+        ))
+        feedback_args = (user_quizzes, x_user_id, quiz_data, casualLearning.quizFeedback_chain, inputs)
+        if stream:
+            return StreamingResponse(
+                chainStreaming.stream_sse_after("grade", grade, chainStreaming.stream_sse(write_feedback, *feedback_args)),
+                media_type="text/event-stream"
+            )
+        await asyncio.gather(chainExecutor.run_blocking(write_feedback, *feedback_args), grade)
         return {
             "feedback": quiz_data["feedback"],
             "grade": quiz_data["grade"]
         }
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 @app.get("/continue")
@@ -236,16 +426,16 @@ async def continue_lesson(subject: str = "Astronomy", x_user_id: str = Header(..
     try:
         memory = casualLearning.get_user_memory(x_user_id)
         quiz_data = get_user_quiz(x_user_id)
-        continuation = casualLearning.continueIntro_chain.run({
+        continuation = await chainExecutor.run_chain(casualLearning.continueIntro_chain, {
             "subject": subject,
             "quizFeedback": quiz_data["feedback"],
             "quizGrade": quiz_data["grade"],
-            "chat_history": memory.chat_memory
+            "chat_history": memory.buffer
         })
-        memory.save_context({"userResponse": ""}, {"chat_history": continuation})
+        await chainExecutor.save_context(memory, {"userResponse": ""}, {"chat_history": continuation})
         return {"message": continuation}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 
@@ -256,13 +446,16 @@ async def continue_lesson(subject: str = "Astronomy", x_user_id: str = Header(..
 
 
 @app.post("/free_chat")
-async def post_free_chat(request: Request, x_user_id: str = Header(...)):
+async def post_free_chat(request: Request, stream: bool = False, x_user_id: str = Header(...)):
     """
     Engage in an open-ended free-form chat.
 
     Expects JSON:
         {"message": "<user input>"}
 
+    Query:
+        stream (bool): If true, respond with an SSE token stream instead of JSON.
+
     Returns:
         dict: {"message": "<AI reply>"} or {"error": str(e)}.
     """
@@ -272,15 +465,22 @@ async def post_free_chat(request: Request, x_user_id: str = Header(...)):
         return {"error": "Missing 'message'"}
     try:
         memory = freeChat.get_user_memory(x_user_id)
-        chat_chain = freeChat.LLMChain(
+        chat_chain = freeChat.BudgetedLLMChain(
             llm=freeChat.llm,
             prompt=freeChat.chat_prompt,
-            memory=memory
+            memory=memory,
+            name="free_chat_chain"
         )
-        chat_text = chat_chain.run({"userResponse": user_message})
+        inputs = {"userResponse": user_message}
+        if stream:
+            return StreamingResponse(
+                chainStreaming.stream_sse(chat_chain.run, inputs),
+                media_type="text/event-stream"
+            )
+        chat_text = await chainExecutor.run_chain(chat_chain, inputs)
         return {"message": chat_text}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 @app.post("/free_chat/memory/clear")
@@ -295,7 +495,7 @@ async def clear_free_chat_memory(x_user_id: str = Header(...)):
         freeChat.clear_user_memory(x_user_id)
         return {"status": "Free chat memory cleared"}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 
@@ -319,21 +519,24 @@ async def kids_get_intro(subject: str = "Nature", x_user_id: str = Header(...)):
     """
     try:
         memory = kidsLearning.get_user_memory(x_user_id)
-        kids_intro_text = kidsLearning.kids_intro_chain.run({"subject": subject})
-        memory.save_context({"userResponse": ""}, {"chat_history": kids_intro_text})
+        kids_intro_text = await kidsLearning.kids_intro_cache.get(subject)
+        await chainExecutor.save_context(memory, {"userResponse": ""}, {"chat_history": kids_intro_text})
         return {"message": kids_intro_text}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 @app.post("/kids_chat")
-async def kids_post_chat(request: Request, subject: str = "Nature", x_user_id: str = Header(...)):
+async def kids_post_chat(request: Request, subject: str = "Nature", stream: bool = False, x_user_id: str = Header(...)):
     """
     Continue a kids-mode conversation.
 
     Expects JSON:
         {"message": "<user input>"}
 
+    Query:
+        stream (bool): If true, respond with an SSE token stream instead of JSON.
+
     Returns:
         dict: {"message": "<AI reply>"} or {"error": str(e)}.
     """
@@ -343,18 +546,28 @@ async def kids_post_chat(request: Request, subject: str = "Nature", x_user_id: s
         return {"error": "Missing 'message'"}
     try:
         memory = kidsLearning.get_user_memory(x_user_id)
-        response_chain = kidsLearning.LLMChain(
+        response_chain = kidsLearning.BudgetedLLMChain(
             llm=kidsLearning.llm,
             prompt=kidsLearning.kids_response_prompt,
-            memory=memory
+            memory=memory,
+            name="kids_response_chain"
         )
-        kids_response_text = response_chain.run({
+        inputs = {
             "subject": subject,
             "userResponse": user_message
-        })
+        }
+        get_memory = lambda: kidsLearning.get_user_memory(x_user_id)
+        if stream:
+            return StreamingResponse(
+                chainStreaming.stream_sse(response_chain.run, inputs),
+                media_type="text/event-stream",
+                background=BackgroundTask(kidsLearning.kids_quiz_prefetcher.schedule, x_user_id, subject, get_memory)
+            )
+        kids_response_text = await chainExecutor.run_chain(response_chain, inputs)
+        await kidsLearning.kids_quiz_prefetcher.schedule(x_user_id, subject, get_memory)
         return {"message": kids_response_text}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 @app.post("/kids_memory/clear")
@@ -369,13 +582,14 @@ async def clear_kids_memory(x_user_id: str = Header(...)):
         kidsLearning.clear_user_memory(x_user_id)
         return {"status": "Kids memory cleared"}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 @app.get("/kids_quiz/start")
 async def kids_start_quiz(subject: str = "Nature", x_user_id: str = Header(...)):
     """
-    Generate a 5-question quiz in kids mode.
+    Generate a 5-question quiz in kids mode. A quiz pre-generated during the
+    chat is served instead when the conversation hasn't changed since.
 
     Returns:
         dict: {"quiz": "<quiz text>"} or {"error": str(e)}.
@@ -383,49 +597,59 @@ async def kids_start_quiz(subject: str = "Nature", x_user_id: str = Header(...))
     try:
         memory = kidsLearning.get_user_memory(x_user_id)
         quiz_data = get_kids_user_quiz(x_user_id)
-        quiz_data["quiz"] = kidsLearning.kids_quizGen_chain.run({
-            "subject": subject,
-            "previousChat": memory.chat_memory
-        })
+        output = await kidsLearning.kids_quiz_prefetcher.take(x_user_id, subject, memory)
+        set_generated_quiz(quiz_data, output)
+        kids_user_quizzes.set(x_user_id, quiz_data)
         return {"quiz": quiz_data["quiz"]}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 @app.post("/kids_quiz/submit")
-async def kids_submit_quiz(request: Request, subject: str = "Nature", x_user_id: str = Header(...)):
+async def kids_submit_quiz(request: Request, subject: str = "Nature", stream: bool = False, x_user_id: str = Header(...)):
     """
     Grade a submitted 5-question kids-mode quiz and return feedback.
 
     Expects JSON:
         {"answers": ["A", "B", "C", "D", "E"]}
 
+    Query:
+        stream (bool): If true, respond with SSE: a "grade" event first, then
+            the feedback as a token stream (see chainStreaming.py).
+
     Returns:
         dict: {"feedback": "<text>", "grade": "<text>"} or {"error": str(e)}.
     """
     data = await request.json()
     answers = data.get("answers", [])
-    if not isinstance(answers, list) or len(answers) != 5:
-        return {"error": "Expected 'answers' as a list of 5 answers"}
+    if not isinstance(answers, list) or len(answers) != quizGrading.QUIZ_QUESTIONS:
+        return {"error": f"Expected 'answers' as a list of {quizGrading.QUIZ_QUESTIONS} answers"}
     try:
         memory = kidsLearning.get_user_memory(x_user_id)
         quiz_data = get_kids_user_quiz(x_user_id)
-        quiz_data["feedback"] = kidsLearning.kids_quizFeedback_chain.run({
+        inputs = {
             "subject": subject,
-            "previousChat": memory.chat_memory,
-            "generatedQuiz": quiz_data["quiz"],
+            "previousChat": memory.buffer,
+            "generatedQuiz": quiz_with_answers(quiz_data),
             "userAnswers": answers
-        })
-        quiz_data["grade"] = kidsLearning.kids_quizGrade_chain.run({
-            "subject": subject,
-            "quizFeedback": quiz_data["feedback"]
-        })
+        }
+        # Grade and feedback are independent, so they run at the same time
+        grade = asyncio.ensure_future(grade_submission(
+            kids_user_quizzes, x_user_id, quiz_data, kidsLearning.kids_quizGrade_chain, subject, answers
+        ))
+        feedback_args = (kids_user_quizzes, x_user_id, quiz_data, kidsLearning.kids_quizFeedback_chain, inputs)
+        if stream:
+            return StreamingResponse(
+                chainStreaming.stream_sse_after("grade", grade, chainStreaming.stream_sse(write_feedback, *feedback_args)),
+                media_type="text/event-stream"
+            )
+        await asyncio.gather(chainExecutor.run_blocking(write_feedback, *feedback_args), grade)
         return {
             "feedback": quiz_data["feedback"],
             "grade": quiz_data["grade"]
         }
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 @app.get("/kids_continue")
@@ -439,16 +663,16 @@ async def kids_continue_lesson(subject: str = "Nature", x_user_id: str = Header(
     try:
         memory = kidsLearning.get_user_memory(x_user_id)
         quiz_data = get_kids_user_quiz(x_user_id)
-        kids_continuation = kidsLearning.kids_continueIntro_chain.run({
+        kids_continuation = await chainExecutor.run_chain(kidsLearning.kids_continueIntro_chain, {
             "subject": subject,
             "quizFeedback": quiz_data["feedback"],
             "quizGrade": quiz_data["grade"],
-            "chat_history": memory.chat_memory
+            "chat_history": memory.buffer
         })
-        memory.save_context({"userResponse": ""}, {"chat_history": kids_continuation})
+        await chainExecutor.save_context(memory, {"userResponse": ""}, {"chat_history": kids_continuation})
         return {"message": kids_continuation}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 
@@ -459,13 +683,16 @@ async def kids_continue_lesson(subject: str = "Nature", x_user_id: str = Header(
 
 
 @app.post("/professional_chat")
-async def post_professional_chat(request: Request, x_user_id: str = Header(...)):
+async def post_professional_chat(request: Request, stream: bool = False, x_user_id: str = Header(...)):
     """
     Handle a professional-mode chat interaction.
 
     Expects JSON:
         {"message": "<user input>"}
 
+    Query:
+        stream (bool): If true, respond with an SSE token stream instead of JSON.
+
     Returns:
         dict: {"message": "<AI reply>"} or {"error": str(e)}.
     """
@@ -475,18 +702,25 @@ async def post_professional_chat(request: Request, x_user_id: str = Header(...))
         return {"error": "Missing 'message'"}
     try:
         memory = professionalLearning.get_user_memory(x_user_id)
-        chat_chain = professionalLearning.LLMChain(
+        chat_chain = professionalLearning.BudgetedLLMChain(
             llm=professionalLearning.response_chain.llm,
             prompt=professionalLearning.response_chain.prompt,
-            memory=memory
+            memory=memory,
+            name=professionalLearning.response_chain.name
         )
-        response_text = chat_chain.run({
+        inputs = {
             "userResponse": user_message,
-            "chat_history": memory.chat_memory
-        })
+            "chat_history": memory.buffer
+        }
+        if stream:
+            return StreamingResponse(
+                chainStreaming.stream_sse(chat_chain.run, inputs),
+                media_type="text/event-stream"
+            )
+        response_text = await chainExecutor.run_chain(chat_chain, inputs)
         return {"message": response_text}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 @app.post("/professional_chat/memory/clear")
@@ -501,7 +735,7 @@ async def clear_pro_chat_memory(x_user_id: str = Header(...)):
         professionalLearning.clear_user_memory(x_user_id)
         return {"status": "Pro chat memory cleared"}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 
@@ -510,37 +744,77 @@ async def clear_pro_chat_memory(x_user_id: str = Header(...)):
 # PDF Mode Endpoints
 #####################################
 
+# Background PDF indexing tasks still running in this worker
+pdf_index_tasks = set()
+
 
 @app.post("/pdf/upload")
-async def pdf_upload(file: UploadFile = File(...), x_user_id: str = Header(...)):
+async def pdf_upload(file: UploadFile = File(...), wait: bool = False, x_user_id: str = Header(...)):
     """
-    Upload and process a PDF for later question-answering.
+    Upload a PDF and start indexing it for later question-answering.
+
+    Indexing runs in the background; poll /pdf/status until it is ready.
 
     Args:
         file (UploadFile): PDF file.
+        wait (bool): If true, respond only once indexing has finished.
         x_user_id (str): Header-based user id.
 
     Returns:
-        dict: {"status": "PDF uploaded and processed successfully."}
-              or {"error": str(e)}.
+        dict: {"status": "<text>", "job_id": "<id>"} or {"error": str(e)}.
     """
     try:
-        contents = await file.read()
-        pdfLearning.handle_pdf_upload(contents, x_user_id)
+        # Read at most one byte past the limit so oversized uploads are rejected cheaply
+        contents = await file.read(pdfLearning.PDF_MAX_BYTES + 1)
         await file.close()
-        return {"status": "PDF uploaded and processed successfully."}
+
+        job = pdfLearning.start_pdf_job(x_user_id)
+        # Indexing runs on the background pool, leaving the shared pool to chat requests
+        with rateLimiter.background():
+            task = asyncio.ensure_future(
+                chainExecutor.run_blocking(pdfLearning.run_pdf_job, contents, x_user_id, job)
+            )
+
+        if wait:
+            job = await task
+            if job["status"] == "failed":
+                return {"error": job["error"]}
+            return {"status": "PDF uploaded and processed successfully.", "job_id": job["job_id"]}
+
+        # Keep a reference so the task is not garbage-collected while running
+        pdf_index_tasks.add(task)
+        task.add_done_callback(pdf_index_tasks.discard)
+        return {"status": "PDF uploaded; indexing in progress.", "job_id": job["job_id"]}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
+
+
+@app.get("/pdf/status")
+async def pdf_status(x_user_id: str = Header(...)):
+    """
+    Report progress of the user's latest PDF indexing job.
+
+    Returns:
+        dict: {"job_id", "status": "indexing" | "ready" | "failed", "pages_total",
+               "pages_parsed", "chunks_embedded", "error"} or {"error": str}.
+    """
+    job = pdfLearning.get_pdf_job(x_user_id)
+    if job is None:
+        return {"error": "No PDF upload found for this user."}
+    return job
 
 
 @app.post("/pdf/ask")
-async def pdf_ask_question(request: Request, x_user_id: str = Header(...)):
+async def pdf_ask_question(request: Request, stream: bool = False, x_user_id: str = Header(...)):
     """
     Ask a question about the uploaded PDF.
 
     Expects JSON:
         {"message": "<question>"}
 
+    Query:
+        stream (bool): If true, respond with an SSE token stream instead of JSON.
+
     Returns:
         dict: {"message": "<answer>"} or {"error": str(e)}.
     """
@@ -549,10 +823,17 @@ async def pdf_ask_question(request: Request, x_user_id: str = Header(...)):
     if not question:
         return {"error": "Missing 'message'"}
     try:
-        answer = pdfLearning.handle_pdf_question(question, x_user_id)
+        if stream:
+            # Fail fast with a JSON error if no PDF has been uploaded yet
+            pdfLearning.get_user_pdf_chain(x_user_id)
+            return StreamingResponse(
+                chainStreaming.stream_sse(pdfLearning.handle_pdf_question, question, x_user_id),
+                media_type="text/event-stream"
+            )
+        answer = await chainExecutor.run_blocking(pdfLearning.handle_pdf_question, question, x_user_id)
         return {"message": answer}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
 @app.post("/pdf/memory/clear")
@@ -567,6 +848,6 @@ async def pdf_clear_memory(x_user_id: str = Header(...)):
         pdfLearning.clear_user_pdf_chain(x_user_id)
         return {"status": "PDF memory cleared"}
     except Exception as e:
-        return {"error": str(e)}
+        return error_response(e)
 
 
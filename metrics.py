@@ -0,0 +1,429 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    metrics.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# metrics.py – Low-overhead, in-process metrics in the Prometheus text format.
+#
+# Records where request time goes without any extra dependency:
+# - HTTP latency per route, method and status (ASGI middleware, timed until the last byte,
+#   so SSE streams count their full duration)
+# - Latency per named chain (intro_chain, quizGen_chain, ...) and per tracked unit of work
+#   (memory summarization, embedding requests, FAISS search)
+# - LLM call latency and input/output tokens, attributed to the chain that made the call
+# - Prompt size per call after token budgeting (see promptBudget.py)
+# - Session store sizes, cache hit ratios, quiz prefetch counters and rate limiter counters,
+#   read at scrape time
+#
+# Chain, LLM and retriever runs are observed through a LangChain configure hook, so every
+# chain in the process is covered without passing callbacks around. Each observation is a
+# bisect plus a counter bump under a lock; token counts come from the API's reported usage
+# and are only estimated with tiktoken when a (streaming) response doesn't report them.
+# Metrics are per process: with several uvicorn workers each one reports its own.
+#
+# Configuration (environment variables):
+# - METRICS_ENABLED      -> "true" (default) or "false" to stop recording latencies
+#
+# Exports:
+# - Histogram / Counter  -> Thread-safe labelled metric families
+# - MetricsMiddleware    -> ASGI middleware recording per-route request latency
+# - MetricsCallback      -> LangChain callback recording chain/LLM latency and tokens
+# - track                -> Context manager timing a named unit of work
+# - render_metrics       -> All metrics in the Prometheus text exposition format
+# - CONTENT_TYPE         -> Content type for render_metrics output
+################################################################################################
+
+
+
+import os
+import time
+import bisect
+import threading
+import contextlib
+import contextvars
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+import requestTracing
+from tokenCounter import count_tokens, count_message_tokens
+from sessionStore import all_session_stats
+from embeddingCache import embedding_cache_stats
+from introCache import intro_cache_stats
+from semanticCache import semantic_cache_stats
+from quizPrefetch import quiz_prefetch_stats
+import rateLimiter
+
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Prefix for every metric name
+PREFIX = "aitutor"
+
+# Histogram buckets in seconds, from cache hits up to slow completions
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Histogram buckets for prompt sizes in tokens
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# Label used for retriever runs (the only retriever is the PDF mode's FAISS index)
+RETRIEVER_LABEL = "faiss_search"
+
+# Name of the unit of work the current context is inside, if any
+_work = contextvars.ContextVar("metrics_work", default=None)
+
+# Every histogram/counter created in this process, in creation order
+_families = []
+
+
+
+#####################################################################
+# Formats a label set as {a="x",b="y"}, escaping values.
+#####################################################################
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+
+#####################################################################
+# Histogram family: one set of bucket counts, a sum and a count per
+# label combination.
+#
+# Args:
+#   name (str): Metric name (without the prefix).
+#   documentation (str): HELP text.
+#   labelnames (tuple): Label names, in the order observe() takes them.
+#   buckets (tuple): Upper bounds in increasing order.
+#####################################################################
+class Histogram:
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = f"{PREFIX}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+        _families.append(self)
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        names = self.labelnames + ("le",)
+        for labels, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+
+#####################################################################
+# Counter family: one monotonically increasing value per label
+# combination.
+#####################################################################
+class Counter:
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = f"{PREFIX}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _families.append(self)
+
+    def inc(self, amount: float, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values)
+        return lines
+
+
+
+# Latency and token metrics recorded by the middleware and callbacks
+request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+chain_seconds = Histogram(
+    "chain_duration_seconds", "Latency of named chains and tracked units of work.", ("chain",)
+)
+llm_seconds = Histogram(
+    "llm_request_duration_seconds", "Latency of single LLM calls, by the chain that made them.", ("chain",)
+)
+llm_tokens = Counter(
+    "llm_tokens_total", "LLM tokens sent (input) and generated (output), by chain.", ("chain", "direction")
+)
+llm_errors = Counter(
+    "llm_errors_total", "LLM calls that raised, by chain.", ("chain",)
+)
+
+# Prompt sizes after budgeting (see promptBudget.py)
+prompt_tokens = Histogram(
+    "prompt_tokens", "Prompt tokens per call after budgeting, by chain.", ("chain",), buckets=TOKEN_BUCKETS
+)
+prompts_trimmed = Counter(
+    "prompts_trimmed_total", "Prompts trimmed to fit their token budget, by chain.", ("chain",)
+)
+questions_condensed = Counter(
+    "condense_questions_total", "Follow-up questions rewritten by the LLM or used as-is, by chain.", ("chain", "outcome")
+)
+
+
+
+#####################################################################
+# Times the block as one named unit of work (e.g. "embedding").
+# LLM calls made inside it are attributed to it, and chains run
+# inside it are not timed separately. Traced requests also get a
+# span for it (see requestTracing.py).
+#####################################################################
+@contextlib.contextmanager
+def track(name: str):
+    token = _work.set(name)
+    start = time.perf_counter()
+    try:
+        with requestTracing.span(name):
+            yield
+    finally:
+        _work.reset(token)
+        if METRICS_ENABLED:
+            chain_seconds.observe(time.perf_counter() - start, name)
+
+
+
+#####################################################################
+# LangChain callback that times chain, LLM and retriever runs and
+# counts LLM tokens. One instance is registered for the whole process
+# (see the configure hook below), so it is thread-safe.
+#####################################################################
+class MetricsCallback(BaseCallbackHandler):
+
+    def __init__(self):
+        # run id -> (label, start time, prompt messages or strings)
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    # ------------------ chains ------------------
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+        if _work.get() is None:
+            name = kwargs.get("name") or (serialized or {}).get("id", ["chain"])[-1]
+            self._start(run_id, name)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id, chain_seconds)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, chain_seconds)
+
+    # ------------------ retrievers ------------------
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id, RETRIEVER_LABEL)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._finish(run_id, chain_seconds)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, chain_seconds)
+
+    # ------------------ LLM calls ------------------
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, self._label_for(parent_run_id), messages)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, self._label_for(parent_run_id), prompts)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._finish(run_id, llm_seconds)
+        if run is None:
+            return
+        label, _, prompt = run
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        input_tokens = usage.get("prompt_tokens")
+        output_tokens = usage.get("completion_tokens")
+        # Streaming responses report no usage; estimate it locally instead
+        if input_tokens is None:
+            input_tokens = sum(
+                count_tokens(item) if isinstance(item, str) else count_message_tokens(item)
+                for item in prompt
+            )
+        if output_tokens is None:
+            output_tokens = sum(count_tokens(g.text) for batch in response.generations for g in batch)
+        llm_tokens.inc(input_tokens, label, "input")
+        llm_tokens.inc(output_tokens, label, "output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._finish(run_id, llm_seconds)
+        if run is not None:
+            llm_errors.inc(1, run[0])
+
+    # ------------------ internal helpers ------------------
+
+    def _start(self, run_id, label: str, prompt=None):
+        with self._lock:
+            self._runs[run_id] = (label, time.perf_counter(), prompt)
+
+    def _finish(self, run_id, histogram: Histogram):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is not None:
+            histogram.observe(time.perf_counter() - run[1], run[0])
+        return run
+
+    # LLM calls belong to the tracked unit of work, else to their parent chain
+    def _label_for(self, parent_run_id) -> str:
+        work = _work.get()
+        if work is not None:
+            return work
+        with self._lock:
+            parent = self._runs.get(parent_run_id)
+        return parent[0] if parent else "none"
+
+
+
+#####################################################################
+# ASGI middleware recording the latency of every HTTP request by its
+# route template (e.g. "/pdf/ask"), method and status code.
+#####################################################################
+class MetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_seconds.observe(time.perf_counter() - start, scope["method"], route, status[0])
+
+
+
+#####################################################################
+# Renders one gauge or counter family from (labels, value) samples.
+#####################################################################
+def _render_samples(name: str, kind: str, documentation: str, labelnames: tuple, samples) -> list:
+    name = f"{PREFIX}_{name}"
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_format_labels(labelnames, labels)} {value}" for labels, value in samples)
+    return lines
+
+
+
+#####################################################################
+# Session store, cache and rate limiter figures, read from each
+# module's stats at scrape time.
+#####################################################################
+def _stats_lines() -> list:
+    stores = all_session_stats()
+    caches = [("embeddings", embedding_cache_stats())]
+    caches += [(f"intro_{mode['mode']}", mode) for mode in intro_cache_stats()["modes"]]
+    caches += [(cache["name"], cache) for cache in semantic_cache_stats()]
+    prefetchers = quiz_prefetch_stats()["modes"]
+    caches += [(f"quiz_prefetch_{mode['mode']}", mode) for mode in prefetchers]
+    limiters = [rateLimiter.chat_limiter.stats(), rateLimiter.embedding_limiter.stats()]
+
+    lines = []
+    lines += _render_samples("session_store_entries", "gauge", "Entries held per session store.",
+                             ("store",), [((s["name"],), s["entries"]) for s in stores])
+    lines += _render_samples("session_store_bytes", "gauge", "Estimated bytes held per session store.",
+                             ("store",), [((s["name"],), s["bytes"]) for s in stores])
+    lines += _render_samples("session_store_evictions_total", "counter", "LRU/size evictions per session store.",
+                             ("store",), [((s["name"],), s["evictions"]) for s in stores])
+    lines += _render_samples("session_store_expirations_total", "counter", "Idle TTL expirations per session store.",
+                             ("store",), [((s["name"],), s["expirations"]) for s in stores])
+    lines += _render_samples("cache_hits_total", "counter", "Result cache hits.",
+                             ("cache",), [((name,), c["hits"]) for name, c in caches])
+    lines += _render_samples("cache_misses_total", "counter", "Result cache misses.",
+                             ("cache",), [((name,), c["misses"]) for name, c in caches])
+    lines += _render_samples("cache_hit_ratio", "gauge", "Result cache hit ratio since start.",
+                             ("cache",), [((name,), c["hit_ratio"]) for name, c in caches])
+    lines += _render_samples("quiz_prefetch_generated_total", "counter", "Quizzes generated ahead of /quiz/start.",
+                             ("mode",), [((p["mode"],), p["generated"]) for p in prefetchers])
+    lines += _render_samples("quiz_prefetch_wasted_total", "counter", "Pre-generated quizzes discarded unserved.",
+                             ("mode",), [((p["mode"],), p["wasted"]) for p in prefetchers])
+    for field in ("admitted", "rejected", "shed"):
+        lines += _render_samples(f"rate_limit_{field}_total", "counter", f"Upstream calls {field} by the rate limiter.",
+                                 ("limiter",), [((l["name"],), l[field]) for l in limiters])
+    lines += _render_samples("rate_limit_waiting", "gauge", "Callers waiting on the rate limiter.",
+                             ("limiter", "priority"),
+                             [((l["name"], priority), count) for l in limiters for priority, count in l["waiting"].items()])
+    return lines
+
+
+
+#####################################################################
+# Returns every metric in the Prometheus text exposition format.
+#####################################################################
+def render_metrics() -> str:
+    lines = []
+    for family in _families:
+        lines += family.render()
+    lines += _stats_lines()
+    return "\n".join(lines) + "\n"
+
+
+
+# Observe every LangChain run in the process (inherited by child runs)
+_callback_var = contextvars.ContextVar("metrics_callback", default=MetricsCallback() if METRICS_ENABLED else None)
+register_configure_hook(_callback_var, inheritable=True)
+
+
+
+# Exported names from this module
+__all__ = [
+    "Histogram",
+    "Counter",
+    "MetricsMiddleware",
+    "MetricsCallback",
+    "track",
+    "render_metrics",
+    "CONTENT_TYPE",
+]
@@ -0,0 +1,152 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    pageParser.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# pageParser.py – Page text extraction for uploaded PDFs, optionally in a process pool.
+#
+# Extracting text with PyMuPDF is CPU-bound and holds the GIL, so on a 500+ page textbook the
+# indexing thread spends seconds parsing before much can be embedded, and other requests in the
+# same worker slow down meanwhile. With PDF_PARSE_WORKERS set, documents of at least
+# PDF_PARSE_MIN_PAGES pages are parsed in a pool of worker processes instead:
+# - The PDF is written once to a temporary file that every worker opens, rather than sending
+#   the bytes with every task
+# - The page range is split into tasks of PDF_PARSE_PAGES_PER_TASK pages, with a bounded
+#   number in flight so a large document's text isn't all held at once
+# - Pages are yielded in page order as soon as their task (and all earlier ones) finish, so the
+#   caller can split and embed the first pages while later ones are still being parsed
+# Smaller documents, or with the pool turned off, are parsed page by page on the calling
+# thread as before.
+#
+# The pool uses spawned processes (not forked ones, which would copy the server's threads and
+# locks) and is started on first use. Spawned processes import the entry script, so scripts that
+# index PDFs with the pool on need an `if __name__ == "__main__":` guard (uvicorn and gunicorn
+# already have one). The speed-up is bounded by the CPU cores available.
+#
+# Configuration (environment variables):
+# - PDF_PARSE_WORKERS         -> Parser processes per server worker; 0 (default) parses on the
+#                                calling thread
+# - PDF_PARSE_MIN_PAGES       -> Pages at which a PDF is parsed in the pool (default 100)
+# - PDF_PARSE_PAGES_PER_TASK  -> Pages parsed per pool task (default 25)
+#
+# Exports:
+# - page_texts   -> Yields (page number, text) for every page of an open PDF, in order
+# - shutdown     -> Stops the parser processes
+################################################################################################
+
+
+
+import os
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pymupdf
+
+
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", "0"))
+PDF_PARSE_MIN_PAGES = int(os.getenv("PDF_PARSE_MIN_PAGES", "100"))
+PDF_PARSE_PAGES_PER_TASK = int(os.getenv("PDF_PARSE_PAGES_PER_TASK", "25"))
+
+# Parser process pool, started on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+
+
+#####################################################################
+# Returns the parser process pool, starting it if needed.
+#####################################################################
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+
+#####################################################################
+# Runs in a parser process: returns the text of pages start to
+# stop - 1 of the PDF at path.
+#####################################################################
+def _parse_pages(path: str, start: int, stop: int) -> list:
+    with pymupdf.open(path) as pdf:
+        return [pdf.load_page(number).get_text() for number in range(start, stop)]
+
+
+
+#####################################################################
+# Yields (page number, text) for every page of an open PDF in page
+# order. Large documents are parsed in the process pool when it is
+# enabled; contents must then be the PDF's bytes.
+#####################################################################
+def page_texts(pdf, contents: bytes = None):
+    if PDF_PARSE_WORKERS <= 0 or contents is None or pdf.page_count < PDF_PARSE_MIN_PAGES:
+        for number in range(pdf.page_count):
+            yield number, pdf.load_page(number).get_text()
+        return
+    yield from _parallel_page_texts(contents, pdf.page_count)
+
+
+
+# Parses page ranges in the pool from a temporary copy of the PDF, yielding pages in order
+def _parallel_page_texts(contents: bytes, page_count: int):
+    pool = _get_pool()
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    in_flight = deque()
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(contents)
+
+        # Keep every process busy with one task queued behind it
+        max_in_flight = PDF_PARSE_WORKERS * 2
+        for start in range(0, page_count, PDF_PARSE_PAGES_PER_TASK):
+            stop = min(start + PDF_PARSE_PAGES_PER_TASK, page_count)
+            in_flight.append((start, pool.submit(_parse_pages, path, start, stop)))
+            if len(in_flight) >= max_in_flight:
+                first, future = in_flight.popleft()
+                yield from enumerate(future.result(), first)
+        while in_flight:
+            first, future = in_flight.popleft()
+            yield from enumerate(future.result(), first)
+    finally:
+        # Don't leave queued tasks running if the caller stops early
+        for _, future in in_flight:
+            future.cancel()
+        for _, future in in_flight:
+            if not future.cancelled():
+                future.exception()
+        os.remove(path)
+
+
+
+#####################################################################
+# Stops the parser processes (they are restarted on next use).
+#####################################################################
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+
+# Exported names from this module
+__all__ = [
+    "page_texts",
+    "shutdown",
+]
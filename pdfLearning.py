@@ -17,121 +17,610 @@
 # and creates a ConversationalRetrievalChain that lets the AI answer questions based on the file.
 #
 # Features:
-# - Parses uploaded PDF files using PyMuPDF
+# - Parses uploaded PDF files in memory using PyMuPDF, page by page (large files optionally
+#   in a process pool, see pageParser.py)
 # - Splits text into chunks for embedding
 # - Uses OpenAI embeddings and FAISS vector store
-# - Tracks conversation history per user with memory
+# - Caches built indexes by SHA-256 of the file, shared read-only across users
+# - Optionally stores large documents in compact, memory-mapped indexes (see compactIndex.py)
+# - Caches chunk embeddings across documents (see embeddingCache.py)
+# - Tracks conversation history per user in a token-budgeted summary memory
+# - Fits retrieved chunks into a context token budget, most relevant first
+# - Only rewrites follow-up questions that refer back to the conversation (see condenseQuestion.py)
+# - Optionally answers near-duplicate first questions about the same PDF from a semantic cache
 #
 # Exports:
 # - handle_pdf_upload        -> Process and store PDF content for retrieval
 # - handle_pdf_question      -> Ask questions against the uploaded PDF
 # - get_user_pdf_chain       -> Retrieve user's active PDF chain
 # - clear_user_pdf_chain     -> Clear/reset a user's uploaded PDF chain
+# - start_pdf_job            -> Register a background indexing job for a user
+# - run_pdf_job              -> Run an indexing job, recording progress and result
+# - get_pdf_job              -> Current indexing status for a user
+# - get_cached_index         -> Look up a built index by document hash
 ################################################################################################
 
 
 
 import os
+import uuid
+import hashlib
 import tempfile
-from langchain_community.document_loaders import PyMuPDFLoader
+import threading
+import contextvars
+import pymupdf
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStoreRetriever
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.vectorstores import FAISS
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain_community.chat_models import ChatOpenAI
+
+# Shared OpenAI clients and per-mode model settings
+import llmProvider
+
+# Persistent chunk-level embedding cache and concurrent embedding pipeline
+import embeddingCache
+import embeddingPipeline
+
+# Parallel page parsing for large documents
+import pageParser
+
+# Compact, memory-mapped indexes for large documents
+import compactIndex
+from compactIndex import CompactIndexWriter, CompactVectorStore
+
+# Bounded per-user session storage
+import sessionBackend
+from sessionStore import SessionStore
+
+# Answer cache for near-duplicate questions
+from semanticCache import SemanticCache
+
+# Priority for upstream rate limiting
+import rateLimiter
+
+# Follow-up rewriting that skips the LLM for self-contained questions
+from condenseQuestion import SelectiveCondenseChain
+
+# Token budgets for prompts and retrieved context
+from promptBudget import BudgetedLLMChain, fit_documents
+import metrics
+
+# Token-budgeted summary memory
+from summaryMemory import IncrementalSummaryMemory, memory_size, memory_to_dict, memory_from_dict, bind_persistence
 
 # Load the OpenAI API key from environment variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Use GPT-4o-mini as llm model
-llm_model = "gpt-4o-mini"
-llm = ChatOpenAI(temperature=0.7, model=llm_model)
+# Chat model on the shared OpenAI clients (streaming so answer tokens can be forwarded to SSE clients)
+llm = llmProvider.get_chat_model("pdf", streaming=True)
 
-# Dictionary to store each user's conversational retrieval chain
-user_pdf_chains = {}
+# Non-streaming model for rewriting follow-ups into standalone questions,
+# so the rewritten question is never streamed to the user as part of the answer
+condense_llm = llmProvider.get_chat_model("pdf")
+
+# Shared embeddings model (created on first use), wrapped in the chunk cache
+_embeddings = None
 
 
 
 #####################################################################
-# Retrieves the user's active ConversationalRetrievalChain instance.
-# Raises an error if no PDF has been uploaded yet.
+# Returns the shared OpenAI embeddings, behind the chunk-level cache
+# so chunks already embedded for any earlier PDF are not re-sent.
 #####################################################################
-def get_user_pdf_chain(user_id: str):
-    if user_id not in user_pdf_chains:
-        raise ValueError("No uploaded PDF for this user.")
-    return user_pdf_chains[user_id]
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = embeddingCache.with_cache(llmProvider.get_embeddings_model())
+    return _embeddings
+
+# Max number of distinct PDF indexes kept in memory at once (shared by all users)
+PDF_INDEX_CACHE_ENTRIES = int(os.getenv("PDF_INDEX_CACHE_ENTRIES", "50"))
+
+# Directory (shared by all workers) where built PDF indexes are saved, keyed by content hash
+PDF_INDEX_DIR = os.getenv("PDF_INDEX_DIR", os.path.join(tempfile.gettempdir(), "ai_tutor_pdf_indexes"))
+
+# Save built indexes to PDF_INDEX_DIR so they survive restarts (always on with a shared backend)
+PDF_PERSIST_INDEXES = os.getenv("PDF_PERSIST_INDEXES", "false").lower() == "true" or sessionBackend.is_shared()
+
+# Upload limits, checked before any parsing or embedding work
+PDF_MAX_BYTES = int(float(os.getenv("PDF_MAX_MB", "50")) * 1024 * 1024)
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "1000"))
+
+# Max number of chunks per embedding request (requests are also capped by EMBED_BATCH_TOKENS)
+PDF_EMBED_BATCH_CHUNKS = int(os.getenv("PDF_EMBED_BATCH_CHUNKS", "64"))
+
+# Semantic answer cache for first-turn questions (off by default)
+PDF_ANSWER_CACHE_ENABLED = os.getenv("PDF_ANSWER_CACHE_ENABLED", "false").lower() == "true"
+PDF_ANSWER_CACHE_THRESHOLD = float(os.getenv("PDF_ANSWER_CACHE_THRESHOLD", "0.95"))
+PDF_ANSWER_CACHE_QUESTIONS = int(os.getenv("PDF_ANSWER_CACHE_QUESTIONS", "200"))
+
+# Chunks retrieved per question, and the token budget they are fitted into
+PDF_RETRIEVAL_K = int(os.getenv("PDF_RETRIEVAL_K", "4"))
+PDF_CONTEXT_TOKEN_BUDGET = int(os.getenv("PDF_CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Raw chat history kept per user before older turns are summarized
+PDF_MEMORY_TOKEN_BUDGET = int(os.getenv("PDF_MEMORY_TOKEN_BUDGET", "1000"))
+
+# (question, vector) already embedded for the answer cache while a question is handled
+_query_vector = contextvars.ContextVar("pdf_query_vector", default=None)
+
+# Settings for each user's PDF conversation memory (summaries use the non-streaming model)
+memory_settings = {
+    "llm": condense_llm,
+    "memory_key": "chat_history",
+    "input_key": "question",
+    "output_key": "answer",
+    "return_messages": True,
+    "max_token_limit": PDF_MEMORY_TOKEN_BUDGET,
+}
 
 
 
 #####################################################################
-# Clears the stored PDF chain for a user, useful on logout/reset.
+# Estimates a FAISS vector store's size in bytes from its vectors and
+# the chunk text held in its docstore. Compact indexes count their
+# memory-mapped files as well as their private memory.
 #####################################################################
-def clear_user_pdf_chain(user_id: str):
-    if user_id in user_pdf_chains:
-        del user_pdf_chains[user_id]
+def vectorstore_size(vectorstore) -> int:
+    if isinstance(vectorstore, CompactVectorStore):
+        return vectorstore.memory_bytes()
+    vector_bytes = vectorstore.index.ntotal * vectorstore.index.d * 4
+    text_bytes = sum(len(doc.page_content) for doc in vectorstore.docstore._dict.values())
+    return vector_bytes + text_bytes
 
 
 
 #####################################################################
-# Handles a new PDF file upload:
-# - Saves the file temporarily
-# - Loads and splits the document into chunks
-# - Embeds the content using OpenAI embeddings
-# - Stores a retriever-backed conversation chain for the user
+# Estimates a user's PDF session size from its chat history. The index
+# is shared and accounted for in pdf_index_cache while cached there;
+# once evicted from it, the chain alone keeps the index alive, so it
+# is counted against this user's session instead.
 #####################################################################
-def handle_pdf_upload(contents: bytes, user_id: str):
-    
-    # Save the uploaded PDF to a temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(contents)
-        tmp_path = tmp.name
+def pdf_chain_size(chain) -> int:
+    size = memory_size(chain.memory)
+    vectorstore = chain.retriever.vectorstore
+    if pdf_index_cache.peek(chain.metadata["doc_hash"]) is not vectorstore:
+        size += vectorstore_size(vectorstore)
+    return size
 
 
-    # Load and parse the PDF
-    loader = PyMuPDFLoader(tmp_path)
-    docs = loader.load()
 
+#####################################################################
+# Deletes an evicted compact index from disk unless indexes are
+# persisted, so large uploads don't pile up in PDF_INDEX_DIR. Users
+# still chatting over it keep their open copy.
+#####################################################################
+def _drop_evicted_index(doc_hash: str, vectorstore):
+    if not PDF_PERSIST_INDEXES and isinstance(vectorstore, CompactVectorStore):
+        compactIndex.remove_compact_index(vectorstore.path)
 
-    # Split the text into manageable chunks
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
-    chunks = splitter.split_documents(docs)
 
 
-    # Convert chunks into vector embeddings and store them in FAISS vector store
-    embeddings = OpenAIEmbeddings()
-    vectorstore = FAISS.from_documents(chunks, embeddings)
+# In-memory cache of built indexes keyed by the SHA-256 of the PDF bytes.
+# Indexes are read-only once built, so every user who uploads the same file shares one.
+pdf_index_cache = SessionStore(
+    "pdf_index_cache",
+    max_entries=PDF_INDEX_CACHE_ENTRIES,
+    sizeof=vectorstore_size,
+    resize_on_access=False,
+    on_evict=_drop_evicted_index
+)
 
-    # Set up conversation memory to track chat history
-    memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        return_messages=True
-    )
+# One lock per document hash, so concurrent uploads of the same file only build it once.
+# doc_hash -> [lock, callers holding or waiting for it]; dropped when the last one leaves.
+_index_locks = {}
+_index_locks_guard = threading.Lock()
 
-    # Create a conversational chain using the LLM and vectorstore retriever
-    chain = ConversationalRetrievalChain.from_llm(
+
+
+#####################################################################
+# Returns the directory a document's index is persisted to.
+#####################################################################
+def _index_dir(doc_hash: str) -> str:
+    return os.path.join(PDF_INDEX_DIR, doc_hash)
+
+
+
+#####################################################################
+# Returns the cached index for a document hash, loading it from disk
+# if it was persisted (or built as a compact index) earlier. Returns
+# None if it was never built.
+#####################################################################
+def get_cached_index(doc_hash: str):
+    vectorstore = pdf_index_cache.get(doc_hash)
+    if vectorstore is None and compactIndex.is_compact_index(_index_dir(doc_hash)):
+        vectorstore = CompactVectorStore(_index_dir(doc_hash), get_embeddings())
+        pdf_index_cache.set(doc_hash, vectorstore)
+    elif vectorstore is None and os.path.isdir(_index_dir(doc_hash)):
+        vectorstore = FAISS.load_local(
+            _index_dir(doc_hash), get_embeddings(), allow_dangerous_deserialization=True
+        )
+        pdf_index_cache.set(doc_hash, vectorstore)
+    return vectorstore
+
+
+
+#####################################################################
+# Lazily yields one Document per non-empty page of an open PDF, with
+# the same page metadata PyMuPDFLoader used to attach. Large PDFs may
+# be parsed in parallel (see pageParser.py); pages still arrive in
+# order. Parsed pages are counted in counts["pages_parsed"] for
+# progress reporting.
+#####################################################################
+def _iter_pages(pdf, contents: bytes, counts: dict):
+    total_pages = pdf.page_count
+    for number, text in pageParser.page_texts(pdf, contents):
+        counts["pages_parsed"] += 1
+        if text.strip():
+            yield Document(
+                page_content=text,
+                metadata={"source": "upload", "page": number, "total_pages": total_pages}
+            )
+
+
+
+#####################################################################
+# Splits pages into chunks as they are parsed, so parsing and
+# embedding overlap and the whole document is never held as chunks
+# in one list.
+#####################################################################
+def _iter_chunks(pages, splitter):
+    for page in pages:
+        yield from splitter.split_documents([page])
+
+
+
+#####################################################################
+# Parses, splits and embeds a PDF into a new FAISS vector store:
+# - Opens the PDF straight from the uploaded bytes (no temp file)
+# - Enforces the size and page-count limits
+# - Streams pages through the splitter and embeds token-sized batches
+#   of chunks concurrently using (cached) OpenAI embeddings, adding
+#   each batch to the index as it completes
+# - Reports {pages_total, pages_parsed, chunks_embedded} to
+#   on_progress after every embedded batch
+# With compact indexes enabled, chunks are streamed to disk instead and
+# large documents get a memory-mapped index at their index directory.
+#####################################################################
+def _build_index(contents: bytes, doc_hash: str, on_progress=None):
+
+    if len(contents) > PDF_MAX_BYTES:
+        raise ValueError(f"PDF is too large (limit is {PDF_MAX_BYTES // (1024 * 1024)} MB).")
+
+    pdf = pymupdf.open(stream=contents, filetype="pdf")
+    try:
+        if pdf.page_count > PDF_MAX_PAGES:
+            raise ValueError(f"PDF has too many pages (limit is {PDF_MAX_PAGES}).")
+
+        # Split the text into manageable chunks
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
+
+        # Embed batches of chunks concurrently and add each to the FAISS vector store in order
+        counts = {"pages_total": pdf.page_count, "pages_parsed": 0, "chunks_embedded": 0}
+        batches = embeddingPipeline.token_batches(
+            _iter_chunks(_iter_pages(pdf, contents, counts), splitter), max_chunks=PDF_EMBED_BATCH_CHUNKS
+        )
+        vectorstore = None
+        writer = CompactIndexWriter(_index_dir(doc_hash)) if compactIndex.COMPACT_INDEX_ENABLED else None
+        try:
+            for batch, vectors in embeddingPipeline.embed_batches(get_embeddings(), batches):
+                metadatas = [chunk.metadata for chunk in batch]
+                if writer is not None:
+                    writer.add([chunk.page_content for chunk in batch], vectors, metadatas)
+                else:
+                    text_embeddings = [(chunk.page_content, vector) for chunk, vector in zip(batch, vectors)]
+                    if vectorstore is None:
+                        vectorstore = FAISS.from_embeddings(text_embeddings, get_embeddings(), metadatas=metadatas)
+                    else:
+                        vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+                counts["chunks_embedded"] += len(batch)
+                if on_progress:
+                    on_progress(counts)
+            if writer is not None and writer.count:
+                vectorstore = writer.finish(get_embeddings())
+        finally:
+            if writer is not None:
+                writer.abort()
+    finally:
+        pdf.close()
+
+    if vectorstore is None:
+        raise ValueError("No readable text was found in this PDF.")
+    return vectorstore
+
+
+
+#####################################################################
+# Returns the index for the given PDF bytes, building (and optionally
+# persisting) it only if no identical file was indexed before.
+#####################################################################
+def get_or_build_index(contents: bytes, on_progress=None):
+    doc_hash = hashlib.sha256(contents).hexdigest()
+    with _index_locks_guard:
+        entry = _index_locks.setdefault(doc_hash, [threading.Lock(), 0])
+        entry[1] += 1
+
+    try:
+        with entry[0]:
+            vectorstore = get_cached_index(doc_hash)
+            if vectorstore is None:
+                vectorstore = _build_index(contents, doc_hash, on_progress)
+                # Compact indexes are already on disk
+                if PDF_PERSIST_INDEXES and not isinstance(vectorstore, CompactVectorStore):
+                    vectorstore.save_local(_index_dir(doc_hash))
+                pdf_index_cache.set(doc_hash, vectorstore)
+    finally:
+        # Only drop the lock once no caller is waiting on it
+        with _index_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _index_locks[doc_hash]
+    return doc_hash, vectorstore
+
+
+
+#####################################################################
+# Conversational retrieval chain that fits the retrieved chunks into
+# PDF_CONTEXT_TOKEN_BUDGET before they are stuffed into the prompt,
+# keeping the most relevant ones.
+#####################################################################
+class BudgetedRetrievalChain(ConversationalRetrievalChain):
+
+    def _reduce_tokens_below_limit(self, docs):
+        docs, tokens, trimmed = fit_documents(docs, self.max_tokens_limit)
+        metrics.prompt_tokens.observe(tokens, "pdf_context")
+        if trimmed:
+            metrics.prompts_trimmed.inc(1, "pdf_context")
+        return docs
+
+
+
+#####################################################################
+# Vector store retriever that searches by the question's vector when
+# handle_pdf_question already embedded it for the answer cache, so a
+# first question is only embedded once.
+#####################################################################
+class QueryVectorRetriever(VectorStoreRetriever):
+
+    def _get_relevant_documents(self, query: str, **kwargs):
+        known = _query_vector.get()
+        if known is not None and known[0] == query:
+            return self.vectorstore.similarity_search_by_vector(known[1], **self.search_kwargs)
+        return super()._get_relevant_documents(query, **kwargs)
+
+
+
+#####################################################################
+# Builds a conversational retrieval chain over a vector store. The
+# document hash is kept in the chain metadata so the session can be
+# serialized by reference to the shared index.
+#####################################################################
+def _build_chain(vectorstore, memory, doc_hash: str):
+    chain = BudgetedRetrievalChain.from_llm(
         llm=llm,
-        retriever=vectorstore.as_retriever(),
+        condense_question_llm=condense_llm,
+        retriever=QueryVectorRetriever(vectorstore=vectorstore, search_kwargs={"k": PDF_RETRIEVAL_K}),
         memory=memory,
+        max_tokens_limit=PDF_CONTEXT_TOKEN_BUDGET,
         verbose=False
     )
+    chain.metadata = {"doc_hash": doc_hash}
+    # Only follow-ups that refer back to the conversation are rewritten by the LLM
+    chain.question_generator = SelectiveCondenseChain(
+        llm=condense_llm,
+        prompt=chain.question_generator.prompt,
+        name="condense_question_chain"
+    )
+    # Answer prompts are held to their prompt token budget too
+    chain.combine_docs_chain.llm_chain = BudgetedLLMChain(
+        llm=llm,
+        prompt=chain.combine_docs_chain.llm_chain.prompt,
+        name="pdf_answer_chain"
+    )
+    # Names reported by the per-chain metrics
+    chain.name = "pdf_qa_chain"
+    chain.combine_docs_chain.name = "pdf_combine_docs_chain"
+    return chain
 
-    # Store the chain for this specific user
-    user_pdf_chains[user_id] = chain
 
 
-    # Delete the temporary PDF file
-    os.remove(tmp_path)
+#####################################################################
+# Serializes a user's PDF session as its document hash plus the chat
+# history summary and recent turns, for the shared session backend.
+#####################################################################
+def pdf_chain_to_dict(chain) -> dict:
+    return {"doc_hash": chain.metadata["doc_hash"], **memory_to_dict(chain.memory)}
+
+
+
+#####################################################################
+# Rebuilds a user's PDF chain from pdf_chain_to_dict output, using the
+# shared index cache (or the persisted index on disk).
+#####################################################################
+def pdf_chain_from_dict(data: dict):
+    vectorstore = get_cached_index(data["doc_hash"])
+    if vectorstore is None:
+        raise ValueError("The uploaded PDF is no longer available. Please upload it again.")
+
+    memory = memory_from_dict(data, **memory_settings)
+    return _build_chain(vectorstore, memory, data["doc_hash"])
+
+
+# Session store holding each user's conversational retrieval chain (bounded, evicts idle users)
+user_pdf_chains = SessionStore(
+    "pdf_chains",
+    sizeof=pdf_chain_size,
+    dump=pdf_chain_to_dict,
+    load=pdf_chain_from_dict
+)
+
+# Session store holding each user's latest indexing job status
+pdf_jobs = SessionStore("pdf_jobs", dump=dict, load=dict)
+
+# Answers to first-turn questions, per document hash, matched by question embedding
+pdf_answer_cache = SemanticCache(
+    "pdf_answers",
+    threshold=PDF_ANSWER_CACHE_THRESHOLD,
+    max_questions=PDF_ANSWER_CACHE_QUESTIONS,
+    max_documents=PDF_INDEX_CACHE_ENTRIES
+)
+
+
+
+#####################################################################
+# Creates and stores a new indexing job for the user. Any earlier job
+# for the same user is superseded and will not overwrite this one.
+#####################################################################
+def start_pdf_job(user_id: str) -> dict:
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "status": "indexing",
+        "pages_total": 0,
+        "pages_parsed": 0,
+        "chunks_embedded": 0,
+        "error": None,
+    }
+    pdf_jobs.set(user_id, job)
+    return job
+
+
+
+#####################################################################
+# Returns True if job is still the user's latest indexing job.
+#####################################################################
+def _is_current_job(user_id: str, job: dict) -> bool:
+    current = pdf_jobs.get(user_id)
+    return current is not None and current["job_id"] == job["job_id"]
+
+
+
+#####################################################################
+# Updates and stores a job's fields, unless it has been superseded.
+#####################################################################
+def _update_job(user_id: str, job: dict, **fields):
+    job.update(fields)
+    if _is_current_job(user_id, job):
+        pdf_jobs.set(user_id, job)
+
+
+
+#####################################################################
+# Runs an indexing job to completion (called on the worker pool).
+# Failures are recorded on the job instead of raised.
+# Returns the final job dict.
+#####################################################################
+def run_pdf_job(contents: bytes, user_id: str, job: dict) -> dict:
+    try:
+        # Indexing is background work; interactive requests get rate-limit capacity first
+        with rateLimiter.background():
+            handle_pdf_upload(contents, user_id, job=job)
+        _update_job(user_id, job, status="ready")
+    except Exception as e:
+        _update_job(user_id, job, status="failed", error=str(e))
+    return job
+
+
+
+#####################################################################
+# Returns the user's latest indexing job, or None if there is none.
+#####################################################################
+def get_pdf_job(user_id: str):
+    return pdf_jobs.get(user_id)
+
+
+
+#####################################################################
+# Retrieves the user's active ConversationalRetrievalChain instance.
+# Raises an error if no PDF has been uploaded yet, or if the latest
+# upload is still being indexed or failed.
+#####################################################################
+def get_user_pdf_chain(user_id: str):
+    job = pdf_jobs.get(user_id)
+    if job is not None and job["status"] == "indexing":
+        raise ValueError("Your PDF is still being indexed. Please try again in a moment.")
+    if job is not None and job["status"] == "failed":
+        raise ValueError(f"PDF indexing failed: {job['error']}")
+
+    chain = user_pdf_chains.get(user_id)
+    if chain is None:
+        raise ValueError("No uploaded PDF for this user.")
+    bind_persistence(user_pdf_chains, user_id, chain.memory, chain)
+    return chain
+
+
+
+#####################################################################
+# Clears the stored PDF chain for a user, useful on logout/reset.
+# The shared index stays cached for other users of the same file.
+#####################################################################
+def clear_user_pdf_chain(user_id: str):
+    user_pdf_chains.delete(user_id)
+    pdf_jobs.delete(user_id)
+
+
+
+#####################################################################
+# Handles a new PDF file upload:
+# - Reuses the index of an identical, previously uploaded file
+# - Otherwise parses, splits and embeds it (see _build_index)
+# - Stores a retriever-backed conversation chain for the user
+# When run as an indexing job, progress is recorded on the job and
+# the chain is only stored if the job has not been superseded.
+#####################################################################
+def handle_pdf_upload(contents: bytes, user_id: str, job: dict = None):
+
+    on_progress = None
+    if job is not None:
+        on_progress = lambda counts: _update_job(user_id, job, **counts)
+
+    doc_hash, vectorstore = get_or_build_index(contents, on_progress)
+
+    # Set up conversation memory to track chat history (older turns are summarized)
+    memory = IncrementalSummaryMemory(**memory_settings)
+
+    # Create a conversational chain using the LLM and vectorstore retriever
+    chain = _build_chain(vectorstore, memory, doc_hash)
+
+    # Store the chain for this specific user
+    if job is None or _is_current_job(user_id, job):
+        user_pdf_chains.set(user_id, chain)
 
 
 
 #####################################################################
 # Handles a user's question by invoking their active PDF chain.
+# Optional callbacks receive streamed answer tokens. With the answer
+# cache enabled, a first question close to one already answered for
+# the same PDF is served from the cache.
 # Returns the AI's answer from the PDF-based retriever.
 #####################################################################
-def handle_pdf_question(question: str, user_id: str):
+def handle_pdf_question(question: str, user_id: str, callbacks=None):
     chain = get_user_pdf_chain(user_id)
-    result = chain.invoke({"question": question})
+    doc_hash = chain.metadata["doc_hash"]
+
+    # Only first questions are cached; follow-ups depend on the conversation so far
+    vector = None
+    if PDF_ANSWER_CACHE_ENABLED and not chain.memory.buffer:
+        vector = get_embeddings().embed_query(question)
+        answer = pdf_answer_cache.lookup(doc_hash, vector)
+        if answer is not None:
+            chain.memory.save_context({"question": question}, {"answer": answer})
+            # Streaming clients get the cached answer as a single token
+            for handler in callbacks or []:
+                handler.on_llm_new_token(answer)
+            return answer
+
+    # The memory writes the updated chat history back to the session store when the turn is saved.
+    # A first question goes to the retriever unchanged, so it can search with the same vector.
+    token = _query_vector.set((question, vector)) if vector is not None else None
+    try:
+        result = chain.invoke({"question": question}, config={"callbacks": callbacks})
+    finally:
+        if token is not None:
+            _query_vector.reset(token)
+    if vector is not None:
+        pdf_answer_cache.add(doc_hash, vector, question, result["answer"])
     return result["answer"]
 
 
@@ -142,4 +631,8 @@ __all__ = [
     "handle_pdf_question",
     "get_user_pdf_chain",
     "clear_user_pdf_chain",
+    "get_cached_index",
+    "start_pdf_job",
+    "run_pdf_job",
+    "get_pdf_job",
 ]
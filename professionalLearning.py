@@ -25,37 +25,50 @@
 
 import os
 import warnings
-from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from langchain_community.chat_models import ChatOpenAI
-from langchain.memory import ConversationSummaryMemory
+
+# LLMChain with per-chain prompt token budgets
+from promptBudget import BudgetedLLMChain
+
+# Shared OpenAI clients and per-mode model settings
+import llmProvider
+
+# Token-budgeted summary memory
+from summaryMemory import IncrementalSummaryMemory, memory_size, memory_to_dict, memory_from_dict, bind_persistence
+
+# Bounded per-user session storage
+from sessionStore import SessionStore
 
 warnings.filterwarnings("ignore")
 
-# Load API key and set model
+# Load API key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-llm_model = "gpt-4o-mini"
 
-# Initialize the LLM model (with slighly slower temperature for clarity and precision)
-llm = ChatOpenAI(temperature=0.5, model=llm_model)
+# Initialize the LLM model (the "professional" mode runs at a slighly lower temperature
+# for clarity and precision). Streaming is enabled so tokens can be forwarded to SSE clients
+llm = llmProvider.get_chat_model("professional", streaming=True)
+
 
+# Settings shared by every user's conversation memory in this mode
+memory_settings = {"llm": llm, "memory_key": "chat_history", "input_key": "userResponse"}
 
-# Dictionary to manage user-specific conversation memory
-user_memories = {}
+# Session store to manage user-specific conversation memory (bounded, evicts idle users)
+user_memories = SessionStore(
+    "pro_memories",
+    sizeof=memory_size,
+    dump=memory_to_dict,
+    load=lambda data: memory_from_dict(data, **memory_settings)
+)
 
 
 #####################################################################
 # Retrieves or initializes conversation memory for the given user ID.
-# Returns a LangChain ConversationSummaryMemory object.
+# Returns an IncrementalSummaryMemory object.
 #####################################################################
 def get_user_memory(user_id: str):
-    if user_id not in user_memories:
-        user_memories[user_id] = ConversationSummaryMemory(
-            llm=llm,
-            memory_key="chat_history",
-            input_key="userResponse"
-        )
-    return user_memories[user_id]
+    memory = user_memories.get_or_create(user_id, lambda: IncrementalSummaryMemory(**memory_settings))
+    bind_persistence(user_memories, user_id, memory)
+    return memory
 
 
 
@@ -63,8 +76,7 @@ def get_user_memory(user_id: str):
 # Clears the conversation memory for the specified user, if it exists.
 #####################################################################
 def clear_user_memory(user_id: str):
-    if user_id in user_memories:
-        user_memories[user_id].clear()
+    user_memories.delete(user_id)
 
 
 
@@ -95,7 +107,7 @@ AI:
 
 
 # Chain using the professional prompt
-response_chain = LLMChain(llm=llm, prompt=pro_prompt)
+response_chain = BudgetedLLMChain(llm=llm, prompt=pro_prompt, name="professional_response_chain")
 
 
 # --------------------- EXPORTS ----------------------
@@ -0,0 +1,189 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    promptBudget.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# promptBudget.py – Keeps every prompt under a per-chain token budget.
+#
+# Prompts are assembled from variables whose size grows with the session: the conversation
+# history (chat_history / previousChat), long user messages, generated quizzes and feedback.
+# BudgetedLLMChain measures the prompt template and each variable with tiktoken right before
+# the prompt is formatted (after memory variables are loaded, so memory-backed chains are
+# covered too) and, when the total is over budget, trims it back:
+# - History variables go first, dropping their oldest text (the running summary and most
+#   recent turns are at the end and are kept)
+# - If that is not enough, the largest remaining variables are cut from the end
+#
+# Every call's final prompt size is recorded per chain in the metrics (prompt_tokens histogram,
+# prompt_trimmed_total counter). History is already summarized by the conversation memory, so
+# trimming here is a cheap, hard cap rather than another summarization call.
+#
+# Retrieved documents (PDF mode) are fitted to their own budget with fit_documents before they
+# are stuffed into the prompt: documents are taken in relevance order, the first one that
+# doesn't fit is cut short if enough room is left, and the rest are dropped.
+#
+# Configuration (environment variables):
+# - PROMPT_TOKEN_BUDGET          -> Max prompt tokens per call for every chain (default 4000)
+# - PROMPT_TOKEN_BUDGET_<CHAIN>  -> Per-chain override, e.g. PROMPT_TOKEN_BUDGET_QUIZGEN_CHAIN=2500
+#
+# Exports:
+# - budget_for           -> Token budget for a chain name
+# - fit_prompt_inputs    -> Trims a prompt's input variables to fit a budget
+# - fit_documents        -> Keeps the most relevant retrieved documents that fit a budget
+# - BudgetedLLMChain     -> LLMChain that fits its inputs to its budget on every call
+################################################################################################
+
+
+
+import os
+from typing import Optional
+from langchain.chains import LLMChain
+from langchain_core.documents import Document
+
+import metrics
+from tokenCounter import count_tokens, truncate_tokens
+
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+
+# Variables holding conversation history; trimmed first, keeping their newest text
+HISTORY_VARIABLES = ("chat_history", "previousChat")
+
+# Markers left where text was cut, so the model knows something is missing
+HISTORY_MARKER = "(earlier conversation omitted)\n"
+TRUNCATED_MARKER = "\n(truncated)"
+
+# Smallest remainder worth keeping when cutting a retrieved document short
+MIN_PARTIAL_DOCUMENT_TOKENS = 100
+
+# Tokens taken by each template with its variables left empty, by template text (or repr)
+_template_tokens = {}
+
+
+
+#####################################################################
+# Returns the prompt token budget for a chain, from
+# PROMPT_TOKEN_BUDGET_<NAME> or the global PROMPT_TOKEN_BUDGET.
+#####################################################################
+def budget_for(chain_name: str) -> int:
+    if chain_name:
+        override = os.getenv(f"PROMPT_TOKEN_BUDGET_{chain_name.upper()}")
+        if override:
+            return int(override)
+    return PROMPT_TOKEN_BUDGET
+
+
+
+# Tokens used by a prompt's fixed text (string or chat prompt templates)
+def _fixed_tokens(prompt) -> int:
+    key = getattr(prompt, "template", None) or repr(prompt)
+    if key not in _template_tokens:
+        _template_tokens[key] = count_tokens(prompt.format(**{name: "" for name in prompt.input_variables}))
+    return _template_tokens[key]
+
+
+
+#####################################################################
+# Fits inputs to a prompt's token budget. Returns (inputs, prompt
+# tokens, trimmed); inputs is a trimmed copy only when the prompt was
+# over budget.
+#####################################################################
+def fit_prompt_inputs(prompt, inputs: dict, budget: int):
+    sizes = {
+        name: count_tokens(inputs[name])
+        for name in prompt.input_variables if isinstance(inputs.get(name), str)
+    }
+    fixed = _fixed_tokens(prompt) + sum(
+        count_tokens(str(inputs[name])) for name in prompt.input_variables
+        if name in inputs and name not in sizes
+    )
+    total = fixed + sum(sizes.values())
+    if total <= budget:
+        return inputs, total, False
+
+    fitted = dict(inputs)
+    over = total - budget
+    history = [name for name in HISTORY_VARIABLES if sizes.get(name)]
+    others = sorted((name for name in sizes if name not in HISTORY_VARIABLES), key=sizes.get, reverse=True)
+    for name in history + others:
+        if over <= 0:
+            break
+        is_history = name in HISTORY_VARIABLES
+        marker = HISTORY_MARKER if is_history else TRUNCATED_MARKER
+        keep = max(0, sizes[name] - over - count_tokens(marker))
+        text = truncate_tokens(fitted[name], keep, keep="end" if is_history else "start")
+        fitted[name] = (marker + text) if is_history else (text + marker)
+        trimmed_size = count_tokens(fitted[name])
+        over -= sizes[name] - trimmed_size
+        total -= sizes[name] - trimmed_size
+    return fitted, total, True
+
+
+
+#####################################################################
+# Fits retrieved documents (most relevant first) to a token budget.
+# Returns (documents, tokens, trimmed): whole documents are kept while
+# they fit, the next one is cut short if at least
+# MIN_PARTIAL_DOCUMENT_TOKENS remain, and the rest are dropped.
+#####################################################################
+def fit_documents(documents: list, budget: int):
+    fitted = []
+    total = 0
+    for document in documents:
+        size = count_tokens(document.page_content)
+        if total + size <= budget:
+            fitted.append(document)
+            total += size
+            continue
+        room = budget - total - count_tokens(TRUNCATED_MARKER)
+        if room >= MIN_PARTIAL_DOCUMENT_TOKENS:
+            text = truncate_tokens(document.page_content, room) + TRUNCATED_MARKER
+            fitted.append(Document(page_content=text, metadata=document.metadata))
+            total += count_tokens(text)
+        return fitted, total, True
+    return fitted, total, False
+
+
+
+#####################################################################
+# LLMChain that fits its prompt variables (including those loaded
+# from memory) to a token budget before every call, and records the
+# prompt size per call in the metrics.
+#####################################################################
+class BudgetedLLMChain(LLMChain):
+
+    # Max prompt tokens, or None to use budget_for(name)
+    max_prompt_tokens: Optional[int] = None
+
+    def prep_prompts(self, input_list, run_manager=None):
+        return super().prep_prompts([self._fit(inputs) for inputs in input_list], run_manager)
+
+    async def aprep_prompts(self, input_list, run_manager=None):
+        return await super().aprep_prompts([self._fit(inputs) for inputs in input_list], run_manager)
+
+    def _fit(self, inputs: dict) -> dict:
+        name = self.name or "LLMChain"
+        budget = self.max_prompt_tokens or budget_for(name)
+        fitted, tokens, trimmed = fit_prompt_inputs(self.prompt, inputs, budget)
+        metrics.prompt_tokens.observe(tokens, name)
+        if trimmed:
+            metrics.prompts_trimmed.inc(1, name)
+        return fitted
+
+
+
+# Exported names from this module
+__all__ = [
+    "budget_for",
+    "fit_prompt_inputs",
+    "fit_documents",
+    "BudgetedLLMChain",
+]
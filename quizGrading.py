@@ -0,0 +1,162 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    quizGrading.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# quizGrading.py – Structured quizzes with a server-side answer key.
+#
+# Quiz generation asks the model for JSON (questions, lettered choices and the correct letter).
+# The answer key is kept in the user's quiz state and never sent to the client, so grading a
+# submission is a local comparison instead of a second LLM call that re-reads the feedback.
+#
+# Exports:
+# - QUIZ_QUESTIONS      -> Questions in every quiz (the submit routes expect this many answers)
+# - QUIZ_CHOICES        -> Choice letters of every question
+# - parse_quiz          -> Parse the model's JSON quiz into a list of questions
+# - format_quiz         -> Render questions as display text (optionally with answers)
+# - grade_answers       -> Compare submitted answers with the answer key
+# - format_grade        -> Render a grade in the "Correct / Incorrect / Score / Grade" format
+################################################################################################
+
+
+
+import re
+import json
+
+
+# Every quiz has this many questions, each with exactly these choices
+QUIZ_QUESTIONS = 5
+QUIZ_CHOICES = ("A", "B", "C", "D")
+
+# Matches a leading answer letter such as "B", "b)", "B." or "B: Mars"
+_LETTER_PATTERN = re.compile(r"^\s*\(?([A-Za-z])\s*(?:[).:\-]|$)")
+
+
+
+#####################################################################
+# Parses the quiz generator's output into a list of questions:
+#   [{"question": str, "choices": {"A": str, ...}, "answer": "A"}, ...]
+# Ignores any text (e.g. code fences) around the JSON. Raises ValueError
+# if the output is not a valid quiz: QUIZ_QUESTIONS questions, each
+# with choices keyed exactly by QUIZ_CHOICES.
+#####################################################################
+def parse_quiz(text: str) -> list:
+    try:
+        data = json.loads(text[text.find("{"):text.rfind("}") + 1])
+    except ValueError as e:
+        raise ValueError("Quiz output is not valid JSON.") from e
+
+    items = data.get("questions", []) if isinstance(data, dict) else []
+    if not isinstance(items, list):
+        raise ValueError("Quiz questions are not a list.")
+
+    questions = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("choices", {}), dict):
+            raise ValueError("Quiz question is not an object with a choices object.")
+        choices = {str(k).strip().upper(): str(v).strip() for k, v in item.get("choices", {}).items()}
+        answer = str(item.get("answer", "")).strip().upper()[:1]
+        if not item.get("question") or answer not in choices:
+            raise ValueError("Quiz question is missing its text, choices or answer.")
+        if sorted(choices) != list(QUIZ_CHOICES):
+            raise ValueError(f"Quiz question choices must be {', '.join(QUIZ_CHOICES)}.")
+        questions.append({"question": str(item["question"]).strip(), "choices": choices, "answer": answer})
+
+    if len(questions) != QUIZ_QUESTIONS:
+        raise ValueError(f"Quiz output has {len(questions)} questions instead of {QUIZ_QUESTIONS}.")
+    return questions
+
+
+
+#####################################################################
+# Renders questions as numbered markdown text with each choice on its
+# own line. The answer key is only included when with_answers is set.
+#####################################################################
+def format_quiz(questions: list, with_answers: bool = False) -> str:
+    blocks = []
+    for number, item in enumerate(questions, start=1):
+        lines = [f"{number}. {item['question']}"]
+        lines += [f"   {letter}) {text}" for letter, text in item["choices"].items()]
+        if with_answers:
+            lines.append(f"   Correct answer: {item['answer']}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+
+#####################################################################
+# Maps a submitted answer to a choice letter. Accepts a letter ("b",
+# "B)", "B. Mars") or the full text of a choice; anything else is
+# returned as-is and graded incorrect.
+#####################################################################
+def _normalize_answer(answer, choices: dict) -> str:
+    text = str(answer).strip()
+    match = _LETTER_PATTERN.match(text)
+    if match and match.group(1).upper() in choices:
+        return match.group(1).upper()
+    for letter, choice in choices.items():
+        if text.lower() == choice.lower():
+            return letter
+    return text
+
+
+
+#####################################################################
+# Grades submitted answers against the answer key.
+#
+# Returns:
+#   dict: {"correct": [question numbers], "incorrect": [...],
+#          "score": int, "total": int, "percent": int,
+#          "answers": [normalized answers]}
+#####################################################################
+def grade_answers(questions: list, answers: list) -> dict:
+    correct, incorrect, normalized = [], [], []
+    for number, item in enumerate(questions, start=1):
+        submitted = answers[number - 1] if number - 1 < len(answers) else ""
+        letter = _normalize_answer(submitted, item["choices"])
+        normalized.append(letter)
+        (correct if letter == item["answer"] else incorrect).append(number)
+
+    total = len(questions)
+    return {
+        "correct": correct,
+        "incorrect": incorrect,
+        "score": len(correct),
+        "total": total,
+        "percent": round(100 * len(correct) / total) if total else 0,
+        "answers": normalized,
+    }
+
+
+
+#####################################################################
+# Renders a grade in the same text format the LLM grader used, so
+# the lesson continuation prompts read it unchanged.
+#####################################################################
+def format_grade(grade: dict) -> str:
+    return (
+        f"Correct: {' '.join(map(str, grade['correct'])) or 'None'}\n"
+        f"Incorrect: {' '.join(map(str, grade['incorrect'])) or 'None'}\n"
+        f"Score: {grade['score']}/{grade['total']}\n"
+        f"Grade: {grade['percent']}%"
+    )
+
+
+
+# Exported functions from this module
+__all__ = [
+    "QUIZ_QUESTIONS",
+    "QUIZ_CHOICES",
+    "parse_quiz",
+    "format_quiz",
+    "grade_answers",
+    "format_grade",
+]
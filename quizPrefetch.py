@@ -0,0 +1,246 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    quizPrefetch.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# quizPrefetch.py – Speculative quiz generation while the user is still chatting.
+#
+# Generating a 5-question quiz is the slowest call in casual and kids mode, and it used to
+# start only when the user asked for the quiz. Once a user has chatted for a few turns, a
+# QuizPrefetcher waits for a short idle period after each turn and then generates the quiz in
+# the background from the current conversation. The quiz is stored with a version stamp (a
+# hash of the exact inputs it was generated from: subject and conversation):
+# - /quiz/start serves it if the stamp still matches, i.e. the conversation hasn't moved on
+# - If a matching generation is still running, /quiz/start waits a short while for it
+#   instead of starting a second one
+# - Otherwise (or if that generation fails or is slow) the quiz is generated on demand
+#
+# A newer turn during the idle period cancels the pending generation. Quizzes generated but
+# never served (the conversation moved on first) are counted as wasted, so the hit rate can be
+# weighed against the extra upstream calls. Prefetched quizzes live in process memory, so
+# with several workers a quiz is only served by the worker that generated it.
+#
+# Configuration (environment variables):
+# - QUIZ_PREFETCH_ENABLED        -> "true" or "false" (default)
+# - QUIZ_PREFETCH_AFTER_TURNS    -> Chat turns before quizzes are pre-generated (default 3)
+# - QUIZ_PREFETCH_IDLE_SECONDS   -> Quiet time after a turn before generating (default 3)
+# - QUIZ_PREFETCH_JOIN_SECONDS   -> Max wait for an in-flight generation at /quiz/start (default 5)
+#
+# Exports:
+# - QuizPrefetcher        -> Per-user speculative quiz generation for one quiz chain
+# - quiz_prefetch_stats   -> Hit/miss/waste counters per mode
+################################################################################################
+
+
+
+import os
+import asyncio
+import hashlib
+import logging
+
+import chainExecutor
+import rateLimiter
+from sessionStore import SessionStore
+
+
+QUIZ_PREFETCH_ENABLED = os.getenv("QUIZ_PREFETCH_ENABLED", "false").lower() == "true"
+QUIZ_PREFETCH_AFTER_TURNS = int(os.getenv("QUIZ_PREFETCH_AFTER_TURNS", "3"))
+QUIZ_PREFETCH_IDLE_SECONDS = float(os.getenv("QUIZ_PREFETCH_IDLE_SECONDS", "3"))
+QUIZ_PREFETCH_JOIN_SECONDS = float(os.getenv("QUIZ_PREFETCH_JOIN_SECONDS", "5"))
+
+logger = logging.getLogger(__name__)
+
+# Every prefetcher created in this process, for metrics reporting
+_prefetchers = []
+
+
+
+#####################################################################
+# Version stamp of a quiz: a hash of the inputs it is generated from.
+#####################################################################
+def _stamp(inputs: dict) -> str:
+    text = "\x00".join(f"{key}={inputs[key]}" for key in sorted(inputs))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+
+#####################################################################
+# Speculative quiz generation for one quiz chain.
+#
+# Args:
+#   name (str): Mode name used in metrics (e.g. "casual").
+#   chain: Quiz LLMChain taking "subject" and "previousChat".
+#####################################################################
+class QuizPrefetcher:
+
+    def __init__(self, name: str, chain):
+        self.name = name
+        self.chain = chain
+
+        # user id -> {"turns", "quiz", "stamp", "waiting": task, "generating": (stamp, task)}
+        self.users = SessionStore(
+            f"{name}_quiz_prefetch",
+            sizeof=lambda entry: len(entry["quiz"] or "")
+        )
+
+        # Background tasks, referenced so they are not garbage-collected while running
+        self._tasks = set()
+
+        self.generated = 0
+        self.wasted = 0
+        self.hits = 0
+        self.misses = 0
+
+        _prefetchers.append(self)
+
+
+    #####################################################################
+    # Notes a finished chat turn and, past the turn threshold, schedules
+    # a quiz generation after the idle period. get_memory returns the
+    # user's current conversation memory.
+    #####################################################################
+    async def schedule(self, user_id: str, subject: str, get_memory):
+        if not QUIZ_PREFETCH_ENABLED:
+            return
+        entry = self._entry(user_id)
+        entry["turns"] += 1
+        if entry["turns"] < QUIZ_PREFETCH_AFTER_TURNS:
+            return
+        # A newer turn replaces a generation that hasn't started yet
+        if entry["waiting"] is not None:
+            entry["waiting"].cancel()
+        task = asyncio.ensure_future(self._prefetch(entry, subject, get_memory))
+        entry["waiting"] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+    #####################################################################
+    # Returns the quiz generator's output for the user's conversation:
+    # the prefetched quiz if its stamp matches, the result of a matching
+    # generation still in flight, or a freshly generated quiz. The
+    # in-flight generation runs at background priority, so it is only
+    # waited on briefly, and a failure falls back to generating anew.
+    #####################################################################
+    async def take(self, user_id: str, subject: str, memory) -> str:
+        inputs = {"subject": subject, "previousChat": memory.buffer}
+        if not QUIZ_PREFETCH_ENABLED:
+            return await chainExecutor.run_chain(self.chain, inputs)
+
+        stamp = _stamp(inputs)
+        entry = self._entry(user_id)
+        # The user is getting their quiz now; a generation still waiting would be wasted
+        if entry["waiting"] is not None:
+            entry["waiting"].cancel()
+            entry["waiting"] = None
+        generating = entry["generating"]
+        if entry["quiz"] is None and generating is not None and generating[0] == stamp:
+            try:
+                await asyncio.wait_for(asyncio.shield(generating[1]), QUIZ_PREFETCH_JOIN_SECONDS)
+            except Exception:
+                # Already logged by _prefetch if it failed; a slow one keeps running
+                pass
+
+        if entry["quiz"] is not None and entry["stamp"] == stamp:
+            self.hits += 1
+            quiz = entry["quiz"]
+            entry.update(quiz=None, stamp=None)
+            return quiz
+
+        self.misses += 1
+        self._discard(entry)
+        return await chainExecutor.run_chain(self.chain, inputs)
+
+
+    #####################################################################
+    # Forgets a user's prefetch state (e.g. when their memory is
+    # cleared). An unserved quiz counts as wasted.
+    #####################################################################
+    def clear(self, user_id: str):
+        entry = self.users.get(user_id)
+        if entry is not None:
+            if entry["waiting"] is not None:
+                entry["waiting"].cancel()
+            self._discard(entry)
+            self.users.delete(user_id)
+
+
+    #####################################################################
+    # Returns this prefetcher's counters.
+    #####################################################################
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "mode": self.name,
+            "generated": self.generated,
+            "wasted": self.wasted,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "waste_ratio": self.wasted / self.generated if self.generated else 0.0,
+        }
+
+
+    # ------------------ internal helpers ------------------
+
+    def _entry(self, user_id: str) -> dict:
+        return self.users.get_or_create(
+            user_id, lambda: {"turns": 0, "quiz": None, "stamp": None, "waiting": None, "generating": None}
+        )
+
+    # Drops an unserved quiz, counting it as wasted
+    def _discard(self, entry: dict):
+        if entry["quiz"] is not None:
+            self.wasted += 1
+            entry.update(quiz=None, stamp=None)
+
+    async def _prefetch(self, entry: dict, subject: str, get_memory):
+        await asyncio.sleep(QUIZ_PREFETCH_IDLE_SECONDS)
+        entry["waiting"] = None
+
+        inputs = {"subject": subject, "previousChat": get_memory().buffer}
+        stamp = _stamp(inputs)
+        generating = entry["generating"]
+        if entry["stamp"] == stamp or (generating is not None and generating[0] == stamp):
+            return
+
+        # Speculative work; interactive requests get rate-limit capacity first
+        with rateLimiter.background():
+            task = asyncio.ensure_future(chainExecutor.run_chain(self.chain, inputs))
+        entry["generating"] = (stamp, task)
+        try:
+            quiz = await task
+        except Exception:
+            logger.warning("Quiz prefetch failed for %s mode", self.name, exc_info=True)
+            return
+        finally:
+            if entry["generating"] is not None and entry["generating"][1] is task:
+                entry["generating"] = None
+
+        self.generated += 1
+        self._discard(entry)
+        entry.update(quiz=quiz, stamp=stamp)
+
+
+
+#####################################################################
+# Returns stats for every QuizPrefetcher in this process.
+#####################################################################
+def quiz_prefetch_stats() -> dict:
+    return {"enabled": QUIZ_PREFETCH_ENABLED, "modes": [p.stats() for p in _prefetchers]}
+
+
+
+# Exported names from this module
+__all__ = [
+    "QuizPrefetcher",
+    "quiz_prefetch_stats",
+]
@@ -0,0 +1,342 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    rateLimiter.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# rateLimiter.py – Token-bucket admission control in front of every upstream OpenAI call.
+#
+# OpenAI limits each account by requests per minute (RPM) and tokens per minute (TPM). Going
+# over returns HTTP 429s, which users used to see as raw errors. Each TokenBucketLimiter keeps
+# one bucket per limit, refilled continuously, and every chat or embedding request takes from
+# both before it is sent:
+# - Callers wait in a bounded queue until the buckets can cover their request
+# - A caller that would wait longer than the max wait is turned away with RateLimited (429)
+# - When the queue is full, new callers are shed with Overloaded (503)
+# - Both errors carry a retry_after (seconds) for the Retry-After header
+# - Interactive turns go first; background work (PDF indexing, memory summaries, intro
+#   refills) only takes capacity no interactive caller is waiting for, and may wait longer
+# - An upstream 429 pauses the limiter for the Retry-After the API asked for
+#
+# Chat models get the limiter through a LangChain callback (see llmProvider.py), so every
+# chain is covered without touching the chains themselves. Token use is estimated with
+# tiktoken (prompt tokens plus an allowance for the completion).
+#
+# Configuration (environment variables, 0 disables a limit):
+# - LLM_RATE_LIMIT_RPM             -> Chat requests per minute per worker (default 500)
+# - LLM_RATE_LIMIT_TPM             -> Chat tokens per minute per worker (default 200000)
+# - LLM_RATE_OUTPUT_TOKENS         -> Completion tokens assumed per chat request (default 500)
+# - EMBED_RATE_LIMIT_RPM           -> Embedding requests per minute per worker (default 3000)
+# - EMBED_RATE_LIMIT_TPM           -> Embedding tokens per minute per worker (default 1000000)
+# - RATE_LIMIT_QUEUE_SIZE          -> Max interactive callers waiting per limiter (default 64)
+# - RATE_LIMIT_BULK_QUEUE_SIZE     -> Max background callers waiting per limiter (default 64)
+# - RATE_LIMIT_MAX_WAIT_SECONDS    -> Max wait for an interactive caller (default 10)
+# - RATE_LIMIT_BULK_WAIT_SECONDS   -> Max wait for a background caller (default 300)
+#
+# Exports:
+# - RateLimited           -> Raised when a caller would wait too long (HTTP 429)
+# - Overloaded            -> Raised when the wait queue is full (HTTP 503)
+# - TokenBucketLimiter    -> RPM + TPM token bucket with a bounded priority queue
+# - RateLimitCallback     -> LangChain callback applying a limiter to chat model calls
+# - background            -> Context manager marking calls inside it as background work
+# - is_background         -> Whether calls in the current context are background work
+# - retry_after_for       -> Retry-After seconds for a limiter or upstream rate-limit error
+# - chat_limiter / embedding_limiter -> The process-wide limiters
+################################################################################################
+
+
+
+import os
+import math
+import time
+import threading
+import contextlib
+import contextvars
+from langchain_core.callbacks import BaseCallbackHandler
+
+import requestTracing
+from tokenCounter import count_tokens, count_message_tokens
+
+
+LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "500"))
+LLM_RATE_LIMIT_TPM = int(os.getenv("LLM_RATE_LIMIT_TPM", "200000"))
+LLM_RATE_OUTPUT_TOKENS = int(os.getenv("LLM_RATE_OUTPUT_TOKENS", "500"))
+EMBED_RATE_LIMIT_RPM = int(os.getenv("EMBED_RATE_LIMIT_RPM", "3000"))
+EMBED_RATE_LIMIT_TPM = int(os.getenv("EMBED_RATE_LIMIT_TPM", "1000000"))
+RATE_LIMIT_QUEUE_SIZE = int(os.getenv("RATE_LIMIT_QUEUE_SIZE", "64"))
+RATE_LIMIT_BULK_QUEUE_SIZE = int(os.getenv("RATE_LIMIT_BULK_QUEUE_SIZE", "64"))
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "10"))
+RATE_LIMIT_BULK_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_BULK_WAIT_SECONDS", "300"))
+
+# Retry-After used for upstream 429s that don't say how long to wait
+DEFAULT_RETRY_AFTER_SECONDS = 5
+
+# Priority of the calls made in the current context
+INTERACTIVE = "interactive"
+BULK = "bulk"
+_priority = contextvars.ContextVar("rate_limit_priority", default=INTERACTIVE)
+
+
+
+#####################################################################
+# Raised when a caller would have to wait longer than allowed.
+#####################################################################
+class RateLimited(Exception):
+
+    status_code = 429
+    message = "The tutor is busy right now ({limiter} rate limit). Please try again in {seconds} seconds."
+
+    def __init__(self, limiter: str, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(self.message.format(limiter=limiter, seconds=self.retry_after))
+
+
+
+#####################################################################
+# Raised when too many callers are already waiting.
+#####################################################################
+class Overloaded(RateLimited):
+
+    status_code = 503
+    message = "The tutor is overloaded right now ({limiter} queue full). Please try again in {seconds} seconds."
+
+
+
+#####################################################################
+# Requests-per-minute plus tokens-per-minute token bucket with a
+# bounded, two-level priority wait queue (each level has its own cap).
+# Thread-safe; callers block in acquire() on whichever worker thread
+# makes the request.
+#
+# Args:
+#   name (str): Limiter name used in errors and metrics.
+#   requests_per_minute (int): RPM budget, or 0 for no limit.
+#   tokens_per_minute (int): TPM budget, or 0 for no limit.
+#####################################################################
+class TokenBucketLimiter:
+
+    def __init__(self, name: str, requests_per_minute: int, tokens_per_minute: int,
+                 max_queue: int = None, max_wait: float = None, bulk_max_wait: float = None,
+                 bulk_max_queue: int = None):
+        self.name = name
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.max_queue = max_queue or RATE_LIMIT_QUEUE_SIZE
+        self.bulk_max_queue = bulk_max_queue or RATE_LIMIT_BULK_QUEUE_SIZE
+        self.max_wait = max_wait or RATE_LIMIT_MAX_WAIT_SECONDS
+        self.bulk_max_wait = bulk_max_wait or RATE_LIMIT_BULK_WAIT_SECONDS
+
+        # Buckets start full so a fresh worker can serve a burst right away
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+        self._cond = threading.Condition()
+        self._waiting = {INTERACTIVE: 0, BULK: 0}
+
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+
+
+    #####################################################################
+    # Blocks until the buckets can cover one request of `tokens`
+    # tokens, then takes them. Raises Overloaded if the queue is full
+    # or RateLimited if the wait would exceed the caller's max wait.
+    #####################################################################
+    def acquire(self, tokens: int = 0, priority: str = None):
+        priority = priority or _priority.get()
+        max_wait = self.bulk_max_wait if priority == BULK else self.max_wait
+        # A request larger than the whole bucket could never be admitted
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+
+        with self._cond:
+            self._refill()
+            max_queue = self.bulk_max_queue if priority == BULK else self.max_queue
+            if self._waiting[priority] >= max_queue:
+                self.shed += 1
+                # Roughly when the callers already queued will have been served
+                queue_wait = max_queue * 60 / self.rpm if self.rpm else 1
+                raise Overloaded(self.name, max(self._wait_for(tokens), queue_wait))
+
+            wait = self._wait_for(tokens)
+            if wait > max_wait:
+                self.rejected += 1
+                raise RateLimited(self.name, wait)
+
+            deadline = time.monotonic() + max_wait
+            queued = time.perf_counter()
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    wait = self._wait_for(tokens)
+                    # Background callers also yield to every waiting interactive caller
+                    if wait <= 0 and (priority == INTERACTIVE or not self._waiting[INTERACTIVE]):
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise RateLimited(self.name, max(wait, 1))
+                    self._cond.wait(min(remaining, max(wait, 0.05)))
+
+                # Only actual waits show up in a traced request
+                trace = requestTracing.current_trace()
+                admitted_at = time.perf_counter()
+                if trace is not None and admitted_at - queued > 0.001:
+                    trace.add(f"rate_limit_wait.{self.name}", queued, admitted_at, priority=priority)
+
+                if self.rpm:
+                    self._requests -= 1
+                if self.tpm:
+                    self._tokens -= tokens
+                self.admitted += 1
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+
+    #####################################################################
+    # Stops admitting requests for `seconds`, after an upstream 429.
+    #####################################################################
+    def pause(self, seconds: float):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+    #####################################################################
+    # Returns a snapshot of this limiter's buckets and counters.
+    #####################################################################
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill()
+            return {
+                "name": self.name,
+                "requests_available": round(self._requests, 1) if self.rpm else None,
+                "tokens_available": round(self._tokens) if self.tpm else None,
+                "waiting": dict(self._waiting),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "shed": self.shed,
+            }
+
+
+    # ------------------ internal helpers ------------------
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    # Seconds until both buckets can cover the request (0 if they already can)
+    def _wait_for(self, tokens: int) -> float:
+        wait = max(0.0, self._paused_until - time.monotonic())
+        if self.rpm and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+        return wait
+
+
+
+#####################################################################
+# LangChain callback that admits every chat model call through a
+# limiter before it is sent, and pauses the limiter when the API
+# answers with a 429. raise_error makes LangChain propagate the
+# limiter's exceptions instead of logging them.
+#####################################################################
+class RateLimitCallback(BaseCallbackHandler):
+
+    raise_error = True
+
+    def __init__(self, limiter: TokenBucketLimiter, output_tokens: int = None):
+        self.limiter = limiter
+        self.output_tokens = output_tokens or LLM_RATE_OUTPUT_TOKENS
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        prompt_tokens = sum(count_message_tokens(batch) for batch in messages)
+        self.limiter.acquire(prompt_tokens + self.output_tokens)
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        prompt_tokens = sum(count_tokens(prompt) for prompt in prompts)
+        self.limiter.acquire(prompt_tokens + self.output_tokens)
+
+    def on_llm_error(self, error, **kwargs):
+        retry_after = retry_after_for(error)
+        if retry_after is not None:
+            self.limiter.pause(retry_after)
+
+
+
+#####################################################################
+# Marks every call made inside the block (including chains run on the
+# worker pool from it) as background work.
+#####################################################################
+@contextlib.contextmanager
+def background():
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+
+#####################################################################
+# Returns True inside background(), so callers can keep background
+# work off the pools interactive requests use.
+#####################################################################
+def is_background() -> bool:
+    return _priority.get() == BULK
+
+
+
+#####################################################################
+# Returns the Retry-After seconds for a limiter error or an upstream
+# OpenAI 429, or None for any other exception.
+#####################################################################
+def retry_after_for(error: Exception):
+    if isinstance(error, RateLimited):
+        return error.retry_after
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return None
+    try:
+        return max(1, math.ceil(float(response.headers.get("retry-after"))))
+    except (AttributeError, TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER_SECONDS
+
+
+
+# Process-wide limiters for chat completions and embeddings
+chat_limiter = TokenBucketLimiter("chat", LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_TPM)
+embedding_limiter = TokenBucketLimiter("embeddings", EMBED_RATE_LIMIT_RPM, EMBED_RATE_LIMIT_TPM)
+
+
+
+# Exported names from this module
+__all__ = [
+    "RateLimited",
+    "Overloaded",
+    "TokenBucketLimiter",
+    "RateLimitCallback",
+    "background",
+    "is_background",
+    "retry_after_for",
+    "chat_limiter",
+    "embedding_limiter",
+]
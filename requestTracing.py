@@ -0,0 +1,357 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    requestTracing.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# requestTracing.py – Opt-in, per-request breakdown of where a request's time went.
+#
+# A traced request records a span for every stage it goes through:
+# - Each chain, LLM call and retriever run (through a LangChain callback, so every learning
+#   mode is covered without touching its code)
+# - Units of work timed with metrics.track (memory summarization, embedding requests)
+# - Waiting for a worker thread, and waiting for the event loop to resume the request once
+#   its blocking call finished (a busy or blocked loop shows up here)
+# - Waiting on the upstream rate limiter
+# - Loading and saving session state in a shared session backend
+#
+# The response gets a Server-Timing header (total time per span name, visible in the browser's
+# network panel) and an X-Trace-Id header, and the full span list is appended to a local
+# JSON-lines file. Streaming responses send their headers before the stream runs, so their
+# Server-Timing only covers setup; the JSON-lines record covers the whole stream.
+#
+# Clients can only turn tracing on for a request when the operator has set TRACE_TOKEN, by
+# sending it as "X-Trace: <token>". Traces are written by a background thread through a
+# bounded queue (traces are dropped while it is full), and the file is rotated to
+# TRACE_FILE.1 once it reaches TRACE_FILE_MAX_MB, so tracing never blocks the event loop on
+# disk or fills it up.
+#
+# Untraced requests pay one context variable lookup per span site.
+#
+# Configuration (environment variables):
+# - TRACING_ENABLED    -> "true" to trace every request (default "false")
+# - TRACE_TOKEN        -> Secret that enables tracing for requests sent with "X-Trace: <token>"
+#                         (default empty: the X-Trace header is ignored)
+# - TRACE_FILE         -> JSON-lines file traces are appended to (default: ai_tutor_traces.jsonl
+#                         in the temp directory; empty to disable the file)
+# - TRACE_FILE_MAX_MB  -> Size at which TRACE_FILE is rotated, keeping one old file (default 50)
+#
+# Exports:
+# - Trace              -> Spans recorded for one request
+# - TraceCallback      -> LangChain callback recording chain/LLM/retriever spans into a trace
+# - TracingMiddleware  -> ASGI middleware that starts, reports and saves traces
+# - current_trace      -> The trace of the request being handled, or None
+# - span               -> Context manager recording a span in the current trace
+################################################################################################
+
+
+
+import os
+import hmac
+import json
+import time
+import uuid
+import queue
+import logging
+import tempfile
+import threading
+import contextlib
+import contextvars
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACE_TOKEN = os.getenv("TRACE_TOKEN", "")
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(tempfile.gettempdir(), "ai_tutor_traces.jsonl"))
+TRACE_FILE_MAX_BYTES = int(float(os.getenv("TRACE_FILE_MAX_MB", "50")) * 1024 * 1024)
+
+# Finished traces waiting to be written (dropped when full)
+TRACE_QUEUE_SIZE = 1000
+
+# Request header that turns tracing on for one request
+TRACE_HEADER = b"x-trace"
+
+logger = logging.getLogger(__name__)
+
+# Trace of the request being handled in this context, if it is traced
+_trace = contextvars.ContextVar("request_trace", default=None)
+
+# LangChain callback for the current trace (picked up by every chain run in the context)
+_callback_var = contextvars.ContextVar("trace_callback", default=None)
+register_configure_hook(_callback_var, inheritable=True)
+
+# Finished traces handed to the writer thread, which is started on first use
+_pending = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+
+#####################################################################
+# Spans recorded for one request. Spans are added from the event loop
+# and from worker threads, so adding is locked.
+#####################################################################
+class Trace:
+
+    def __init__(self, method: str, path: str):
+        self.trace_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.status = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+
+    #####################################################################
+    # Records a span between two time.perf_counter() readings. Spans
+    # from work that outlives the request (e.g. background refills
+    # started by it) are dropped once the trace is finished.
+    #####################################################################
+    def add(self, name: str, start: float, end: float, **attributes):
+        span = {
+            "name": name,
+            "start_ms": round((start - self.start) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+        }
+        span.update(attributes)
+        with self._lock:
+            if self.end is None:
+                self.spans.append(span)
+
+
+    def finish(self, status: int):
+        with self._lock:
+            self.end = time.perf_counter()
+            self.status = status
+
+
+    #####################################################################
+    # Returns the Server-Timing header value: the total duration per
+    # span name (in order of first appearance), then the request total.
+    #####################################################################
+    def server_timing(self) -> str:
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                duration, count = totals.get(span["name"], (0.0, 0))
+                totals[span["name"]] = (duration + span["duration_ms"], count + 1)
+        entries = [
+            f'{name};dur={duration:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+            for name, (duration, count) in totals.items()
+        ]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "method": self.method,
+                "path": self.path,
+                "status": self.status,
+                "started_at": self.started_at,
+                "duration_ms": round(((self.end or time.perf_counter()) - self.start) * 1000, 2),
+                "spans": list(self.spans),
+            }
+
+
+
+#####################################################################
+# Returns the trace of the request being handled, or None.
+#####################################################################
+def current_trace():
+    return _trace.get()
+
+
+
+#####################################################################
+# Records the block as a span in the current trace (no-op when the
+# request is not traced).
+#####################################################################
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), **attributes)
+
+
+
+#####################################################################
+# LangChain callback recording every chain, LLM and retriever run of
+# one traced request as a span. LLM spans are named after the chain
+# that made the call (e.g. "llm.intro_chain").
+#####################################################################
+class TraceCallback(BaseCallbackHandler):
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        # run id -> (span name, start time, parent span name)
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("id", ["chain"])[-1]
+        self._start(run_id, name, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id, "chain")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "chain", error=type(error).__name__)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "retriever", parent_run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._finish(run_id, "retriever", documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "retriever", error=type(error).__name__)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, None, parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, None, parent_run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        tokens = {key: usage[key] for key in ("prompt_tokens", "completion_tokens") if key in usage}
+        self._finish(run_id, "llm", **tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "llm", error=type(error).__name__)
+
+    # ------------------ internal helpers ------------------
+
+    def _start(self, run_id, name, parent_run_id):
+        with self._lock:
+            parent = self._runs.get(parent_run_id)
+            parent_name = parent[0] if parent else None
+            if name is None:
+                name = f"llm.{parent_name}" if parent_name else "llm"
+            self._runs[run_id] = (name, time.perf_counter(), parent_name)
+
+    def _finish(self, run_id, kind: str, **attributes):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        name, start, parent_name = run
+        if parent_name:
+            attributes["parent"] = parent_name
+        self.trace.add(name, start, time.perf_counter(), kind=kind, **attributes)
+
+
+
+#####################################################################
+# Queues a finished trace for the writer thread. Never blocks; the
+# trace is dropped if the writer has fallen behind.
+#####################################################################
+def _write_trace(trace: Trace):
+    global _writer
+    if not TRACE_FILE:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_pending, name="trace-writer", daemon=True)
+            _writer.start()
+    try:
+        _pending.put_nowait(trace)
+    except queue.Full:
+        logger.warning("Trace queue is full; dropping trace %s", trace.trace_id)
+
+
+
+#####################################################################
+# Writer thread: appends each queued trace to TRACE_FILE as one JSON
+# line, rotating the file to TRACE_FILE.1 once it is over its cap.
+#####################################################################
+def _write_pending():
+    while True:
+        trace = _pending.get()
+        try:
+            if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) >= TRACE_FILE_MAX_BYTES:
+                os.replace(TRACE_FILE, TRACE_FILE + ".1")
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace.to_dict()) + "\n")
+        except OSError:
+            logger.exception("Failed to write trace %s", trace.trace_id)
+
+
+
+#####################################################################
+# ASGI middleware that traces requests sent with "X-Trace: <token>"
+# (or all requests when TRACING_ENABLED), adds Server-Timing and
+# X-Trace-Id headers to their responses and saves each trace to
+# TRACE_FILE.
+#####################################################################
+class TracingMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (TRACING_ENABLED or self._requested(scope)):
+            return await self.app(scope, receive, send)
+
+        trace = Trace(scope["method"], scope["path"])
+        trace_token = _trace.set(trace)
+        callback_token = _callback_var.set(TraceCallback(trace))
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", trace.server_timing().encode("latin-1")),
+                    (b"x-trace-id", trace.trace_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _callback_var.reset(callback_token)
+            _trace.reset(trace_token)
+            trace.finish(status[0])
+            _write_trace(trace)
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        if not TRACE_TOKEN:
+            return False
+        for name, value in scope.get("headers", []):
+            if name == TRACE_HEADER:
+                return hmac.compare_digest(value.strip(), TRACE_TOKEN.encode("latin-1"))
+        return False
+
+
+
+# Exported names from this module
+__all__ = [
+    "Trace",
+    "TraceCallback",
+    "TRACE_TOKEN",
+    "TracingMiddleware",
+    "current_trace",
+    "span",
+]
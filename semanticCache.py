@@ -0,0 +1,151 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    semanticCache.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# semanticCache.py – Answer cache keyed by document and question meaning.
+#
+# Students working from the same PDF tend to ask the same few questions in slightly different
+# words. A SemanticCache stores (question embedding, answer) pairs per document hash and
+# answers a new question from the cache when its embedding is close enough (cosine
+# similarity at or above a threshold) to one already answered for that document.
+#
+# Documents are kept in a SessionStore (LRU + idle TTL), and each document keeps at most
+# max_questions answers, dropping the oldest first. Entries live in process memory only.
+#
+# Exports:
+# - SemanticCache         -> Per-document nearest-question answer cache
+# - semantic_cache_stats  -> Hit/miss counters for every cache in this process
+################################################################################################
+
+
+
+import threading
+import numpy as np
+
+from sessionStore import SessionStore
+
+
+# Every cache created in this process, for metrics reporting
+_caches = []
+
+
+
+#####################################################################
+# Normalizes an embedding to a float32 unit vector, so a dot product
+# is the cosine similarity.
+#####################################################################
+def _unit(vector) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+
+#####################################################################
+# Estimated size of one document's entry: its vectors plus answers.
+#####################################################################
+def _entry_size(entry: dict) -> int:
+    return entry["vectors"].nbytes + sum(len(answer) for answer in entry["answers"])
+
+
+
+#####################################################################
+# Nearest-question answer cache, partitioned by document hash.
+#
+# Args:
+#   name (str): Cache name used in metrics.
+#   threshold (float): Min cosine similarity that counts as a hit.
+#   max_questions (int): Max answers kept per document.
+#   max_documents (int): Max documents kept before LRU eviction.
+#####################################################################
+class SemanticCache:
+
+    def __init__(self, name: str, threshold: float, max_questions: int, max_documents: int = None):
+        self.name = name
+        self.threshold = threshold
+        self.max_questions = max_questions
+
+        # doc hash -> {"vectors": float32 matrix (unit rows), "questions": [...], "answers": [...]}
+        self.documents = SessionStore(f"{name}_documents", max_entries=max_documents, sizeof=_entry_size)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        _caches.append(self)
+
+
+    #####################################################################
+    # Returns the cached answer for the most similar question asked
+    # about doc_hash, or None if none is similar enough.
+    #####################################################################
+    def lookup(self, doc_hash: str, vector):
+        query = _unit(vector)
+        with self._lock:
+            entry = self.documents.get(doc_hash)
+            if entry is not None and len(entry["answers"]):
+                scores = entry["vectors"] @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return entry["answers"][best]
+            self.misses += 1
+            return None
+
+
+    #####################################################################
+    # Stores the answer to a question about doc_hash.
+    #####################################################################
+    def add(self, doc_hash: str, vector, question: str, answer: str):
+        row = _unit(vector)[np.newaxis, :]
+        with self._lock:
+            entry = self.documents.get(doc_hash) or {
+                "vectors": np.empty((0, row.shape[1]), dtype=np.float32), "questions": [], "answers": []
+            }
+            # Keep only the newest max_questions answers
+            entry["vectors"] = np.vstack([entry["vectors"], row])[-self.max_questions:]
+            entry["questions"] = (entry["questions"] + [question])[-self.max_questions:]
+            entry["answers"] = (entry["answers"] + [answer])[-self.max_questions:]
+            self.documents.set(doc_hash, entry)
+
+
+    #####################################################################
+    # Returns a snapshot of this cache's counters and size.
+    #####################################################################
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "threshold": self.threshold,
+                "documents": len(self.documents),
+                "questions": sum(len(entry["answers"]) for _, entry in self.documents.items()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+
+#####################################################################
+# Returns stats for every SemanticCache in this process.
+#####################################################################
+def semantic_cache_stats() -> list:
+    return [cache.stats() for cache in _caches]
+
+
+
+# Exported names from this module
+__all__ = [
+    "SemanticCache",
+    "semantic_cache_stats",
+]
@@ -0,0 +1,188 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    sessionBackend.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# sessionBackend.py – Shared storage backends for per-user session state.
+#
+# By default all session state lives in process memory, which means only one uvicorn worker
+# can serve the API: a second worker would not see the first worker's users. A shared backend
+# stores each session as JSON outside the process so any worker can serve any X-User-Id.
+#
+# Backends:
+# - sqlite   -> A local SQLite file (WAL mode); shared by all workers on one machine
+# - redis    -> A Redis server (requires the optional `redis` package); shared across machines
+#
+# Configuration (environment variables):
+# - SESSION_BACKEND       -> "memory" (default), "sqlite" or "redis"
+# - SESSION_BACKEND_URL   -> SQLite file path or Redis URL
+#
+# Exports:
+# - SQLiteBackend         -> Session backend stored in a SQLite file
+# - RedisBackend          -> Session backend stored in Redis
+# - get_backend           -> The configured shared backend, or None for in-memory mode
+# - is_shared             -> Whether session state is shared between workers
+################################################################################################
+
+
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_BACKEND_URL = os.getenv("SESSION_BACKEND_URL", "")
+
+# How often (in writes) the SQLite backend purges expired rows
+SQLITE_PURGE_EVERY = 500
+
+
+
+#####################################################################
+# Session backend stored in a single SQLite file. Each worker process
+# opens its own connection; WAL mode lets them read and write the
+# same file concurrently.
+#####################################################################
+class SQLiteBackend:
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(tempfile.gettempdir(), "ai_tutor_sessions.db")
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " expires REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+
+    # One connection per thread, since the API calls in from the worker pool
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str):
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE namespace = ? AND key = ? AND expires > ?",
+            (namespace, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, data: dict, ttl_seconds: float):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (namespace, key, data, expires) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(data), time.time() + ttl_seconds)
+        )
+        with self._writes_lock:
+            self._writes += 1
+            purge = self._writes % SQLITE_PURGE_EVERY == 0
+        if purge:
+            conn.execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+
+    def delete(self, namespace: str, key: str) -> bool:
+        cursor = self._connect().execute(
+            "DELETE FROM sessions WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+        return cursor.rowcount > 0
+
+    def count(self, namespace: str) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM sessions WHERE namespace = ? AND expires > ?",
+            (namespace, time.time())
+        ).fetchone()[0]
+
+
+
+#####################################################################
+# Session backend stored in Redis, with Redis handling expiry.
+#####################################################################
+class RedisBackend:
+
+    def __init__(self, url: str = None):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("SESSION_BACKEND=redis requires the 'redis' package.") from e
+        self.client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"ai_tutor:{namespace}:{key}"
+
+    def get(self, namespace: str, key: str):
+        raw = self.client.get(self._key(namespace, key))
+        return json.loads(raw) if raw else None
+
+    def set(self, namespace: str, key: str, data: dict, ttl_seconds: float):
+        self.client.set(self._key(namespace, key), json.dumps(data), ex=int(ttl_seconds))
+
+    def delete(self, namespace: str, key: str) -> bool:
+        return self.client.delete(self._key(namespace, key)) > 0
+
+    def count(self, namespace: str) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self._key(namespace, "*")))
+
+
+
+# The configured backend is created once per process
+_backend = None
+_backend_lock = threading.Lock()
+
+
+
+#####################################################################
+# Returns the shared backend selected by SESSION_BACKEND, or None when
+# running with plain in-process memory.
+#####################################################################
+def get_backend():
+    global _backend
+    if SESSION_BACKEND == "memory":
+        return None
+    with _backend_lock:
+        if _backend is None:
+            if SESSION_BACKEND == "sqlite":
+                _backend = SQLiteBackend(SESSION_BACKEND_URL or None)
+            elif SESSION_BACKEND == "redis":
+                _backend = RedisBackend(SESSION_BACKEND_URL or None)
+            else:
+                raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+        return _backend
+
+
+
+#####################################################################
+# Returns True when session state is shared between worker processes.
+#####################################################################
+def is_shared() -> bool:
+    return SESSION_BACKEND != "memory"
+
+
+
+# Exported names from this module
+__all__ = [
+    "SQLiteBackend",
+    "RedisBackend",
+    "get_backend",
+    "is_shared",
+]
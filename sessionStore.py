@@ -0,0 +1,305 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    sessionStore.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# sessionStore.py – Bounded, self-evicting storage for per-user session state.
+#
+# Every learning mode keeps per-user state (conversation memory, quiz text, PDF chains).
+# Plain dicts never forget a user, so the process slowly grows until it runs out of memory.
+# A SessionStore behaves like a small dict keyed by user id, but evicts entries that are:
+# - Idle for longer than the TTL
+# - Least recently used, once the entry count or estimated byte size cap is exceeded
+#
+# Stores created with a dump/load codec switch to the shared backend configured in
+# sessionBackend.py (if any), so that every uvicorn worker sees the same users. In that mode
+# values are serialized on every set() and rebuilt on every get(), and expiry is left to the
+# backend.
+#
+# Configuration (environment variables, used as defaults for every store):
+# - SESSION_MAX_ENTRIES   -> Max users kept per store (default 1000)
+# - SESSION_TTL_SECONDS   -> Idle time before a user's state is dropped (default 3600)
+# - SESSION_MAX_MB        -> Max estimated size per store in megabytes (default 256)
+# - SESSION_COUNT_CACHE_SECONDS -> How long stats() reuses a shared backend's entry count
+#                           (counting scans the backend; default 30)
+#
+# Exports:
+# - SessionStore          -> LRU + idle-TTL store with size tracking and metrics
+# - all_session_stats     -> Metrics for every store created in this process
+################################################################################################
+
+
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import sessionBackend
+import requestTracing
+
+
+# Defaults shared by every store unless overridden
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "1000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_BYTES = int(float(os.getenv("SESSION_MAX_MB", "256")) * 1024 * 1024)
+SESSION_COUNT_CACHE_SECONDS = float(os.getenv("SESSION_COUNT_CACHE_SECONDS", "30"))
+
+# Every store created in this process, for metrics reporting
+_stores = []
+
+
+
+#####################################################################
+# Dict-like store keyed by user id with LRU and idle-TTL eviction.
+#
+# Args:
+#   name (str): Store name used in metrics.
+#   max_entries (int): Max number of entries before LRU eviction.
+#   ttl_seconds (float): Idle time after which an entry expires.
+#   max_bytes (int): Max total estimated size before LRU eviction.
+#   sizeof (callable): Estimates an entry's size in bytes.
+#   resize_on_access (bool): Re-measure entries on every access,
+#       for values that keep growing (e.g. conversation memory).
+#   dump (callable): Converts a value to a JSON-compatible dict.
+#   load (callable): Rebuilds a value from the output of dump.
+#       With both given, the store uses the shared session backend
+#       when one is configured.
+#   on_evict (callable): Called with (key, value) for each entry
+#       dropped by LRU or idle TTL (not for delete() or replacement),
+#       while the store is locked, so it should be quick.
+#####################################################################
+class SessionStore:
+
+    def __init__(self, name: str, max_entries: int = None, ttl_seconds: float = None,
+                 max_bytes: int = None, sizeof=None, resize_on_access: bool = True,
+                 dump=None, load=None, on_evict=None):
+        self.name = name
+        self.max_entries = max_entries or SESSION_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or SESSION_TTL_SECONDS
+        self.max_bytes = max_bytes or SESSION_MAX_BYTES
+        self.sizeof = sizeof or (lambda value: 0)
+        self.resize_on_access = resize_on_access
+        self.dump = dump
+        self.load = load
+        self.on_evict = on_evict
+
+        # Shared backend, or None to keep values in this process
+        self.backend = sessionBackend.get_backend() if dump and load else None
+
+        # key -> [value, last_access, size], ordered oldest access first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        # (entry count, time measured) of the shared backend, for stats()
+        self._backend_count = (0, float("-inf"))
+
+        _stores.append(self)
+
+
+    #####################################################################
+    # Returns the value for key (refreshing its idle timer), or default.
+    #####################################################################
+    def get(self, key, default=None):
+        if self.backend is not None:
+            with requestTracing.span(f"session_load.{self.name}"):
+                data = self.backend.get(self.name, key)
+                with self._lock:
+                    if data is None:
+                        self.misses += 1
+                        return default
+                    self.hits += 1
+                return self.load(data)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._touch(key, entry)
+            return entry[0]
+
+
+    #####################################################################
+    # Returns the value for key held in this process, or default, without
+    # refreshing its idle timer or counting a hit/miss.
+    #####################################################################
+    def peek(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            return default if entry is None else entry[0]
+
+
+    #####################################################################
+    # Returns the value for key, creating it with factory() if missing.
+    #####################################################################
+    def get_or_create(self, key, factory):
+        with self._lock:
+            value = self.get(key)
+            if value is None:
+                value = factory()
+                self.set(key, value)
+            return value
+
+
+    #####################################################################
+    # Stores value under key, evicting old entries if over capacity.
+    #####################################################################
+    def set(self, key, value):
+        if self.backend is not None:
+            with requestTracing.span(f"session_save.{self.name}"):
+                self.backend.set(self.name, key, self.dump(value), self.ttl_seconds)
+            return
+        with self._lock:
+            self._remove(key)
+            size = self.sizeof(value)
+            self._entries[key] = [value, time.monotonic(), size]
+            self._bytes += size
+            self._expire()
+            self._evict()
+
+
+    #####################################################################
+    # Removes key if present. Returns True if something was removed.
+    #####################################################################
+    def delete(self, key) -> bool:
+        if self.backend is not None:
+            return self.backend.delete(self.name, key)
+        with self._lock:
+            return self._remove(key)
+
+
+    def __contains__(self, key) -> bool:
+        if self.backend is not None:
+            return self.backend.get(self.name, key) is not None
+        with self._lock:
+            self._expire()
+            return key in self._entries
+
+
+    def __len__(self) -> int:
+        if self.backend is not None:
+            return self.backend.count(self.name)
+        with self._lock:
+            return len(self._entries)
+
+
+    #####################################################################
+    # Returns a snapshot list of (key, value) pairs held in this process
+    # (expired entries excluded). Stores using a shared backend return
+    # an empty list, since their values live outside the process.
+    #####################################################################
+    def items(self) -> list:
+        if self.backend is not None:
+            return []
+        with self._lock:
+            self._expire()
+            return [(key, entry[0]) for key, entry in self._entries.items()]
+
+
+    #####################################################################
+    # Returns a snapshot of this store's size and eviction counters.
+    # A shared backend's entry count is refreshed at most every
+    # SESSION_COUNT_CACHE_SECONDS, since counting scans the backend.
+    #####################################################################
+    def stats(self) -> dict:
+        entries = self._entry_count()
+        with self._lock:
+            return {
+                "name": self.name,
+                "backend": type(self.backend).__name__ if self.backend else "memory",
+                "entries": entries,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+    # ------------------ internal helpers ------------------
+
+    def _entry_count(self) -> int:
+        if self.backend is None:
+            return len(self)
+        now = time.monotonic()
+        with self._lock:
+            count, measured = self._backend_count
+        if now - measured < SESSION_COUNT_CACHE_SECONDS:
+            return count
+        count = self.backend.count(self.name)
+        with self._lock:
+            self._backend_count = (count, now)
+        return count
+
+    def _touch(self, key, entry):
+        entry[1] = time.monotonic()
+        self._entries.move_to_end(key)
+        if self.resize_on_access:
+            size = self.sizeof(entry[0])
+            self._bytes += size - entry[2]
+            entry[2] = size
+            self._evict()
+
+    def _remove(self, key) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[2]
+        return True
+
+    # Entries are ordered by last access, so expired ones are always first
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[1] > cutoff:
+                break
+            self._remove(key)
+            self.expirations += 1
+            self._evicted(key, entry[0])
+
+    # Drop least recently used entries, but never the most recent one
+    def _evict(self):
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            key, entry = next(iter(self._entries.items()))
+            self._remove(key)
+            self.evictions += 1
+            self._evicted(key, entry[0])
+
+    def _evicted(self, key, value):
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+
+
+#####################################################################
+# Returns stats for every SessionStore in this process.
+#####################################################################
+def all_session_stats() -> list:
+    return [store.stats() for store in _stores]
+
+
+
+# Exported names from this module
+__all__ = [
+    "SessionStore",
+    "all_session_stats",
+]
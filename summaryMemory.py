@@ -0,0 +1,209 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    summaryMemory.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# summaryMemory.py – Token-budgeted conversation memory shared by the chat modes.
+#
+# LangChain's `ConversationSummaryMemory` re-summarizes the whole conversation with an extra
+# LLM call on every `save_context`, doubling the OpenAI calls per chat turn. The memory here
+# keeps recent turns verbatim and only folds the oldest turns into a running summary once the
+# raw window exceeds a tiktoken-measured budget. That summarization runs on the shared worker
+# pool after the turn has been saved, so the user's response is never held up by it.
+#
+# Configuration (environment variables):
+# - MEMORY_TOKEN_BUDGET   -> Max tokens of raw recent turns kept before summarizing (default 1200)
+#
+# Exports:
+# - IncrementalSummaryMemory -> Drop-in replacement for ConversationSummaryMemory
+# - memory_size              -> Estimated size of a memory, for session store limits
+# - memory_to_dict           -> Serialize a memory for a shared session backend
+# - memory_from_dict         -> Rebuild a memory from its serialized form
+# - bind_persistence         -> Write a memory's changes back to a shared session store
+################################################################################################
+
+
+
+import os
+import logging
+import threading
+from typing import Callable, Optional
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain_core.messages import messages_to_dict, messages_from_dict
+
+import chainExecutor
+import metrics
+import rateLimiter
+import sessionBackend
+from tokenCounter import count_message_tokens
+
+
+# Default number of raw-turn tokens kept before older turns are summarized
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1200"))
+
+logger = logging.getLogger(__name__)
+
+# Ids of memories with a summarization currently in flight
+_pruning = set()
+_pruning_lock = threading.Lock()
+
+
+
+#####################################################################
+# Conversation memory holding a rolling summary plus a raw window of
+# recent turns capped at max_token_limit tokens.
+#####################################################################
+class IncrementalSummaryMemory(ConversationSummaryBufferMemory):
+
+    max_token_limit: int = MEMORY_TOKEN_BUDGET
+
+    # Once over budget, summarize down to this fraction of it so that
+    # summarization calls are batched instead of running every turn
+    prune_to_ratio: float = 0.5
+
+    # Summarize on the worker pool instead of inside save_context. With a
+    # shared session backend this is done inline, so a late background
+    # result can never overwrite turns saved by another worker meanwhile.
+    summarize_in_background: bool = not sessionBackend.is_shared()
+
+    # Called with this memory after every change, so the owning session
+    # store can persist it (needed when sessions live in a shared backend)
+    on_save: Optional[Callable] = None
+
+
+    #####################################################################
+    # Appends the turn to the raw window, then summarizes the oldest
+    # turns if the window is over budget.
+    #####################################################################
+    def save_context(self, inputs, outputs) -> None:
+        super(ConversationSummaryBufferMemory, self).save_context(inputs, outputs)
+        self._persist()
+        if count_message_tokens(self.chat_memory.messages) <= self.max_token_limit:
+            return
+        if self.summarize_in_background:
+            chainExecutor.bulk_executor.submit(self._safe_prune)
+        else:
+            self.prune()
+
+
+    #####################################################################
+    # Folds the oldest turns into the running summary until the raw
+    # window is back under prune_to_ratio of the budget. Only one
+    # summarization runs per memory at a time, and the raw turns are
+    # only dropped once the new summary exists, so readers never see a
+    # turn missing from both.
+    #####################################################################
+    def prune(self) -> None:
+        with _pruning_lock:
+            if id(self) in _pruning:
+                return
+            _pruning.add(id(self))
+        try:
+            messages = list(self.chat_memory.messages)
+            remaining = count_message_tokens(messages)
+            target = int(self.max_token_limit * self.prune_to_ratio)
+            cut = 0
+            while remaining > target and cut < len(messages):
+                remaining -= count_message_tokens([messages[cut]])
+                cut += 1
+            if cut == 0:
+                return
+
+            with metrics.track("memory_summary"):
+                new_summary = self.predict_new_summary(messages[:cut], self.moving_summary_buffer)
+
+            # Skip if the memory was cleared or rewritten while summarizing
+            current = self.chat_memory.messages
+            if len(current) < cut or any(a is not b for a, b in zip(current[:cut], messages[:cut])):
+                return
+            self.moving_summary_buffer = new_summary
+            del current[:cut]
+            self._persist()
+        finally:
+            with _pruning_lock:
+                _pruning.discard(id(self))
+
+
+    #####################################################################
+    # Background entry point; a failed summarization keeps the raw turns
+    # and is simply retried after the next turn.
+    #####################################################################
+    def _safe_prune(self) -> None:
+        try:
+            with rateLimiter.background():
+                self.prune()
+        except Exception:
+            logger.exception("Background memory summarization failed")
+
+
+    def _persist(self) -> None:
+        if self.on_save is not None:
+            self.on_save(self)
+
+
+
+#####################################################################
+# Estimates a memory's size in bytes from its summary and raw turns.
+# Used by SessionStore to enforce its size cap.
+#####################################################################
+def memory_size(memory) -> int:
+    return len(memory.moving_summary_buffer) + sum(
+        len(m.content) for m in memory.chat_memory.messages
+    )
+
+
+
+#####################################################################
+# Serializes a memory's summary and raw turns to a JSON-safe dict.
+#####################################################################
+def memory_to_dict(memory) -> dict:
+    return {
+        "summary": memory.moving_summary_buffer,
+        "messages": messages_to_dict(memory.chat_memory.messages),
+    }
+
+
+
+#####################################################################
+# Rebuilds an IncrementalSummaryMemory from memory_to_dict output.
+# Extra keyword arguments (llm, memory_key, ...) are passed through.
+#####################################################################
+def memory_from_dict(data: dict, **kwargs):
+    memory = IncrementalSummaryMemory(**kwargs)
+    memory.moving_summary_buffer = data.get("summary", "")
+    memory.chat_memory.messages = messages_from_dict(data.get("messages", []))
+    return memory
+
+
+
+#####################################################################
+# Makes every change to memory write value (the memory itself, or the
+# object holding it) back to store under key, so other workers see it.
+# Only done for stores on a shared backend: in-memory stores already
+# hold this object, and writing it back from a background summary
+# would undo a delete or replacement that happened meanwhile.
+#####################################################################
+def bind_persistence(store, key, memory, value=None):
+    if store.backend is not None:
+        value = memory if value is None else value
+        memory.on_save = lambda m: store.set(key, value)
+
+
+
+# Exported names from this module
+__all__ = [
+    "MEMORY_TOKEN_BUDGET",
+    "IncrementalSummaryMemory",
+    "memory_size",
+    "memory_to_dict",
+    "memory_from_dict",
+    "bind_persistence",
+]
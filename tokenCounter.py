@@ -0,0 +1,105 @@
+'''
+*************************************************************
+* Name:    Elijah Campbell‑Ihim
+* Project: AI Tutor Python API
+* Class:   CMPS-450 Senior Project
+* Date:    May 2025
+* File:    tokenCounter.py
+*************************************************************
+'''
+
+
+
+################################################################################################
+# tokenCounter.py – Fast, local token counting with tiktoken.
+#
+# Used anywhere the API needs to reason about prompt size without calling the model,
+# such as deciding when conversation memory should be summarized.
+#
+# Exports:
+# - count_tokens            -> Number of tokens in a string
+# - count_message_tokens    -> Number of tokens in a list of LangChain messages
+# - truncate_tokens         -> Cut a string down to a number of tokens, from either end
+################################################################################################
+
+
+
+from functools import lru_cache
+import tiktoken
+
+
+# Model whose tokenizer is used for all counts
+token_model = "gpt-4o-mini"
+
+# Approximate per-message overhead added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Rough characters-per-token ratio used if no encoding can be loaded
+FALLBACK_CHARS_PER_TOKEN = 4
+
+
+
+#####################################################################
+# Loads the tiktoken encoding once. Falls back to the generic GPT-4o
+# encoding if this tiktoken version does not know the model name, and
+# to None if the encoding files cannot be fetched (e.g. offline).
+#####################################################################
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        try:
+            return tiktoken.encoding_for_model(token_model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+
+#####################################################################
+# Returns the number of tokens in the given text.
+#####################################################################
+def count_tokens(text) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(str(text)) // FALLBACK_CHARS_PER_TOKEN + 1
+    return len(encoding.encode(str(text), disallowed_special=()))
+
+
+
+#####################################################################
+# Returns the number of tokens in a list of chat messages, including
+# a small fixed overhead per message.
+#####################################################################
+def count_message_tokens(messages) -> int:
+    return sum(count_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+
+#####################################################################
+# Returns text cut down to at most max_tokens tokens, keeping its
+# start (keep="start") or its most recent end (keep="end").
+#####################################################################
+def truncate_tokens(text: str, max_tokens: int, keep: str = "start") -> str:
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        max_chars = max_tokens * FALLBACK_CHARS_PER_TOKEN
+        return text[-max_chars:] if keep == "end" else text[:max_chars]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    kept = tokens[-max_tokens:] if keep == "end" else tokens[:max_tokens]
+    return encoding.decode(kept)
+
+
+
+# Exported functions from this module
+__all__ = [
+    "count_tokens",
+    "count_message_tokens",
+    "truncate_tokens",
+]